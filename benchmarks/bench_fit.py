@@ -0,0 +1,228 @@
+import io
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import contextlib
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from ila_code import ila
+from ila_code import utils
+import synthetic
+
+# Fit benchmark on synthetic light curves with known extrema (synthetic.py).
+# For every method, window size and noise level it measures:
+#   approx:        fit time per window, evaluations (NFEV), failure rate
+#                  (an exception or C4 >= C5) and warning rate (a warning of
+#                  ila.approx or ila.method_result) of ila.approx; bias,
+#                  scatter and median |error| / sigma of the time of extremum
+#                  of the fits without warnings against the ground truth
+#   method_result: time per call
+#   generate_curve: time per call
+#   process_data:  the whole batch of ila_ap.py (data and range files of
+#                  the windows, tsv result without previews): time per window,
+#                  failure and warning rates, the TOM bias and scatter
+# The results are JSON lines (--output; one object per case and stage).
+# --compare BASELINE compares them with the results of another version:
+# the exit status is 1 if a time grows by more than --time-tolerance
+# times, a failure or warning rate by more than --rate-tolerance or the TOM
+# scatter by more than --time-tolerance times.
+
+# Metrics compared with the baseline: (name, kind)
+COMPARED = [
+    ('time_per_window', "time"),
+    ('time_per_call', "time"),
+    ('failure_rate', "rate"),
+    ('warning_rate', "rate"),
+    ('tom_scatter', "time"),
+    ]
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Fit benchmark on synthetic light curves")
+    parser.add_argument("--methods", type=str.upper, nargs="+", choices=ila.METHODS, default=list(ila.METHODS),
+                        help="Methods (shapes of the synthetic extrema and the fits)")
+    parser.add_argument("--windows", type=int, default=200, help="Number of windows of a case")
+    parser.add_argument("--points", type=int, nargs="+", default=[30, 100], help="Points per window")
+    parser.add_argument("--noise", type=float, nargs="+", default=[0.005, 0.02], help="Noise of the magnitudes")
+    parser.add_argument("--cadence-jitter", type=float, default=0.3, help="Jitter of the spacing (fraction)")
+    parser.add_argument("--solver", type=str.lower, choices=ila.SOLVERS, default="lm", help="Solver of ila.approx")
+    parser.add_argument("--maxfev", type=int, default=100000, help="Maximal number of function evaluations")
+    parser.add_argument("--stages", type=str, nargs="+", choices=("approx", "process_data"),
+                        default=["approx", "process_data"],
+                        help="approx: ila.approx, method_result and generate_curve per window; "
+                             "process_data: the whole batch")
+    parser.add_argument("--seed", type=int, default=1, help="Seed of the random numbers")
+    parser.add_argument("--output", type=str, default=None, help="Results (JSON lines). Default: stdout only")
+    parser.add_argument("--compare", type=str, default=None, help="Results of the baseline (JSON lines)")
+    parser.add_argument("--time-tolerance", type=float, default=1.5,
+                        help="Allowed ratio of the times (and the TOM scatter) to the baseline")
+    parser.add_argument("--rate-tolerance", type=float, default=0.02,
+                        help="Allowed increase of the failure and warning rates")
+    return parser.parse_args()
+
+###############################################################################
+
+def tom_stats(tom, sig, truth, window_length):
+    # Bias and scatter of the found TOM in units of the window length,
+    # and the median |error| / sigma (about 0.67 for correct sigmas)
+    ok = np.isfinite(tom)
+    if not np.any(ok):
+        return {'tom_bias': None, 'tom_scatter': None, 'tom_pull': None}
+    error = (tom[ok] - truth[ok]) / window_length
+    pull = np.abs(tom[ok] - truth[ok]) / sig[ok]
+    return {'tom_bias': float(np.mean(error)), 'tom_scatter': float(np.std(error)),
+            'tom_pull': float(np.median(pull[np.isfinite(pull)])) if np.any(np.isfinite(pull)) else None}
+
+def bench_approx(method, windows, solver, maxfev, window_length):
+    fit_times = []
+    nfev = []
+    failed = 0
+    warned = 0
+    results = []
+    # The first fit imports scipy
+    ila.approx(method, windows[0]['t'], windows[0]['m'], maxfev, solver)
+    for window in windows:
+        fit_info = {}
+        t0 = time.perf_counter()
+        try:
+            params_opt, params_cov, param_warning = ila.approx(method, window['t'], window['m'], maxfev, solver,
+                                                               fit_info=fit_info)
+        except Exception:
+            params_opt = None
+        fit_times.append(time.perf_counter() - t0)
+        nfev.append(fit_info.get('nfev', 0))
+        if params_opt is None or (method != "A" and params_opt[3] >= params_opt[4]):
+            failed += 1
+            results.append(None)
+        else:
+            results.append((params_opt, params_cov, param_warning))
+
+    tom = np.full(len(windows), np.nan)
+    sig = np.full(len(windows), np.nan)
+    t0 = time.perf_counter()
+    n_calls = 0
+    for i, (window, result) in enumerate(zip(windows, results)):
+        if result is None:
+            continue
+        r = ila.method_result(method, result[0], result[1], window['t'][0], window['t'][-1])
+        n_calls += 1
+        if result[2] is not None or r[6] is not None:
+            warned += 1
+            continue
+        tom[i], sig[i] = r[0], r[1]
+    result_time = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    for window, result in zip(windows, results):
+        if result is not None:
+            utils.generate_curve(method, result[0], window['t'])
+    curve_time = time.perf_counter() - t0
+
+    truth = np.array([window['tom'] for window in windows])
+    stats = {'time_per_window': float(np.mean(fit_times)), 'time_p95': float(np.percentile(fit_times, 95)),
+             'nfev_mean': float(np.mean(nfev)), 'nfev_max': int(np.max(nfev)),
+             'failure_rate': failed / len(windows), 'warning_rate': warned / len(windows)}
+    stats.update(tom_stats(tom, sig, truth, window_length))
+    return [
+        dict(stage="approx", **stats),
+        {'stage': "method_result", 'time_per_call': result_time / max(1, n_calls)},
+        {'stage': "generate_curve", 'time_per_call': curve_time / max(1, n_calls)},
+        ]
+
+def bench_process_data(method, windows, solver, maxfev, window_length, noise):
+    import ila_ap
+    import csv
+    with tempfile.TemporaryDirectory() as tmp:
+        data_file = os.path.join(tmp, "lc.dat")
+        range_file = os.path.join(tmp, "ranges.txt")
+        result_file = os.path.join(tmp, "result.tsv")
+        synthetic.write_light_curve(windows, data_file, range_file, noise)
+        t0 = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            ila_ap.process_data(data_file, method, True, False, range_file, result_file,
+                                os.path.join(tmp, "result.html"), solver=solver, use_cache=False,
+                                preview_mode="none", maxfev=maxfev)
+        elapsed = time.perf_counter() - t0
+        with open(result_file, newline="") as f:
+            rows = list(csv.DictReader(f, delimiter="\t"))
+    if len(rows) != len(windows):
+        raise Exception(f"process_data: {len(rows)} rows for {len(windows)} windows")
+    value = lambda row, k: np.float64(row[k]) if row[k] != "" else np.nan
+    tom = np.array([value(row, 'Time of Extremum (TOM)') if row['Status'] == "OK" else np.nan for row in rows])
+    sig = np.array([value(row, 'TOM Uncertainty') for row in rows])
+    truth = np.array([window['tom'] for window in windows])
+    stats = {'stage': "process_data", 'time_per_window': elapsed / len(windows),
+             'failure_rate': sum(row['Status'] == "FAILED" for row in rows) / len(rows),
+             'warning_rate': sum(row['Status'] == "WARNING" for row in rows) / len(rows)}
+    stats.update(tom_stats(tom, sig, truth, window_length))
+    return [stats]
+
+###############################################################################
+
+def case_key(result):
+    return (result['method'], result['points'], result['noise'], result['stage'])
+
+def compare(results, baseline_file, time_tolerance, rate_tolerance):
+    # Returns the regressions against the baseline results
+    with open(baseline_file) as f:
+        baseline = {case_key(r): r for r in (json.loads(line) for line in f if line.strip() != "")}
+    regressions = []
+    for result in results:
+        base = baseline.get(case_key(result))
+        if base is None:
+            continue
+        for name, kind in COMPARED:
+            new = result.get(name)
+            old = base.get(name)
+            if new is None or old is None:
+                continue
+            if kind == "rate":
+                bad = new > old + rate_tolerance
+            else:
+                bad = new > old * time_tolerance
+            if bad:
+                regressions.append(f"{' '.join(str(v) for v in case_key(result))}: {name} {old:.4g} -> {new:.4g}")
+    return regressions
+
+def main():
+    args = parse_args()
+    window_length = 0.2
+    common = {'version': 1, 'python': platform.python_version(), 'numpy': np.__version__,
+              'solver': args.solver, 'windows': args.windows, 'cadence_jitter': args.cadence_jitter}
+    results = []
+    print("method\tpoints\tnoise\tstage\ttime_ms\tnfev\tfailure_rate\twarning_rate\ttom_bias\ttom_scatter\ttom_pull")
+    for method in args.methods:
+        for n_points in args.points:
+            for noise in args.noise:
+                windows = synthetic.make_windows(method, args.windows, n_points, noise, window_length,
+                                                 args.cadence_jitter, seed=args.seed)
+                case = []
+                if "approx" in args.stages:
+                    case += bench_approx(method, windows, args.solver, args.maxfev, window_length)
+                if "process_data" in args.stages:
+                    case += bench_process_data(method, windows, args.solver, args.maxfev, window_length, noise)
+                for stats in case:
+                    result = dict(common, method=method, points=n_points, noise=noise, **stats)
+                    results.append(result)
+                    t = stats.get('time_per_window', stats.get('time_per_call'))
+                    fmt = lambda k, f: format(stats[k], f) if stats.get(k) is not None else "-"
+                    print(f"{method}\t{n_points}\t{noise}\t{stats['stage']}\t{t * 1000:.3f}\t{fmt('nfev_mean', '.0f')}\t"
+                          f"{fmt('failure_rate', '.3f')}\t{fmt('warning_rate', '.3f')}\t{fmt('tom_bias', '.2e')}\t{fmt('tom_scatter', '.2e')}\t"
+                          f"{fmt('tom_pull', '.2f')}")
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            f.write("".join(json.dumps(result) + "\n" for result in results))
+    if args.compare is not None:
+        regressions = compare(results, args.compare, args.time_tolerance, args.rate_tolerance)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}")
+        sys.exit(1 if regressions else 0)
+
+if __name__ == "__main__":
+    main()
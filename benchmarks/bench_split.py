@@ -0,0 +1,63 @@
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from ila_code import windows
+
+# Cycle splitting benchmark: one window_bounds call per cycle from the first
+# to the last cycle (the former split_lc.py loop) against
+# windows.phase_windows (only the cycles near the points, all at once).
+# The light curves have seasonal gaps: SEASON days of data per year.
+
+SEASON = 200.0
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Cycle splitting benchmark")
+    parser.add_argument("--points", type=int, nargs="+", default=[10**5, 10**6],
+                        help="Numbers of points of the light curve")
+    parser.add_argument("--cycles", type=int, nargs="+", default=[10**3, 10**4, 10**5],
+                        help="Numbers of cycles over the light curve")
+    parser.add_argument("--years", type=float, default=10.0,
+                        help="Length of the light curve, years")
+    return parser.parse_args()
+
+def make_data(n_points, years, rng):
+    n_seasons = int(np.ceil(years))
+    t_obs = np.concatenate([rng.uniform(y * 365.0, y * 365.0 + SEASON, n_points // n_seasons)
+                            for y in range(n_seasons)])
+    return np.sort(t_obs)
+
+def run_loop(t_obs, epoch, period, start_phase, stop_phase):
+    min_cycle = int(round((np.min(t_obs) - epoch) / period, 0))
+    max_cycle = int(round((np.max(t_obs) - epoch) / period, 0))
+    n = 0
+    for i in range(min_cycle, max_cycle + 1):
+        lo, hi = windows.window_bounds(t_obs, epoch + i * period + start_phase * period,
+                                       epoch + i * period + stop_phase * period)
+        if hi > lo:
+            n += 1
+    return n
+
+def main():
+    args = parse_args()
+    rng = np.random.default_rng(1)
+    print("points\tcycles\tloop_s\tvectorized_s\tspeedup")
+    for n_points in args.points:
+        t_obs = make_data(n_points, args.years, rng)
+        for n_cycles in args.cycles:
+            period = (t_obs[-1] - t_obs[0]) / n_cycles
+            t0 = time.perf_counter()
+            n1 = run_loop(t_obs, 0.0, period, -0.2, 0.2)
+            t_loop = time.perf_counter() - t0
+            t0 = time.perf_counter()
+            lo, hi = windows.phase_windows(t_obs, 0.0, period, -0.2, 0.2)
+            t_vec = time.perf_counter() - t0
+            if n1 != len(lo):
+                raise Exception(f"Different numbers of windows: {n1} != {len(lo)}")
+            print(f"{n_points}\t{n_cycles}\t{t_loop:.4f}\t{t_vec:.4f}\t{t_loop / t_vec:.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+import os
+import sys
+import argparse
+import subprocess
+
+# Startup benchmark: runs the command line scripts with python -X importtime
+# and reports the import time and the heavy modules loaded. The scripts
+# must not load the modules listed in a case (e.g. -h loads neither scipy,
+# pandas nor matplotlib); the exit status is 1 if one of them is loaded or
+# the import time exceeds --limit.
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+HEAVY_MODULES = ("scipy", "pandas", "matplotlib", "colorama")
+
+# (arguments, modules that must not be imported)
+CASES = [
+    (["ila_ap.py", "-h"], ("scipy", "pandas", "matplotlib", "colorama")),
+    (["split_lc.py", "-h"], ("scipy", "pandas", "matplotlib")),
+    (["ila_survey.py", "-h"], ("scipy", "pandas", "matplotlib", "colorama")),
+    (["lc_cache.py", "-h"], ("scipy", "pandas", "matplotlib")),
+    (["ila_ap.py", "test_data/V405_Dra.dat", "--no-plot", "--no-fit-cache", "--preview-mode", "none",
+      "--result", "{tmp}/result.txt", "--preview", "{tmp}/result.html"], ("pandas", "matplotlib")),
+    (["split_lc.py", "test_data/test_lc.tsv", "--epoch", "2460030.023", "--period", "0.40903915",
+      "--start-phase", "-0.2", "--stop-phase", "0.2", "--preview-mode", "none",
+      "--output", "{tmp}/ranges.txt", "--preview", "{tmp}/split.html"], ("scipy", "pandas", "matplotlib")),
+]
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Startup (import time) benchmark of the scripts")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="Runs of every case; the fastest is reported")
+    parser.add_argument("--limit", type=float, default=None,
+                        help="Maximal import time of a case, seconds")
+    parser.add_argument("--tmp", type=str, default=None,
+                        help="Directory of the output files of the cases. Default: a temporary directory")
+    return parser.parse_args()
+
+def import_times(stderr):
+    # Top-level modules of -X importtime: {name: cumulative seconds}
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3 or not fields[1].strip().isdigit():
+            continue
+        name = fields[2]
+        modules[name.strip()] = (len(name) - len(name.lstrip()), int(fields[1]) / 1e6)
+    return modules
+
+def run_case(args, tmp):
+    command = [sys.executable, "-X", "importtime"] + [a.replace("{tmp}", tmp) for a in args]
+    env = dict(os.environ, MPLBACKEND="Agg")
+    result = subprocess.run(command, cwd=ROOT, env=env, capture_output=True, text=True)
+    modules = import_times(result.stderr)
+    # The level of the top-level imports is the smallest indentation
+    level = min((indent for indent, seconds in modules.values()), default=0)
+    total = sum(seconds for indent, seconds in modules.values() if indent == level)
+    return total, modules
+
+def main():
+    args = parse_args()
+    if args.tmp is None:
+        import tempfile
+        tmp_dir = tempfile.TemporaryDirectory()
+        tmp = tmp_dir.name
+    else:
+        tmp = args.tmp
+    failed = False
+    print("case\timport_s\theavy_modules\tstatus")
+    for case_args, forbidden in CASES:
+        runs = [run_case(case_args, tmp) for i in range(args.repeat)]
+        total, modules = min(runs, key=lambda run: run[0])
+        heavy = [name for name in HEAVY_MODULES if name in modules]
+        status = "ok"
+        if any(name in modules for name in forbidden):
+            status = "FAILED: imports " + ",".join(name for name in forbidden if name in modules)
+        elif args.limit is not None and total > args.limit:
+            status = f"FAILED: over {args.limit} s"
+        failed = failed or status != "ok"
+        print(f"{' '.join(case_args[:2])}\t{total:.3f}\t{','.join(heavy) or '-'}\t{status}")
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
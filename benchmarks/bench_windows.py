@@ -0,0 +1,64 @@
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from ila_code import windows
+
+# Window slicing benchmark: a boolean mask over the whole light curve per range
+# (the former approach) against slice bounds found once with searchsorted.
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Window slicing benchmark")
+    parser.add_argument("--points", type=int, nargs="+", default=[10**4, 10**5, 10**6],
+                        help="Numbers of points of the light curve")
+    parser.add_argument("--windows", type=int, nargs="+", default=[10**2, 10**3, 10**4],
+                        help="Numbers of windows")
+    parser.add_argument("--mask-limit", type=int, default=10**10,
+                        help="Skip the mask approach when points x windows exceeds this value")
+    return parser.parse_args()
+
+def make_data(n_points, n_windows, rng):
+    t_obs = np.sort(rng.uniform(0.0, 1000.0, n_points))
+    t_start = np.sort(rng.uniform(0.0, 1000.0, n_windows))
+    t_stop = t_start + 1000.0 / n_windows / 2
+    return t_obs, t_obs * 0.0 + 10.0, t_start, t_stop
+
+def run_mask(t_obs, m_obs, t_start, t_stop):
+    n = 0
+    for i in range(len(t_start)):
+        mask = (t_obs >= t_start[i]) & (t_obs <= t_stop[i])
+        n += len(m_obs[mask])
+    return n
+
+def run_searchsorted(t_obs, m_obs, t_start, t_stop):
+    lo, hi = windows.range_bounds(t_obs, t_start, t_stop)
+    n = 0
+    for time_subset, mag_subset in windows.iter_windows(lo, hi, t_obs, m_obs):
+        n += len(mag_subset)
+    return n
+
+def main():
+    args = parse_args()
+    rng = np.random.default_rng(1)
+    print("points\twindows\tmask_s\tsearchsorted_s\tspeedup")
+    for n_points in args.points:
+        for n_windows in args.windows:
+            t_obs, m_obs, t_start, t_stop = make_data(n_points, n_windows, rng)
+            t0 = time.perf_counter()
+            n2 = run_searchsorted(t_obs, m_obs, t_start, t_stop)
+            t_search = time.perf_counter() - t0
+            if n_points * n_windows <= args.mask_limit:
+                t0 = time.perf_counter()
+                n1 = run_mask(t_obs, m_obs, t_start, t_stop)
+                t_mask = time.perf_counter() - t0
+                if n1 != n2:
+                    raise Exception(f"Different window sizes: {n1} != {n2}")
+                print(f"{n_points}\t{n_windows}\t{t_mask:.4f}\t{t_search:.4f}\t{t_mask / t_search:.1f}")
+            else:
+                print(f"{n_points}\t{n_windows}\t-\t{t_search:.4f}\t-")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+import os
+import sys
+import argparse
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+from ila_code import ila
+
+# Consistency check of the models: compares the vectorized functions
+# (ila.f_*_a) with the scalar reference implementations (ila.f_*) over random
+# parameters, at random points, at the points exactly at C4 and C5 and with
+# the guard (C5 <= C4: inf everywhere); the parameters are passed both as
+# scalars and as arrays broadcast against the points (one row per set).
+# The Jacobians (ila.jac_*_a) are compared with the central differences of
+# f_*_a at the random points and at points close to (within 0.1 % of the
+# parabolic part of) C4 and C5, where the pieces of the models join; with
+# the guard and exactly at C4 and C5 they must be finite.
+# The exit status is 1 on a mismatch.
+
+SCALAR = {"AP": ila.f_AP, "WSAP": ila.f_WSAP, "WSL": ila.f_WSL, "A": ila.f_A}
+JACOBIAN = {"AP": ila.jac_AP_a, "WSAP": ila.jac_WSAP_a, "WSL": ila.jac_WSL_a, "A": ila.jac_A_a}
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Check of the vectorized models and their Jacobians")
+    parser.add_argument("--methods", type=str.upper, nargs="+", choices=ila.METHODS, default=list(ila.METHODS),
+                        help="Methods")
+    parser.add_argument("--trials", type=int, default=200, help="Random parameter sets per method")
+    parser.add_argument("--points", type=int, default=50, help="Random points per parameter set")
+    parser.add_argument("--rtol", type=float, default=1e-12, help="Allowed relative difference")
+    parser.add_argument("--step", type=float, default=1e-7,
+                        help="Relative step of the central differences")
+    parser.add_argument("--jac-tol", type=float, default=1e-5,
+                        help="Allowed difference of the Jacobian (relative to the largest value of its column)")
+    parser.add_argument("--seed", type=int, default=1, help="Seed of the random numbers")
+    return parser.parse_args()
+
+###############################################################################
+
+def random_params(method, rng, guard=False):
+    # A parameter set with the window about [0, 1]; guard: C5 <= C4
+    C1 = rng.uniform(5.0, 15.0)
+    C2 = rng.uniform(-50.0, 50.0)
+    C3 = rng.uniform(-5.0, 5.0)
+    C4 = rng.uniform(0.2, 0.6)
+    if method == "A":
+        return [C1, abs(C2), abs(C3), C4]
+    if guard:
+        C5 = C4 - rng.choice([0.0, rng.uniform(0.0, 0.2)])
+    else:
+        C5 = C4 + rng.uniform(0.02, 0.3)
+    return [C1, C2, C3, C4, C5]
+
+def check_points(params, n, rng):
+    # Random points around the window and the points exactly at C4 and C5
+    t = rng.uniform(-0.5, 1.5, n)
+    return np.concatenate([t, params[3:5]])
+
+def compare(method, params, t, rtol):
+    # Returns the description of a mismatch or None
+    expected = np.array([SCALAR[method](x, *params) for x in t])
+    scale = max(1.0, np.max(np.abs(expected[np.isfinite(expected)]), initial=0.0))
+    results = [("scalar parameters", ila._model(method)(t, *params)),
+               ("array parameters", ila._model(method)(t[None, :], *[np.array([[p]]) for p in params])[0])]
+    for name, actual in results:
+        if actual.shape != t.shape:
+            return f"{name}: shape {actual.shape} instead of {t.shape}"
+        inf = np.isinf(expected)
+        if np.any(np.isinf(actual) != inf):
+            return f"{name}: inf at {float(t[np.isinf(actual) != inf][0])!r}"
+        error = np.abs(actual[~inf] - expected[~inf])
+        if np.any(~(error <= rtol * scale)):
+            k = np.argmax(np.where(np.isfinite(error), error, np.inf))
+            return f"{name}: {float(actual[~inf][k])!r} instead of {float(expected[~inf][k])!r} at {float(t[~inf][k])!r}"
+    return None
+
+def jacobian_points(params, t, step):
+    # The random points not closer to C4, C5 than the steps and the points
+    # close to C4 and C5 on both sides
+    breaks = np.array(params[3:5])
+    delta = 1e-3 * (breaks[-1] - breaks[0]) if len(breaks) == 2 else 1e-3
+    margin = 10 * step * max(1.0, np.max(np.abs(breaks)))
+    t = t[np.all(np.abs(t[:, None] - breaks[None, :]) > margin, axis=1)]
+    return np.concatenate([t, breaks - delta, breaks + delta])
+
+def compare_jacobian(method, params, t, step, tol):
+    # Returns the description of a mismatch or None
+    f = ila._model(method)
+    J = JACOBIAN[method](t, *params)
+    if J.shape != t.shape + (len(params),):
+        return f"jacobian: shape {J.shape} instead of {t.shape + (len(params),)}"
+    if not np.all(np.isfinite(J)):
+        return f"jacobian: not finite at {float(t[~np.all(np.isfinite(J), axis=1)][0])!r}"
+    if method != "A" and params[4] <= params[3]:
+        return None
+    t = jacobian_points(params, t, step)
+    J = JACOBIAN[method](t, *params)
+    for k in range(len(params)):
+        h = step * max(1.0, abs(params[k]))
+        plus = list(params)
+        minus = list(params)
+        plus[k] += h
+        minus[k] -= h
+        numeric = (f(t, *plus) - f(t, *minus)) / (2 * h)
+        error = np.abs(J[:, k] - numeric)
+        scale = max(1.0, np.max(np.abs(J[:, k])))
+        if np.any(~(error <= tol * scale)):
+            i = np.argmax(np.where(np.isfinite(error), error, np.inf))
+            return f"d/dC{k + 1}: {float(J[i, k])!r} instead of {float(numeric[i])!r} at {float(t[i])!r}"
+    return None
+
+def check_method(method, trials, points, rtol, step, jac_tol, rng):
+    failures = []
+    for trial in range(trials):
+        # Every fourth set of AP, WSAP and WSL is in the guard (C5 <= C4)
+        params = random_params(method, rng, guard=method != "A" and trial % 4 == 3)
+        t = check_points(params, points, rng)
+        for mismatch in (compare(method, params, t, rtol), compare_jacobian(method, params, t, step, jac_tol)):
+            if mismatch is not None:
+                failures.append(f"{method} {[float(p) for p in params]}: {mismatch}")
+    return failures
+
+def main():
+    args = parse_args()
+    rng = np.random.default_rng(args.seed)
+    failed = False
+    for method in args.methods:
+        failures = check_method(method, args.trials, args.points, args.rtol, args.step, args.jac_tol, rng)
+        print(f"{method}\tf_{method}_a, jac_{method}_a\t{args.trials} sets\t{'FAILED' if failures else 'OK'}")
+        for failure in failures[:10]:
+            print(f"  {failure}")
+        failed = failed or bool(failures)
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
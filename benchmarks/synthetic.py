@@ -0,0 +1,114 @@
+import os
+import sys
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from ila_code import ila
+
+# Synthetic light curves of the AP, WSAP, WSL and A shapes with a known
+# extremum (the ground truth of bench_fit.py).
+# Every window is window_length days long with the extremum placed at a
+# random position in its middle third; the points are evenly spaced with a
+# random jitter of the spacing (cadence_jitter, a fraction of the spacing)
+# and Gaussian noise of the magnitudes. The windows are gap_factor window
+# lengths apart, as the minima of a light curve split into ranges.
+# Run as a script, writes a light curve file and its range file.
+
+EPOCH = 2460000.0
+MAGNITUDE = 10.0
+# Depth of the extremum, magnitudes
+AMPLITUDE = 0.5
+
+###############################################################################
+
+def true_params(method, tom, length, rng):
+    # Parameters (absolute time) of a window of the given length whose
+    # extremum is at tom; brightness minima (magnitude maxima)
+    C1 = MAGNITUDE + AMPLITUDE
+    if method == "A":
+        C2 = 2 * AMPLITUDE / length * rng.uniform(0.8, 1.2)
+        C3 = 2 * AMPLITUDE / length * rng.uniform(0.8, 1.2)
+        return [C1, C2, C3, tom]
+    half = length * rng.uniform(0.1, 0.15)
+    if method == "AP":
+        C2 = -AMPLITUDE / half ** 2
+        # An asymmetry moving the extremum by up to a fifth of the parabolic part
+        C3 = 2 * C2 * half * rng.uniform(-0.2, 0.2)
+        # tom = (C4 + C5) / 2 - C3 / C2 / 2
+        center = tom + C3 / C2 / 2
+        return [C1, C2, C3, center - half, center + half]
+    if method == "WSAP":
+        C2 = -AMPLITUDE / half ** 2
+        C3 = -AMPLITUDE / length ** 1.5 * rng.uniform(0.5, 1.5)
+        return [C1, C2, C3, tom - half, tom + half]
+    if method == "WSL":
+        C2 = -AMPLITUDE / (length / 4) ** 1.5 * rng.uniform(0.8, 1.2)
+        C3 = 0.0
+        return [C1, C2, C3, tom - half, tom + half]
+    raise Exception(f"Unsupported method: {method}")
+
+def true_extremum(method, params):
+    if method == "A":
+        return params[3], params[0]
+    if method == "AP":
+        C1, C2, C3, C4, C5 = params
+        return (C4 + C5) / 2 - C3 / C2 / 2, C1 - C3 * C3 / (4 * C2)
+    return (params[3] + params[4]) / 2, params[0]
+
+def make_windows(method, n_windows, n_points, noise, window_length=0.2, cadence_jitter=0.3,
+                 gap_factor=2.0, seed=1):
+    # Returns a list of windows: dicts with t, m, the true parameters,
+    # the true time and magnitude of the extremum
+    rng = np.random.default_rng(seed)
+    result = []
+    step = window_length / (n_points - 1)
+    for i in range(n_windows):
+        start = EPOCH + i * gap_factor * window_length
+        t = start + np.arange(n_points) * step
+        t[1:-1] += rng.uniform(-cadence_jitter / 2, cadence_jitter / 2, n_points - 2) * step
+        tom = start + window_length * rng.uniform(1 / 3, 2 / 3)
+        params = true_params(method, tom, window_length, rng)
+        m = ila._model(method)(t, *params) + rng.normal(0.0, noise, n_points)
+        tom, mag = true_extremum(method, params)
+        result.append({'t': t, 'm': m, 'params': params, 'tom': tom, 'mag': mag})
+    return result
+
+def write_light_curve(windows, data_file_name, range_file_name=None, noise=None):
+    # Data file: time, magnitude[, error]; range file as written by split_lc.py
+    n = 0
+    with open(data_file_name, "w") as f:
+        for window in windows:
+            for t, m in zip(window['t'], window['m']):
+                f.write(f"{float(t)!r} {float(m)!r}" + (f" {float(noise)!r}\n" if noise is not None else "\n"))
+    if range_file_name is not None:
+        with open(range_file_name, "w") as f:
+            for window in windows:
+                t = window['t']
+                f.write(f"{n + 1} {float(t[0])!r} {n + len(t)} {float(t[-1])!r}\n")
+                n += len(t)
+
+###############################################################################
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Synthetic light curve with known extrema")
+    parser.add_argument("output", type=str, help="Light curve file")
+    parser.add_argument("--ranges", type=str, default=None, help="Range file")
+    parser.add_argument("--method", type=str.upper, choices=ila.METHODS, default="AP", help="Shape of the extrema")
+    parser.add_argument("--windows", type=int, default=100, help="Number of extrema")
+    parser.add_argument("--points", type=int, default=60, help="Points per window")
+    parser.add_argument("--noise", type=float, default=0.01, help="Noise of the magnitudes")
+    parser.add_argument("--window-length", type=float, default=0.2, help="Length of a window, days")
+    parser.add_argument("--cadence-jitter", type=float, default=0.3, help="Jitter of the spacing (fraction)")
+    parser.add_argument("--seed", type=int, default=1, help="Seed of the random numbers")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    windows = make_windows(args.method, args.windows, args.points, args.noise, args.window_length,
+                           args.cadence_jitter, seed=args.seed)
+    write_light_curve(windows, args.output, args.ranges, args.noise)
+    print(f"{args.output}: {args.windows} {args.method} extrema, {args.windows * args.points} points")
+
+if __name__ == "__main__":
+    main()
@@ -23,33 +23,42 @@ MAXFEV = 100000
 
 import os
 import sys
-from colorama import init as colorama_init
+import time
+import contextlib
 import numpy as np
-import pandas as pd
 from ila_code import utils
-from ila_code import ila
-
-colorama_init()
+from ila_code import batch
+from ila_code import lightcurve
+from ila_code import windows
+from ila_code import extrema
+from ila_code import preview
+from ila_code import preview_html
+from ila_code import result_sink
+from ila_code import fit_cache
+from ila_code import checkpoint
+from ila_code import profiler as profiler_module
+from ila_code import server
 
 ###############################################################################
 
-def process_data(data_file_name, method, inverseY, showPlot, range_file_name, result_file_name, preview_file_name):
-    
-    data = pd.read_csv(data_file_name, 
-                       comment='#', skip_blank_lines=True,
-                       sep="\\s+",
-                       names=['time', 'mag'], 
-                       dtype={'time': 'float64', 'mag': 'float64'}, 
-                       usecols=['time', 'mag'])
-    print(f"File loaded: {len(data['mag'])} points")
+def process_data(data_file_name, method, inverseY, showPlot, range_file_name, result_file_name, preview_file_name, jobs=1,
+                 solver="lm", warm_start=False, period=None, use_cache=True, preview_mode="full",
+                 preview_format="inline", page_size=preview_html.PAGE_SIZE, select="aic",
+                 result_format="auto", fit_cache_options=None, resume=False, maxfev=MAXFEV, escalate=False,
+                 time_budget=None, split=None, detect=None, resample=None, profiler=None):
+    # split: None or (epoch, period, start_phase, stop_phase): the ranges are
+    # made from the light curve as split_lc.py makes them (no range file)
+    # detect: None or (half_width, smooth, kind): the ranges are the windows
+    # around the extrema found by extrema.find_extrema
+    # resample: None or (mode, number of replicates, seed) of the resampling
+    # uncertainties of the extremum (see ila_code/resample.py)
+    # profiler: None or a profiler.Profiler receiving the stage times, the
+    # counters and the trace of every window (see ila_code/profiler.py)
     
-    t_obs = data['time']
-    m_obs = data['mag']
-
-    # Sort by times (essential in batch mode)
-    t_obs, m_obs = zip(*sorted(zip(t_obs, m_obs)))
-    t_obs = np.array(t_obs)
-    m_obs = np.array(m_obs)
+    profile_stage = profiler.stage if profiler is not None else contextlib.nullcontext
+    with profile_stage("load"):
+        t_obs, m_obs, err_obs = lightcurve.load_light_curve(data_file_name, use_cache)
+    print(f"File loaded: {len(m_obs)} points")
     
     if method == "0":
         # Plot and exit
@@ -62,214 +71,317 @@ def process_data(data_file_name, method, inverseY, showPlot, range_file_name, re
                           None)
         sys.exit()
     
+    # Several methods are fitted to the same windows; the best one is selected
+    methods = utils.method_list(method)
+    multi = len(methods) > 1
+
     if range_file_name == "":
         range_file_name = None
+    one_extremum = range_file_name is None and split is None and detect is None
     
-    if range_file_name is None:
+    ranges_time = time.perf_counter()
+    if detect is not None:
+        lo, hi, centers, kinds = extrema.find_extrema(t_obs, m_obs, *detect, inverseY=inverseY)
+        ranges = {'point1': lo + 1, 'time1': t_obs[lo], 'point2': hi, 'time2': t_obs[hi - 1]}
+        print(f"Extrema found: {len(lo)} ranges ({np.count_nonzero(kinds == 'min')} minima, "
+              f"{np.count_nonzero(kinds == 'max')} maxima)")
+    elif split is not None:
+        lo, hi = windows.phase_windows(t_obs, *split)
+        # The times written by split_lc.py
+        ranges = {'point1': lo + 1, 'time1': t_obs[lo], 'point2': hi, 'time2': t_obs[hi - 1]}
+        print(f"Light curve split: {len(lo)} ranges")
+    elif range_file_name is None:
         # One-extremum mode
         print('One-extremum mode')
-        ranges = pd.DataFrame(
-            np.array([[1, min(t_obs), len(t_obs), max(t_obs)]]),
-            columns=['point1', 'time1', 'point2', 'time2'],                          
-            )
-        ranges = ranges.astype({'point1': 'int32', 'time1': 'float64', 'point2': 'int32', 'time2': 'float64'})        
+        ranges = {'point1': np.array([1], dtype=np.int32), 'time1': np.array([min(t_obs)]),
+                  'point2': np.array([len(t_obs)], dtype=np.int32), 'time2': np.array([max(t_obs)])}
     else:
-        ranges = pd.read_csv(range_file_name, 
-                             comment='#', 
-                             skip_blank_lines=True,
-                             sep="\\s+",
-                             names=['point1', 'time1', 'point2', 'time2'],
-                             dtype={'point1': 'int32', 'time1': 'float64', 'point2': 'int32', 'time2': 'float64'},
-                             usecols=['point1', 'time1', 'point2', 'time2'])
-        print(f"Range file loaded: {len(ranges)} ranges")
-
-    info_keys = [
-        'Method',
-        'Points',
-        'Start Time',
-        'End Time',
-        'Sigma',
-        'Time of Extremum (TOM)',
-        'TOM Uncertainty',
-        'Magnitude',
-        'Magnitude Uncertainty',
-        'C4',
-        'C4 Uncertainty',
-        'C5',
-        'C5 Uncertainty',
-        'Eclipse Duration',
-        'Eclipse Duration Uncertainty'
-        ]
-
-    info = {
-        info_keys[0]: method,
-        info_keys[1]: None,
-        info_keys[2]: None,
-        info_keys[3]: None,
-        info_keys[4]: None,
-        info_keys[5]: None,
-        info_keys[6]: None,
-        info_keys[7]: None,
-        info_keys[8]: None,
-        info_keys[9]: None,
-        info_keys[10]: None,
-        info_keys[11]: None,
-        info_keys[12]: None,
-        info_keys[13]: None,
-        info_keys[14]: None
-        }
-
-    info_str = "\t".join(info_keys[:-2])
-    if method == "WSL":
-        info_str += "\t" + info_keys[-2]
-        info_str += "\t" + info_keys[-1]
-    with open(result_file_name, "w") as f:
-        f.write(info_str + "\n")
-        f.flush()
-        
-    with open(preview_file_name, "w") as f_preview:
-        f_preview.write("<html><body>\n")
-        f_preview.write("<h2>Preview</h2>\n")
-        f_preview.write("<hr>\n")
-
-    for idx, row in ranges.iterrows():
-        t_start = row['time1']
-        t_stop = row['time2']
-        mask = (t_obs >= t_start) & (t_obs <= t_stop)
-        time_subset = t_obs[mask]
-        mag_subset  = m_obs[mask]
-
-        info['Method'] = method
-        info['Points'] = len(mag_subset)
-        info['Start Time'] = t_start
-        info['End Time'] = t_stop
-        info_str = "\t".join(f"{k}: {info[k]}" for k in info_keys[:4])
-        print(info_str)
-
-        params_opt, params_cov, param_warning = ila.approx(method, time_subset, mag_subset, maxfev=MAXFEV)
-        if param_warning is not None:
-            utils.printWarning(param_warning)
-        
-        if method == "AP" or method == "WSAP" or method == "WSL":
-            if params_opt[3] >= params_opt[4]:
-                info_str = info_str + f"\tFailed: C4 must be less than C5. C4 = {params_opt[3]}; C5 = {params_opt[4]}"
-                utils.printWarning(info_str)
-                with open(result_file_name, "a") as f:
-                    f.write(info_str + "\n")
-                with open(preview_file_name, "a") as f_preview:
-                    f_preview.write("<p>Failed. See the file with results.</p>\n")
-                    
-                continue
+        ranges = windows.read_ranges(range_file_name)
+        print(f"Range file loaded: {len(ranges['time1'])} ranges")
 
-        # 1-sigma uncertainties
-        param_errors = np.sqrt(np.diag(params_cov))
-        
-        [time_of_extremum, 
-         time_extr_sig, 
-         mag_of_extremum,
-         mag_extr_sig,
-         eclipse_duration,
-         eclipse_sig,
-         param_warning1
-        ] = ila.method_result(method, params_opt, params_cov, min(time_subset), max(time_subset))
-        if param_warning1 is not None:
-            utils.printWarning(param_warning1)
-        
-        t_array, y_array_fit, y_array_fit_at_points = utils.generate_curve(method, params_opt, time_subset)
-        C4 = params_opt[3]
-        C4_err = param_errors[3]
-        if len(params_opt) > 4:
-            C5 = params_opt[4]
-            C5_err = param_errors[4]
-        else:
-            C5 = None
-            C5_err = None
-
-        sigma = np.sqrt(np.sum((mag_subset - y_array_fit_at_points)**2) / (len(mag_subset) - len(params_opt)))
-        
-        info['Sigma'] = sigma
-        info['Time of Extremum (TOM)'] = time_of_extremum
-        info['TOM Uncertainty'] = time_extr_sig
-        info['Magnitude'] = mag_of_extremum
-        info['Magnitude Uncertainty'] = mag_extr_sig
-        info['C4'] = C4
-        info['C4 Uncertainty'] = C4_err
-        info['C5'] = C5
-        info['C5 Uncertainty'] = C5_err
-        info['Eclipse Duration'] = eclipse_duration
-        info['Eclipse Duration Uncertainty'] = eclipse_sig
-        
-        if param_warning is not None or param_warning1 is not None:
-            if param_warning is None:
-                param_warning = ""    
-            if param_warning1 is None:
-                param_warning1 = ""
-            if param_warning != "" and param_warning1 != "":
-                param_warning += ";"
-            param_warning += param_warning1
-            info['Method'] = method + " WARNING! " + param_warning
+    # Without images, the parameters are saved to regenerate the preview later
+    save_params = preview_mode == "none"
+
+    use_stacked = solver == "stacked"
+    fit_options = {} if use_stacked else {'solver': solver}
+    if escalate or time_budget is not None:
+        if use_stacked:
+            raise Exception("--escalate and --time-budget are not available with the stacked solver")
+        fit_options['escalate'] = escalate
+        fit_options['time_budget'] = time_budget
+    # Start, NFEV and Stage are reported for warm-started or escalated fits
+    report_fit_info = warm_start or escalate
+    report_resample = resample is not None
+    if report_resample and resample[0] == "montecarlo" and not np.all(np.isfinite(err_obs) & (err_obs > 0)):
+        raise Exception("Monte Carlo resampling requires positive errors (the third column of the data file)")
+
+    t_starts = ranges['time1']
+    t_stops = ranges['time2']
+    if split is None and detect is None:
+        lo, hi = windows.range_bounds(t_obs, t_starts, t_stops)
+        lo, hi = windows.snap_to_points(t_obs, lo, hi, t_starts, t_stops, ranges['point1'], ranges['point2'])
+        n_mismatch = np.count_nonzero(windows.point_index_mismatch(lo, hi, ranges['point1'], ranges['point2']))
+        if n_mismatch > 0:
+            utils.printWarning(f"{n_mismatch} range(s): the point numbers do not match the data file")
+    if profiler is not None:
+        profiler.add("ranges", time.perf_counter() - ranges_time)
+
+    # The run as recorded in the checkpoint journal; --resume requires the same
+    run = {'data': os.path.abspath(data_file_name),
+           'ranges': os.path.abspath(range_file_name) if range_file_name is not None else None,
+           'split': [float(v) for v in split] if split is not None else None,
+           'detect': list(detect) if detect is not None else None,
+           'methods': methods, 'solver': solver, 'warm_start': warm_start, 'period': period,
+           'maxfev': maxfev, 'escalate': escalate, 'time_budget': time_budget,
+           'resample': list(resample) if resample is not None else None,
+           'preview': os.path.abspath(preview_file_name), 'preview_mode': preview_mode,
+           'preview_format': preview_format, 'page_size': page_size,
+           'result_format': result_sink.result_format(result_file_name, result_format), 'select': select}
+    ranges_done = 0
+    result_offset = None
+    preview_state = None
+    if resume:
+        journal = checkpoint.read_journal(result_file_name)
+        if journal is None or journal[1] is None:
+            print("No checkpoint found: processing all the ranges")
         else:
-            info['Method'] = method
-            
-        info_str = "\t".join(str(info[k]) for k in info_keys[:-2])
-        info_str2 = " | ".join(f"{k}: {info[k]}" for k in info_keys[:-2])
-        if method == "WSL":
-            info_str += "\t" + str(info[info_keys[-2]])
-            info_str += "\t" + str(info[info_keys[-1]])
-            info_str2 += " | " + f"{info_keys[-2]}: {str(info[info_keys[-2]])}"
-            info_str2 += " | " + f"{info_keys[-1]}: {str(info[info_keys[-1]])}"
-        with open(result_file_name, "a") as f:            
-            f.write(info_str + "\n")
-            f.flush()
-
-        if range_file_name is None:
-            # One-extremum mode
-            print('-' * 80)
-            info_list2 = info_str2.split(" | ")
-            for i in range(4, len(info_list2)): print(info_list2[i])
-            print('-' * 80)
-            for i in range(0, len(params_opt)): print(f"C{i+1}:\t{params_opt[i]}\t +/- {param_errors[i]}")
-            if showPlot:
-                utils.plot_result(time_subset, mag_subset, 
-                                  t_array, y_array_fit, 
-                                  C4, C5, 
-                                  time_of_extremum, time_extr_sig,
-                                  mag_of_extremum, mag_extr_sig,
-                                  inverseY,
-                                  param_warning,
-                                  False)
-
-        encoded = utils.plot_result(time_subset, mag_subset, 
-                                    t_array, y_array_fit, 
-                                    C4, C5, 
-                                    time_of_extremum, time_extr_sig,
-                                    mag_of_extremum, mag_extr_sig,
-                                    inverseY,
-                                    param_warning,
-                                    True)
-        
-        with open(preview_file_name, "a") as f_preview:
-            f_preview.write(f"<p>{info_str2}</p>\n")
-            f_preview.write(f"<img src='data:image/png;base64,{encoded}'><br><br>\n")
-            f_preview.write("<hr>\n")
-            f_preview.flush()
-
-    with open(preview_file_name, "a") as f_preview:
-        f_preview.write("<p>End of file</p>\n")
-        f_preview.write("\n</body></html>")                
+            journal_run, last = journal
+            if journal_run != run:
+                raise Exception("The checkpoint journal is of a run with other files or options")
+            ranges_done = last['ranges']
+            result_offset = last['result']
+            preview_state = last['preview']
+            print(f"Resuming after {ranges_done} of {len(t_starts)} ranges")
+
+    def range_tasks():
+        for i, (time_subset, mag_subset, err_subset) in enumerate(windows.iter_windows(lo, hi, t_obs, m_obs,
+                                                                                        err_obs)):
+            if i < ranges_done:
+                continue
+            t_start = t_starts[i]
+            t_stop = t_stops[i]
+            for m in methods:
+                yield dict(method=m, t_obs=time_subset, m_obs=mag_subset,
+                           t_start=t_start, t_stop=t_stop, maxfev=maxfev, inverseY=inverseY,
+                           render=True, keep_curve=one_extremum, fit_options=fit_options,
+                           preview_mode=preview_mode, fit_cache=fit_cache_options, resample=resample,
+                           err_obs=err_subset if report_resample else None, profile=profiler is not None)
+
+    cache_hits = 0
+    def range_records():
+        # Records of one range (one per method)
+        nonlocal cache_hits
+        group = []
+        for record in batch.fit_ranges(range_tasks(), jobs, warm_start, period, use_stacked):
+            if record['fit_info'].get('cache') == "hit":
+                cache_hits += 1
+            group.append(record)
+            if len(group) == len(methods):
+                yield group
+                group = []
+
+    with result_sink.open_sink(result_file_name, result_format, methods[0], report_fit_info, save_params, multi,
+                               resume=result_offset, resample=report_resample) as sink, \
+         preview_html.PreviewWriter(preview_file_name, preview_format, page_size, preview_state) as writer, \
+         checkpoint.Journal(result_file_name, run, result_offset is not None, not one_extremum) as journal:
+
+        def commit(range_no):
+            with profile_stage("checkpoint"):
+                offset = sink.offset()
+                if offset is not None:
+                    writer.flush()
+                    journal.commit(range_no, offset, writer.state())
+
+        range_no = ranges_done
+        for range_no, group in enumerate(range_records(), ranges_done + 1):
+            selected = batch.select_fit(group, select) if multi else 0
+            for k, record in enumerate(group):
+                info = record['info']
+                info_str = record['header']
+                print(info_str)
+                for param_warning in record['warnings']:
+                    utils.printWarning(param_warning)
+
+                with profile_stage("result"):
+                    sink.write(record, range_no)
+                if profiler is not None:
+                    profiler.window(record, range_no, result_sink.record_status(record)[0])
+
+                if record['failed'] is not None:
+                    info_str = info_str + "\t" + record['failed']
+                    utils.printWarning(info_str)
+                    with profile_stage("preview"):
+                        writer.add("Failed. See the file with results.", None, info, record['failed'])
+                    continue
+
+                info_str, info_str2 = batch.format_result(record['method'], info, report_fit_info, save_params, multi,
+                                                          report_resample)
+
+                if one_extremum:
+                    # One-extremum mode
+                    params_opt = record['params_opt']
+                    param_errors = record['param_errors']
+                    print('-' * 80)
+                    info_list2 = info_str2.split(" | ")
+                    for i in range(4, len(info_list2)): print(info_list2[i])
+                    print('-' * 80)
+                    for i in range(0, len(params_opt)): print(f"C{i+1}:\t{params_opt[i]}\t +/- {param_errors[i]}")
+                    if showPlot and k == selected:
+                        t_array, y_array_fit = record['curve']
+                        utils.plot_result(t_obs, m_obs, 
+                                          t_array, y_array_fit, 
+                                          info['C4'], info['C5'], 
+                                          info['Time of Extremum (TOM)'], info['TOM Uncertainty'],
+                                          info['Magnitude'], info['Magnitude Uncertainty'],
+                                          inverseY,
+                                          record['param_warning'],
+                                          False)
+
+                with profile_stage("preview"):
+                    writer.add(info_str2, record['image'], info, record['param_warning'])
+
+            if multi:
+                if selected is None:
+                    utils.printWarning("No method selected: all the fits failed")
+                else:
+                    print(f"Selected ({select}): {group[selected]['method']}")
+
+            if range_no % checkpoint.CHECKPOINT_EVERY == 0:
+                commit(range_no)
+
+        commit(range_no)
+
+    if fit_cache_options is not None:
+        print(f"Fit cache: {cache_hits} fit(s) reused")
+
+    if profiler is not None:
+        for name, file_name in (("result bytes", result_file_name), ("preview bytes", preview_file_name)):
+            if os.path.exists(file_name):
+                profiler.count(name, os.path.getsize(file_name))
+        print('-' * 80)
+        for line in profiler.summary():
+            print(line)
+
+###############################################################################
+
+def result_value(value):
+    return None if value == "None" or value == "" else np.float64(value)
+
+def render_result(data_file_name, inverseY, result_file_name, preview_file_name, preview_mode, use_cache=True,
+                  preview_format="inline", page_size=preview_html.PAGE_SIZE):
+    # Makes the preview from a result file written with --preview-mode none
+    # (text format) or from a result file in the tsv format
+    if preview_mode == "none":
+        raise Exception("Preview mode 'none' is not applicable in this context")
+    t_obs, m_obs, err_obs = lightcurve.load_light_curve(data_file_name, use_cache)
+    print(f"File loaded: {len(m_obs)} points")
+
+    with open(result_file_name, "r") as f:
+        keys = f.readline().rstrip("\n").split("\t")
+        lines = [line.rstrip("\n") for line in f if line.strip() != ""]
+    if any(k not in keys for k in batch.PARAM_KEYS):
+        raise Exception("The result file has no C1..C3 columns. Use --preview-mode none in batch mode to save them.")
+    print(f"Result file loaded: {len(lines)} ranges")
+
+    with preview_html.PreviewWriter(preview_file_name, preview_format, page_size) as writer:
+        for line in lines:
+            fields = line.split("\t")
+            if len(fields) != len(keys):
+                # Failed range: "Key: value" fields and the message
+                info = dict(field.split(": ", 1) for field in fields if ": " in field)
+                writer.add("Failed. See the file with results.", None, info, fields[-1])
+                continue
+            row = dict(zip(keys, fields))
+            if 'Status' in row:
+                # tsv format
+                if row['Status'] == result_sink.STATUS_FAILED:
+                    writer.add("Failed. See the file with results.", None, row, row['Warning'])
+                    continue
+                method = row['Method']
+                param_warning = row['Warning'] if row['Warning'] != "" else None
+            else:
+                method, param_warning = preview.parse_result_method(row['Method'])
+            params_opt = [result_value(row[k]) for k in batch.PARAM_KEYS] + [result_value(row['C4'])]
+            if method != "A":
+                params_opt.append(result_value(row['C5']))
+            lo, hi = windows.window_bounds(t_obs, np.float64(row['Start Time']), np.float64(row['End Time']))
+            time_subset = t_obs[lo:hi]
+            mag_subset = m_obs[lo:hi]
+            if len(time_subset) == 0:
+                utils.printWarning(f"No points in the range {row['Start Time']} - {row['End Time']}")
+                continue
+            print(batch.range_header(row))
+            t_array, y_array_fit = utils.model_curve(method, params_opt, time_subset)
+            image = preview.render(preview_mode, inverseY,
+                                   time_subset, mag_subset,
+                                   t_array, y_array_fit,
+                                   params_opt[3], params_opt[4] if len(params_opt) > 4 else None,
+                                   result_value(row['Time of Extremum (TOM)']), result_value(row['TOM Uncertainty']),
+                                   result_value(row['Magnitude']), result_value(row['Magnitude Uncertainty']),
+                                   param_warning)
+            writer.add(" | ".join(f"{k}: {row[k]}" for k in keys), image, row, param_warning)
 
 ###############################################################################
 
 def main():
     args = utils.parse_args(DESCRIPTION)
+    utils.init_console()
     range_file_name = args.ranges
     result_file_name = args.result
     preview_file_name = args.preview
     method = args.method.upper()
-    if range_file_name != "":
+    if args.clear_fit_cache:
+        n = fit_cache.FitCache(args.fit_cache_dir).clear()
+        print(f"Fit cache cleared: {n} entries removed")
+    if not args.fit_cache or args.no_fit_cache:
+        fit_cache_options = None
+    else:
+        fit_cache_options = (args.fit_cache_dir, int(args.fit_cache_size * 1024 * 1024))
+    if args.serve:
+        if args.solver == "stacked":
+            raise Exception("The stacked solver is not available in the service mode")
+        server.serve({'method': method, 'select': args.select,
+                      'maxfev': args.maxfev if args.maxfev is not None else MAXFEV, 'solver': args.solver,
+                      'escalate': args.escalate, 'time_budget': args.time_budget, 'fit_cache': fit_cache_options},
+                     args.jobs, args.max_pending, args.socket, args.max_connections)
+        return
+    if args.filename is None:
+        raise Exception("The input data file is required")
+    if args.render_result:
+        render_result(args.filename, not args.non_inverseY, result_file_name, preview_file_name, args.preview_mode,
+                      not args.no_cache, args.preview_format, args.preview_page_size)
+        return
+    split = None
+    split_args = [args.epoch, args.start_phase, args.stop_phase]
+    if any(v is not None for v in split_args):
+        if any(v is None for v in split_args) or args.period is None:
+            raise Exception("--epoch, --period, --start-phase and --stop-phase must be given together")
+        if range_file_name != "":
+            raise Exception("--ranges cannot be used with --epoch, --period, --start-phase and --stop-phase")
+        split = (args.epoch, args.period, args.start_phase, args.stop_phase)
+    detect = None
+    if args.detect:
+        if range_file_name != "" or split is not None:
+            raise Exception("--detect cannot be used with --ranges or --epoch")
+        detect = (args.detect_width, args.detect_smooth, args.detect_kind)
+    resample = None
+    if args.resample is not None:
+        if args.resamples < 2:
+            raise Exception("The number of resamples must be at least 2")
+        resample = (args.resample, args.resamples, args.resample_seed)
+    if range_file_name != "" or split is not None or detect is not None:
         if method == "0":
             raise Exception(f"Method {method} is not applicable in this context")            
-    process_data(args.filename, method, not args.non_inverseY, not args.no_plot, range_file_name, result_file_name, preview_file_name)
+    profiler = None
+    if args.profile or args.profile_trace is not None:
+        profiler = profiler_module.Profiler(args.profile_trace)
+    process_data(args.filename, method, not args.non_inverseY, not args.no_plot, range_file_name, result_file_name, preview_file_name,
+                 args.jobs, args.solver, args.warm_start, args.period, not args.no_cache, args.preview_mode,
+                 args.preview_format, args.preview_page_size, args.select, args.result_format,
+                 fit_cache_options, args.resume, args.maxfev if args.maxfev is not None else MAXFEV,
+                 args.escalate, args.time_budget, split, detect, resample, profiler)
+    if profiler is not None:
+        profiler.close()
 
 if __name__ == "__main__":
     if DEBUG:
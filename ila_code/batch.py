@@ -0,0 +1,454 @@
+import os
+import time
+import itertools
+import collections
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from . import ila
+from . import utils
+from . import stacked
+from . import preview
+from . import profiler
+from . import resample as resample_module
+from . import fit_cache as fit_cache_module
+
+# Number of windows fitted together by the stacked solver
+STACKED_BLOCK = 1024
+
+# With --jobs: consecutive ranges fitted by a worker with the warm start,
+# and the tasks (or blocks) submitted to the pool per worker at a time
+WARM_BLOCK = 16
+PENDING_PER_JOB = 2
+
+# Criteria used to select the best method of a range
+SELECTION_CRITERIA = ("sigma", "aic", "bic")
+
+INFO_KEYS = [
+    'Method',
+    'Points',
+    'Start Time',
+    'End Time',
+    'Sigma',
+    'Time of Extremum (TOM)',
+    'TOM Uncertainty',
+    'Magnitude',
+    'Magnitude Uncertainty',
+    'C4',
+    'C4 Uncertainty',
+    'C5',
+    'C5 Uncertainty',
+    'Eclipse Duration',
+    'Eclipse Duration Uncertainty'
+    ]
+
+# Reported when the fits are warm-started or escalated
+FIT_INFO_KEYS = [
+    'Start',
+    'NFEV',
+    'Stage'
+    ]
+
+# Reported when no preview images are rendered: with C4 and C5 they
+# allow to regenerate the preview from the result file
+PARAM_KEYS = [
+    'C1',
+    'C2',
+    'C3'
+    ]
+
+# Reported when several methods are fitted to every range
+SELECTION_KEYS = [
+    'AIC',
+    'BIC',
+    'Selected'
+    ]
+
+# Reported with resampling uncertainties (resample.PERCENTILES intervals and
+# the number of replicates fitted without warnings)
+RESAMPLE_KEYS = [
+    'TOM Low',
+    'TOM High',
+    'Magnitude Low',
+    'Magnitude High',
+    'Resamples'
+    ]
+
+###############################################################################
+
+def result_keys(method, fit_info=False, params=False, selection=False, resample=False):
+    # Eclipse duration is reported for WSL only
+    # (in the combined table of several methods, for all of them)
+    if method == "WSL" or selection:
+        keys = INFO_KEYS
+    else:
+        keys = INFO_KEYS[:-2]
+    if fit_info:
+        keys = keys + FIT_INFO_KEYS
+    if params:
+        keys = keys + PARAM_KEYS
+    if selection:
+        keys = keys + SELECTION_KEYS
+    if resample:
+        keys = keys + RESAMPLE_KEYS
+    return keys
+
+def range_header(info):
+    return "\t".join(f"{k}: {info[k]}" for k in INFO_KEYS[:4])
+
+def format_result(method, info, fit_info=False, params=False, selection=False, resample=False):
+    keys = result_keys(method, fit_info, params, selection, resample)
+    info_str = "\t".join(str(info[k]) for k in keys)
+    info_str2 = " | ".join(f"{k}: {info[k]}" for k in keys)
+    return info_str, info_str2
+
+###############################################################################
+
+def fit_range(method, t_obs, m_obs, t_start, t_stop, maxfev, inverseY, render=True, keep_curve=False,
+              fit_options=None, approx_result=None, preview_mode="full", fit_cache=None, resample=None,
+              err_obs=None, profile=False):
+    # Fits one range and returns a record with the result line fields.
+    # preview_mode: one of preview.PREVIEW_MODES ("none": no image is rendered).
+    # fit_cache: None or (directory, max_bytes) of the fit cache (fit_cache.FitCache).
+    # fit_options: additional keyword arguments of ila.approx (e.g. solver).
+    # approx_result: (result, fit_info) of a fit already done elsewhere
+    # (stacked solver); result is the ila.approx tuple or an exception.
+    # resample: None or (mode, number of replicates, seed) of the resampling
+    # uncertainties (see resample.py); err_obs: the errors of the points
+    # (Monte Carlo mode).
+    # profile: time the stages of the fit in record['profile'] (see profiler.py).
+    # Exceptions are caught and reported in record['failed'] so that
+    # a bad range does not abort the batch.
+    info = dict.fromkeys(INFO_KEYS + FIT_INFO_KEYS + PARAM_KEYS + SELECTION_KEYS + RESAMPLE_KEYS + ['Fit Time'])
+    info['Method'] = method
+    info['Points'] = len(m_obs)
+    info['Start Time'] = t_start
+    info['End Time'] = t_stop
+    record = {
+        'method': method,
+        'info': info,
+        'header': range_header(info),
+        'params_opt': None,
+        'param_errors': None,
+        'warnings': [],
+        'param_warning': None,
+        'failed': None,
+        'image': None,
+        'curve': None,
+        'fit_info': {},
+        'profile': profiler.window_profile() if profile else None
+        }
+    try:
+        _fit_range(record, method, t_obs, m_obs, maxfev, inverseY, render and preview_mode != "none",
+                   keep_curve, fit_options or {}, approx_result, preview_mode, fit_cache, resample, err_obs)
+    except Exception as e:
+        record['failed'] = f"Failed: {e}"
+        info['NFEV'] = record['fit_info'].get('nfev')
+        info['Stage'] = record['fit_info'].get('stage')
+        info['Fit Time'] = record['fit_info'].get('time')
+        if record['profile'] is not None:
+            record['profile']['times'].setdefault('fit', record['fit_info'].get('time') or 0.0)
+    return record
+
+def _fit_range(record, method, t_obs, m_obs, maxfev, inverseY, render, keep_curve, fit_options,
+               approx_result, preview_mode, fit_cache, resample, err_obs):
+    info = record['info']
+    fit_info = record['fit_info']
+    profile = record['profile']
+    if profile is not None:
+        fit_options = dict(fit_options, callback=profile['attempts'].append)
+    if fit_cache is not None:
+        approx = fit_cache_module.get_cache(*fit_cache).approx
+    else:
+        approx = ila.approx
+    if approx_result is None:
+        fit_time = time.perf_counter()
+        try:
+            params_opt, params_cov, param_warning = approx(method, t_obs, m_obs, maxfev=maxfev,
+                                                           fit_info=fit_info, **fit_options)
+        finally:
+            fit_info['time'] = time.perf_counter() - fit_time
+    else:
+        result, result_info = approx_result
+        fit_info.update(result_info)
+        if isinstance(result, Exception):
+            raise result
+        params_opt, params_cov, param_warning = result
+    if profile is not None:
+        profile['times']['fit'] = fit_info.get('time') or 0.0
+        t_lap = time.perf_counter()
+    info['Start'] = fit_info.get('start')
+    info['NFEV'] = fit_info.get('nfev')
+    info['Stage'] = fit_info.get('stage')
+    info['Fit Time'] = fit_info.get('time')
+    record['params_opt'] = params_opt
+    if param_warning is not None:
+        record['warnings'].append(param_warning)
+
+    if method == "AP" or method == "WSAP" or method == "WSL":
+        if params_opt[3] >= params_opt[4]:
+            record['failed'] = f"Failed: C4 must be less than C5. C4 = {params_opt[3]}; C5 = {params_opt[4]}"
+            return
+
+    # 1-sigma uncertainties
+    param_errors = np.sqrt(np.diag(params_cov))
+    record['param_errors'] = param_errors
+
+    [time_of_extremum,
+     time_extr_sig,
+     mag_of_extremum,
+     mag_extr_sig,
+     eclipse_duration,
+     eclipse_sig,
+     param_warning1
+    ] = ila.method_result(method, params_opt, params_cov, min(t_obs), max(t_obs))
+    if param_warning1 is not None:
+        record['warnings'].append(param_warning1)
+    if profile is not None:
+        t_lap = profiler.lap(profile, 'covariance', t_lap)
+
+    y_array_fit_at_points = utils.model_at_points(method, params_opt, t_obs)
+    # The plotted curve is only made for an image or a plot
+    if render or keep_curve:
+        t_array, y_array_fit = utils.model_curve(method, params_opt, t_obs)
+    if profile is not None:
+        t_lap = profiler.lap(profile, 'curve', t_lap)
+    C4 = params_opt[3]
+    C4_err = param_errors[3]
+    if len(params_opt) > 4:
+        C5 = params_opt[4]
+        C5_err = param_errors[4]
+    else:
+        C5 = None
+        C5_err = None
+
+    rss = np.sum((m_obs - y_array_fit_at_points)**2)
+    sigma = np.sqrt(rss / (len(m_obs) - len(params_opt)))
+    aic, bic = information_criteria(rss, len(m_obs), len(params_opt))
+
+    info['Sigma'] = sigma
+    info['Time of Extremum (TOM)'] = time_of_extremum
+    info['TOM Uncertainty'] = time_extr_sig
+    info['Magnitude'] = mag_of_extremum
+    info['Magnitude Uncertainty'] = mag_extr_sig
+    info['C4'] = C4
+    info['C4 Uncertainty'] = C4_err
+    info['C5'] = C5
+    info['C5 Uncertainty'] = C5_err
+    info['Eclipse Duration'] = eclipse_duration
+    info['Eclipse Duration Uncertainty'] = eclipse_sig
+    info['C1'] = params_opt[0]
+    info['C2'] = params_opt[1]
+    info['C3'] = params_opt[2]
+    info['AIC'] = aic
+    info['BIC'] = bic
+
+    if resample is not None:
+        mode, n_resamples, seed = resample
+        tom_samples, mag_samples = resample_module.resample_fit(method, t_obs, m_obs, params_opt, mode,
+                                                                n_resamples, seed, err_obs)
+        info['TOM Low'], info['TOM High'] = resample_module.percentile_interval(tom_samples)
+        info['Magnitude Low'], info['Magnitude High'] = resample_module.percentile_interval(mag_samples)
+        info['Resamples'] = int(np.count_nonzero(np.isfinite(tom_samples)))
+        if profile is not None:
+            t_lap = profiler.lap(profile, 'resample', t_lap)
+
+    if param_warning is not None or param_warning1 is not None:
+        if param_warning is None:
+            param_warning = ""
+        if param_warning1 is None:
+            param_warning1 = ""
+        if param_warning != "" and param_warning1 != "":
+            param_warning += ";"
+        param_warning += param_warning1
+        info['Method'] = method + " WARNING! " + param_warning
+    else:
+        info['Method'] = method
+    record['param_warning'] = param_warning
+
+    if keep_curve:
+        record['curve'] = (t_array, y_array_fit)
+
+    if render:
+        record['image'] = preview.render(preview_mode, inverseY,
+                                         t_obs, m_obs,
+                                         t_array, y_array_fit,
+                                         C4, C5,
+                                         time_of_extremum, time_extr_sig,
+                                         mag_of_extremum, mag_extr_sig,
+                                         param_warning)
+        if profile is not None:
+            profiler.lap(profile, 'render', t_lap)
+
+###############################################################################
+
+def information_criteria(rss, n, k):
+    # AIC and BIC of a least-squares fit with Gaussian errors
+    # (up to a constant common to all the models of a range)
+    if rss <= 0.0 or n <= 0:
+        return -np.inf, -np.inf
+    log_likelihood = n * np.log(rss / n)
+    return log_likelihood + 2 * k, log_likelihood + k * np.log(n)
+
+def select_fit(records, criterion="aic"):
+    # Marks the best of the records of one range (fits by different methods)
+    # in info['Selected'] and returns its index (None if all the fits failed).
+    # Fits without warnings are preferred.
+    key = {'sigma': 'Sigma', 'aic': 'AIC', 'bic': 'BIC'}[criterion]
+    best = None
+    best_rank = None
+    for i, record in enumerate(records):
+        record['info']['Selected'] = 0
+        value = record['info'][key]
+        if record['failed'] is not None or value is None or np.isnan(value):
+            continue
+        rank = (record['param_warning'] is not None, value)
+        if best_rank is None or rank < best_rank:
+            best = i
+            best_rank = rank
+    if best is not None:
+        records[best]['info']['Selected'] = 1
+    return best
+
+###############################################################################
+
+def warm_start_p0(record, t_start, prev_t_start, period=None):
+    # Initial values for the range starting at t_start from the converged
+    # solution of a previous range: C4 and C5 are shifted by the distance
+    # between the ranges (rounded to whole cycles if the period is known).
+    params_opt = record['params_opt']
+    shift = t_start - prev_t_start
+    if period is not None:
+        shift = round(shift / period) * period
+    p0 = list(params_opt)
+    p0[3] += shift
+    if len(p0) > 4:
+        p0[4] += shift
+    return p0
+
+def fit_ranges_warm(tasks, period=None):
+    # Fits the ranges one after another, starting each fit from the
+    # last converged solution of the same method.
+    prev_records = {}
+    for task in tasks:
+        prev = prev_records.get(task['method'])
+        if prev is not None:
+            task = dict(task)
+            fit_options = dict(task.get('fit_options') or {})
+            fit_options['p0'] = warm_start_p0(prev, task['t_start'], prev['info']['Start Time'], period)
+            task['fit_options'] = fit_options
+        record = fit_range(**task)
+        if record['failed'] is None and not record['warnings']:
+            prev_records[task['method']] = record
+        yield record
+
+def with_stacked_results(tasks, block=STACKED_BLOCK):
+    # Fits the ranges in blocks with the stacked solver and attaches the
+    # results to the tasks
+    tasks = iter(tasks)
+    while True:
+        chunk = [task for _, task in zip(range(block), tasks)]
+        if len(chunk) == 0:
+            return
+        fit_infos = [{} for task in chunk]
+        results = [None] * len(chunk)
+        # Results of the fit cache
+        keys = [None] * len(chunk)
+        for i, task in enumerate(chunk):
+            if task.get('fit_cache') is not None:
+                cache = fit_cache_module.get_cache(*task['fit_cache'])
+                keys[i] = cache.approx_key(task['method'], task['t_obs'], task['m_obs'], task['maxfev'],
+                                           {'solver': "stacked"})
+                cached = cache.get_approx(keys[i])
+                if cached is not None:
+                    results[i], fit_infos[i] = cached
+                    fit_infos[i]['cache'] = "hit"
+        # The tasks of a chunk may be of different methods
+        for method in dict.fromkeys(task['method'] for task in chunk):
+            idx = [i for i, task in enumerate(chunk) if task['method'] == method and results[i] is None]
+            if len(idx) == 0:
+                continue
+            method_infos = [fit_infos[i] for i in idx]
+            fit_time = time.perf_counter()
+            method_results = stacked.approx_stacked(method, [(chunk[i]['t_obs'], chunk[i]['m_obs']) for i in idx],
+                                                    maxfev=chunk[idx[0]]['maxfev'], fit_infos=method_infos)
+            # The fit time of a window is its share of the block
+            fit_time = (time.perf_counter() - fit_time) / len(idx)
+            for i, result in zip(idx, method_results):
+                results[i] = result
+                fit_infos[i]['time'] = fit_time
+                if keys[i] is not None:
+                    fit_cache_module.get_cache(*chunk[i]['fit_cache']).put_approx(keys[i], result, fit_infos[i])
+                    fit_infos[i]['cache'] = "miss"
+        for task, result, fit_info in zip(chunk, results, fit_infos):
+            task = dict(task)
+            task['approx_result'] = (result, fit_info)
+            yield task
+
+###############################################################################
+
+def _blocks(tasks, size):
+    # Lists of up to size consecutive tasks
+    tasks = iter(tasks)
+    while True:
+        block = list(itertools.islice(tasks, size))
+        if len(block) == 0:
+            return
+        yield block
+
+def _map_bounded(executor, fn, args, pending):
+    # executor.map() that keeps at most pending calls submitted: the
+    # arguments are taken from the iterable as the results are yielded
+    # (in order), so a long lazy task generator is neither read ahead nor
+    # held in memory and the first results come at once
+    args = iter(args)
+    futures = collections.deque(executor.submit(fn, arg) for arg in itertools.islice(args, pending))
+    try:
+        while len(futures) > 0:
+            result = futures.popleft().result()
+            for arg in itertools.islice(args, 1):
+                futures.append(executor.submit(fn, arg))
+            yield result
+    finally:
+        for future in futures:
+            future.cancel()
+
+def _init_worker():
+    # Workers only render to PNG buffers (preview.PreviewRenderer uses
+    # the Agg canvas directly); the Agg backend is the default for any
+    # pyplot use. matplotlib itself is imported with the first preview only,
+    # not with --preview-mode none, in the survey or service mode.
+    os.environ["MPLBACKEND"] = "Agg"
+
+def _fit_range_task(task):
+    return fit_range(**task)
+
+def _fit_ranges_warm_task(args):
+    tasks, period = args
+    return list(fit_ranges_warm(tasks, period))
+
+def fit_ranges(tasks, jobs=1, warm_start=False, period=None, use_stacked=False):
+    # tasks: iterable of dicts with fit_range() keyword arguments.
+    # Yields the records in the order of the tasks.
+    # warm_start: start each fit from the solution of the previous range
+    # (in parallel mode, within contiguous blocks of WARM_BLOCK ranges).
+    # use_stacked: fit blocks of ranges together with the stacked solver
+    # (warm_start is not used then); the workers only render the previews.
+    if use_stacked:
+        tasks = with_stacked_results(tasks)
+        warm_start = False
+    if jobs is None or jobs <= 0:
+        jobs = os.cpu_count() or 1
+    if jobs == 1:
+        if warm_start:
+            yield from fit_ranges_warm(tasks, period)
+        else:
+            for task in tasks:
+                yield fit_range(**task)
+        return
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker) as executor:
+        if warm_start:
+            args = ((block, period) for block in _blocks(tasks, WARM_BLOCK))
+            for records in _map_bounded(executor, _fit_ranges_warm_task, args, PENDING_PER_JOB * jobs):
+                yield from records
+        else:
+            yield from _map_bounded(executor, _fit_range_task, tasks, PENDING_PER_JOB * jobs)
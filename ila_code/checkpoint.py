@@ -0,0 +1,78 @@
+import os
+import json
+
+# Checkpoint journal of a batch run (FILE.journal next to the result file).
+# The first line describes the run (data file, ranges, method, options);
+# every further line is a checkpoint: the number of ranges done and the
+# positions of the result and preview files after them. The checkpoint is
+# written (and synced) only after the outputs themselves, so on --resume the
+# outputs are cut back to the last checkpoint, which drops rows of
+# unfinished ranges and torn lines, and the run continues from there.
+
+JOURNAL_SUFFIX = ".journal"
+# Ranges between checkpoints
+CHECKPOINT_EVERY = 64
+
+###############################################################################
+
+def journal_path(result_file_name):
+    return result_file_name + JOURNAL_SUFFIX
+
+def read_journal(result_file_name):
+    # Returns (run, last checkpoint or None), or None if there is no journal
+    try:
+        with open(journal_path(result_file_name), "r") as f:
+            lines = f.read().split("\n")
+    except OSError:
+        return None
+    run = None
+    last = None
+    for line in lines:
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            # Torn last line
+            continue
+        if 'run' in entry:
+            run = entry['run']
+        elif 'ranges' in entry:
+            last = entry
+    if run is None:
+        return None
+    return run, last
+
+class Journal:
+    def __init__(self, result_file_name, run, resume=False, enabled=True):
+        # run: JSON-serializable description of the run
+        # enabled: False for a run that is not checkpointed
+        self.f = None
+        if not enabled:
+            return
+        self.f = open(journal_path(result_file_name), "a" if resume else "w")
+        if resume:
+            # Ends a possibly torn last line
+            self.f.write("\n")
+        else:
+            self._write({'run': run})
+
+    def _write(self, entry):
+        self.f.write(json.dumps(entry) + "\n")
+        self.f.flush()
+        os.fsync(self.f.fileno())
+
+    def commit(self, ranges, result_offset, preview_state):
+        # ranges: number of ranges completely written
+        if self.f is None:
+            return
+        self._write({'ranges': ranges, 'result': result_offset, 'preview': preview_state})
+
+    def close(self):
+        if self.f is not None:
+            self.f.close()
+            self.f = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,113 @@
+import numpy as np
+
+# Automatic extremum detection over a light curve sorted by time.
+# The light curve is cut at gaps (GAP_FACTOR times the median spacing) and
+# every part is smoothed with a running mean of 2 * smooth + 1 points.
+# A point is a candidate extremum if its smoothed value is the largest
+# (or the smallest) within half_width points on both sides, and the smoothed
+# curve drops (rises) by SIGNIFICANCE noise levels on both sides of it.
+# The fit window around an extremum is the half_width points on either
+# side: its length in time follows the local cadence.
+# The running mean uses cumulative sums and the running minima/maxima
+# scipy.ndimage filters over the parts padded apart, so the cost is linear
+# in the number of points.
+
+HALF_WIDTH = 40
+GAP_FACTOR = 10.0
+SIGNIFICANCE = 5.0
+EXTREMUM_KINDS = ("both", "min", "max")
+
+###############################################################################
+
+def _segments(t_obs, gap_factor):
+    # Part number of every point and the bounds of the parts
+    n = len(t_obs)
+    dt = np.diff(t_obs)
+    positive = dt[dt > 0]
+    if len(positive) == 0:
+        breaks = np.zeros(max(n - 1, 0), dtype=bool)
+    else:
+        breaks = dt > gap_factor * np.median(positive)
+    seg = np.concatenate(([0], np.cumsum(breaks)))
+    starts = np.concatenate(([0], np.nonzero(breaks)[0] + 1))
+    ends = np.concatenate((starts[1:], [n]))
+    return seg, starts, ends
+
+def _running_mean(m_obs, seg, starts, ends, h):
+    i = np.arange(len(m_obs))
+    lo = np.maximum(i - h, starts[seg])
+    hi = np.minimum(i + h + 1, ends[seg])
+    # Centered values: the cumulative sums stay small
+    m_mean = np.mean(m_obs)
+    c = np.concatenate(([0.0], np.cumsum(m_obs - m_mean)))
+    return (c[hi] - c[lo]) / (hi - lo) + m_mean
+
+def _noise(m_obs, s):
+    # Robust standard deviation of the residuals of the smoothed curve
+    r = m_obs - s
+    return 1.4826 * np.median(np.abs(r - np.median(r)))
+
+def _find_max(s, seg, starts, ends, w, threshold):
+    # Indices of the local maxima of s (see the header)
+    from scipy.ndimage import maximum_filter1d, minimum_filter1d
+    n = len(s)
+    n_seg = len(starts)
+    # The parts are placed w elements apart in the padded arrays
+    idx = np.arange(n) + (seg + 1) * w
+    size = n + (n_seg + 1) * w
+    a = np.full(size, -np.inf)
+    a[idx] = s
+    peak = maximum_filter1d(a, 2 * w + 1)[idx]
+    b = np.full(size, np.inf)
+    b[idx] = s
+    # Minimum of the w + 1 values centered at idx -/+ w/2: the left and the right side
+    c = minimum_filter1d(b, w + 1)
+    left = c[idx - w // 2]
+    right = c[idx + w // 2]
+    i = np.arange(n)
+    candidate = (s == peak) & (s - np.maximum(left, right) >= threshold)
+    # Enough points on both sides
+    candidate &= (i - starts[seg] >= w // 2) & (ends[seg] - 1 - i >= w // 2)
+    # The first point of a plateau
+    candidate[1:] &= ~((s[1:] == s[:-1]) & (seg[1:] == seg[:-1]))
+    return np.nonzero(candidate)[0]
+
+def find_extrema(t_obs, m_obs, half_width=HALF_WIDTH, smooth=None, kind="both", inverseY=True,
+                 gap_factor=GAP_FACTOR, significance=SIGNIFICANCE):
+    # Returns the slice bounds (lo, hi) of the windows around the extrema,
+    # their centers (point indices) and their kinds ("min" or "max").
+    # kind: "min" (minima of brightness: maxima of the magnitude when
+    # inverseY), "max" or "both". smooth: half width of the running mean
+    # (default: half_width // 4).
+    if kind not in EXTREMUM_KINDS:
+        raise Exception(f"Unsupported extremum kind: {kind}")
+    if half_width < 2:
+        raise Exception("The half width must be at least 2 points")
+    w = int(half_width) + int(half_width) % 2
+    h = max(1, w // 4) if smooth is None else int(smooth)
+    t_obs = np.asarray(t_obs, dtype=np.float64)
+    m_obs = np.asarray(m_obs, dtype=np.float64)
+    empty = np.zeros(0, dtype=np.int64)
+    if len(t_obs) < w + 1:
+        return empty, empty, empty, np.zeros(0, dtype=str)
+    seg, starts, ends = _segments(t_obs, gap_factor)
+    s = _running_mean(m_obs, seg, starts, ends, h)
+    threshold = significance * _noise(m_obs, s) / np.sqrt(2 * h + 1)
+
+    # Brightness minima are magnitude maxima when inverseY
+    sign = 1.0 if inverseY else -1.0
+    centers = []
+    kinds = []
+    for k, k_sign in (("min", sign), ("max", -sign)):
+        if kind == "both" or kind == k:
+            found = _find_max(k_sign * s, seg, starts, ends, w, threshold)
+            centers.append(found)
+            kinds.append(np.full(len(found), k))
+    centers = np.concatenate(centers)
+    kinds = np.concatenate(kinds)
+    order = np.argsort(centers, kind="stable")
+    centers = centers[order]
+    kinds = kinds[order]
+    lo = np.maximum(centers - w, starts[seg[centers]])
+    hi = np.minimum(centers + w + 1, ends[seg[centers]])
+    return lo, hi, centers, kinds
@@ -0,0 +1,214 @@
+import os
+import json
+import hashlib
+import numpy as np
+from . import ila
+from . import stacked
+
+# On-disk memo of fit results.
+# An entry is addressed by the SHA-256 of the window's (t, m) arrays, the
+# method and the fit options (maxfev, solver, initial values...), so a window
+# whose inputs have not changed gets its result without refitting, whatever
+# range file or data file it comes from. The key also covers the fitting
+# code (the source of ila.py and stacked.py, the numpy and scipy versions):
+# the results of another version are not used. Entries are .npz files in
+# DIR/xx/KEY.npz, written atomically; a hit refreshes the modification
+# time and the least recently used entries are removed when the total size
+# exceeds max_bytes.
+# Only the fits that return a result are cached: a failure may come from
+# the time budget or the evaluation limit rather than from the data.
+
+FIT_CACHE_VERSION = 2
+MAX_BYTES = 256 * 1024 * 1024
+# The cache is trimmed to this fraction of max_bytes
+EVICT_TO = 0.8
+
+_caches = {}
+_code_version = None
+
+###############################################################################
+
+def default_cache_dir():
+    directory = os.environ.get("ILA_FIT_CACHE")
+    if directory:
+        return directory
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "lc_approx", "fits")
+
+def _json_default(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Cannot hash {type(value)}")
+
+def code_version():
+    # SHA-256 of the fitting code and the versions of the numerical libraries
+    global _code_version
+    if _code_version is None:
+        import scipy
+        h = hashlib.sha256()
+        for module in (ila, stacked):
+            with open(module.__file__, "rb") as f:
+                h.update(f.read())
+        h.update(f"numpy {np.__version__} scipy {scipy.__version__}".encode("utf-8"))
+        _code_version = h.hexdigest()
+    return _code_version
+
+def fit_key(kind, arrays, options):
+    # kind: "approx"; arrays: the float arrays; options: JSON-serializable parameters
+    h = hashlib.sha256()
+    h.update(json.dumps([FIT_CACHE_VERSION, code_version(), kind, options], sort_keys=True,
+                        default=_json_default).encode("utf-8"))
+    for a in arrays:
+        a = np.ascontiguousarray(a, dtype=np.float64)
+        h.update(str(a.shape).encode("utf-8"))
+        h.update(a.tobytes())
+    return h.hexdigest()
+
+###############################################################################
+
+class FitCache:
+    def __init__(self, directory=None, max_bytes=MAX_BYTES):
+        self.directory = directory if directory is not None else default_cache_dir()
+        self.max_bytes = max_bytes
+        self.size = None
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + ".npz")
+
+    def _load(self, key):
+        # Returns (arrays, meta) or None
+        path = self._path(key)
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                arrays = {k: data[k] for k in data.files if k != 'meta'}
+                meta = json.loads(str(data['meta']))
+            os.utime(path)
+        except (OSError, ValueError, KeyError):
+            # Missing, or removed/replaced by another process meanwhile
+            return None
+        return arrays, meta
+
+    def _store(self, key, arrays, meta):
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp_path, "wb") as f:
+                np.savez(f, meta=np.array(json.dumps(meta, default=_json_default)), **arrays)
+            os.replace(tmp_path, path)
+            entry_size = os.path.getsize(path)
+        except OSError:
+            # E.g. read-only cache directory: work without the cache
+            return
+        if self.size is None:
+            self.size = self.total_size()
+        else:
+            self.size += entry_size
+        if self.size > self.max_bytes:
+            self.evict()
+
+    def _entries(self):
+        entries = []
+        if not os.path.isdir(self.directory):
+            return entries
+        for sub in os.scandir(self.directory):
+            if not sub.is_dir():
+                continue
+            for entry in os.scandir(sub.path):
+                if entry.name.endswith(".npz"):
+                    try:
+                        st = entry.stat()
+                    except OSError:
+                        continue
+                    entries.append((st.st_mtime_ns, st.st_size, entry.path))
+        return entries
+
+    def total_size(self):
+        return sum(size for mtime, size, path in self._entries())
+
+    def evict(self):
+        # Removes the least recently used entries
+        entries = sorted(self._entries())
+        total = sum(size for mtime, size, path in entries)
+        for mtime, size, path in entries:
+            if total <= self.max_bytes * EVICT_TO:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+        self.size = total
+
+    def clear(self):
+        # Removes all the entries; returns their number
+        entries = self._entries()
+        for mtime, size, path in entries:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        self.size = 0
+        return len(entries)
+
+    ###########################################################################
+
+    def approx_key(self, method, t_obs, m_obs, maxfev, options):
+        return fit_key("approx", (t_obs, m_obs), {'method': method, 'maxfev': maxfev, **options})
+
+    def get_approx(self, key):
+        # Returns (result, fit_info) or None; result is the ila.approx tuple
+        entry = self._load(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        arrays, meta = entry
+        return (arrays['params_opt'], arrays['params_cov'], meta['param_warning']), meta['fit_info']
+
+    def put_approx(self, key, result, fit_info):
+        # result: the ila.approx tuple; exceptions are not kept.
+        # The fit time and the cache status are not kept
+        if isinstance(result, Exception):
+            return
+        fit_info = {k: v for k, v in fit_info.items() if k != 'time' and k != 'cache'}
+        params_opt, params_cov, param_warning = result
+        self._store(key, {'params_opt': params_opt, 'params_cov': params_cov},
+                    {'param_warning': param_warning, 'fit_info': fit_info})
+
+    def approx(self, method, t_obs, m_obs, maxfev=12000, fit_info=None, callback=None, **options):
+        # ila.approx with the cache; fit_info also receives 'cache' ("hit" or "miss");
+        # the callback (not a part of the key) is only called for the fits done
+        if fit_info is None:
+            fit_info = {}
+        key = self.approx_key(method, t_obs, m_obs, maxfev, options)
+        cached = self.get_approx(key)
+        if cached is not None:
+            result, cached_info = cached
+            fit_info.update(cached_info)
+            fit_info['cache'] = "hit"
+            return result
+        new_info = {}
+        try:
+            result = ila.approx(method, t_obs, m_obs, maxfev=maxfev, fit_info=new_info, callback=callback, **options)
+        except Exception:
+            fit_info.update(new_info)
+            fit_info['cache'] = "miss"
+            raise
+        self.put_approx(key, result, new_info)
+        fit_info.update(new_info)
+        fit_info['cache'] = "miss"
+        return result
+
+###############################################################################
+
+def get_cache(directory=None, max_bytes=MAX_BYTES):
+    # The cache object of the current process for the directory
+    key = (directory, max_bytes)
+    if key not in _caches:
+        _caches[key] = FitCache(directory, max_bytes)
+    return _caches[key]
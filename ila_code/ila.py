@@ -1,5 +1,5 @@
+import time
 import numpy as np
-from scipy.optimize import curve_fit
 
 # Andrych, Kateryna D.; Andronov, Ivan L.; Chinarova, Lidia L.
 # MAVKA: Program of Statistically Optimal Determination of Phenomenological 
@@ -9,6 +9,9 @@ from scipy.optimize import curve_fit
 # Bibcode: 2020JPhSt..24.1902A
 # DOI: 10.30970/jps.24.1902, 10.48550/arXiv.1912.07677
 
+# f_*: scalar functions (reference implementations)
+# f_*_a: vectorized versions evaluated over the whole time array
+
 def f_AP(t, C1, C2, C3, C4, C5):
     D = (C5 - C4) / 2; v = t - (C5 + C4) / 2
     if D <= 0.0:
@@ -21,7 +24,30 @@ def f_AP(t, C1, C2, C3, C4, C5):
         return C1 + C2 * (2 * v - D) * D + C3 * v
         
 def f_AP_a(t_a, C1, C2, C3, C4, C5):
-    return list(map(lambda t: f_AP(t, C1, C2, C3, C4, C5), t_a))
+    # The parameters may also be arrays broadcastable against t_a
+    # (e.g. one row of t_a and one parameter value per window)
+    t_a = np.asarray(t_a, dtype=np.float64)
+    D = (C5 - C4) / 2; v = t_a - (C5 + C4) / 2
+    if np.ndim(D) == 0 and D <= 0.0:
+        return np.full(t_a.shape, np.inf)
+    y = np.where(t_a < C4, C1 + C2 * (-2 * v - D) * D + C3 * v,
+                 np.where(t_a <= C5, C1 + C2 * v * v + C3 * v,
+                          C1 + C2 * (2 * v - D) * D + C3 * v))
+    return np.where(D <= 0.0, np.inf, y)
+
+def jac_AP_a(t_a, C1, C2, C3, C4, C5):
+    # Partial derivatives with respect to C1..C5, shape t_a.shape + (5,)
+    t_a = np.asarray(t_a, dtype=np.float64)
+    D = (C5 - C4) / 2; v = t_a - (C5 + C4) / 2
+    left = t_a < C4
+    right = t_a > C5
+    J = np.empty(np.broadcast(t_a, C4, C5).shape + (5,))
+    J[..., 0] = 1.0
+    J[..., 1] = np.where(left, (-2 * v - D) * D, np.where(right, (2 * v - D) * D, v * v))
+    J[..., 2] = v
+    J[..., 3] = np.where(left, C2 * (2 * D + v), -C2 * v) - C3 / 2
+    J[..., 4] = np.where(right, C2 * (v - 2 * D), -C2 * v) - C3 / 2
+    return J
 
 ###############################################################################
 
@@ -37,7 +63,29 @@ def f_WSAP(t, C1, C2, C3, C4, C5):
         return C1 + C2 * (2 * v - D) * D + C3 * abs(t - C5) ** 1.5
         
 def f_WSAP_a(t_a, C1, C2, C3, C4, C5):
-    return list(map(lambda t: f_WSAP(t, C1, C2, C3, C4, C5), t_a))
+    t_a = np.asarray(t_a, dtype=np.float64)
+    D = (C5 - C4) / 2; v = t_a - (C5 + C4) / 2
+    if np.ndim(D) == 0 and D <= 0.0:
+        return np.full(t_a.shape, np.inf)
+    y = np.where(t_a < C4, C1 + C2 * (-2 * v - D) * D + C3 * np.abs(t_a - C4) ** 1.5,
+                 np.where(t_a <= C5, C1 + C2 * v * v,
+                          C1 + C2 * (2 * v - D) * D + C3 * np.abs(t_a - C5) ** 1.5))
+    return np.where(D <= 0.0, np.inf, y)
+
+def jac_WSAP_a(t_a, C1, C2, C3, C4, C5):
+    t_a = np.asarray(t_a, dtype=np.float64)
+    D = (C5 - C4) / 2; v = t_a - (C5 + C4) / 2
+    left = t_a < C4
+    right = t_a > C5
+    x_left = np.where(left, C4 - t_a, 0.0)
+    x_right = np.where(right, t_a - C5, 0.0)
+    J = np.empty(np.broadcast(t_a, C4, C5).shape + (5,))
+    J[..., 0] = 1.0
+    J[..., 1] = np.where(left, (-2 * v - D) * D, np.where(right, (2 * v - D) * D, v * v))
+    J[..., 2] = x_left ** 1.5 + x_right ** 1.5
+    J[..., 3] = np.where(left, C2 * (2 * D + v) + 1.5 * C3 * np.sqrt(x_left), -C2 * v)
+    J[..., 4] = np.where(right, C2 * (v - 2 * D) - 1.5 * C3 * np.sqrt(x_right), -C2 * v)
+    return J
 
 ###############################################################################
 
@@ -54,7 +102,27 @@ def f_WSL(t, C1, C2, C3, C4, C5):
         return C1 + C2 * abs(x) ** 1.5 + C3 * abs(x) ** 3.5
 
 def f_WSL_a(t_a, C1, C2, C3, C4, C5):
-    return list(map(lambda t: f_WSL(t, C1, C2, C3, C4, C5), t_a))
+    t_a = np.asarray(t_a, dtype=np.float64)
+    if np.ndim(C5 - C4) == 0 and C5 <= C4:
+        return np.full(t_a.shape, np.inf)
+    # Distance to the flat part (zero inside it)
+    x = np.maximum(C4 - t_a, 0.0) + np.maximum(t_a - C5, 0.0)
+    return np.where(C5 <= C4, np.inf, C1 + C2 * x ** 1.5 + C3 * x ** 3.5)
+
+def jac_WSL_a(t_a, C1, C2, C3, C4, C5):
+    t_a = np.asarray(t_a, dtype=np.float64)
+    x_left = np.maximum(C4 - t_a, 0.0)
+    x_right = np.maximum(t_a - C5, 0.0)
+    x = x_left + x_right
+    # d(model)/dx; x grows with C4 on the left wing and decreases with C5 on the right one
+    dx = 1.5 * C2 * np.sqrt(x) + 3.5 * C3 * x ** 2.5
+    J = np.empty(np.broadcast(t_a, C4, C5).shape + (5,))
+    J[..., 0] = 1.0
+    J[..., 1] = x ** 1.5
+    J[..., 2] = x ** 3.5
+    J[..., 3] = np.where(t_a < C4, dx, 0.0)
+    J[..., 4] = np.where(t_a > C5, -dx, 0.0)
+    return J
 
 ###############################################################################
 
@@ -65,7 +133,109 @@ def f_A(t, C1, C2, C3, C4):
         return C1 - C3 * (t - C4)
         
 def f_A_a(t_a, C1, C2, C3, C4):
-    return list(map(lambda t: f_A(t, C1, C2, C3, C4), t_a))
+    t_a = np.asarray(t_a, dtype=np.float64)
+    return np.where(t_a < C4, C1 + C2 * (t_a - C4), C1 - C3 * (t_a - C4))
+
+def jac_A_a(t_a, C1, C2, C3, C4):
+    # Needed for a correct fit of C4, not only for speed: the times are
+    # centered, so the initial C4 (the middle of the range) is about 1e-10, and
+    # the forward-difference step of curve_fit (sqrt(eps) * |C4|, about 1e-17)
+    # changes the model by less than the rounding of the magnitudes. The
+    # difference quotient of C4 is then 0 and C4 stays at its initial value,
+    # with a far too small uncertainty.
+    t_a = np.asarray(t_a, dtype=np.float64)
+    left = t_a < C4
+    J = np.empty(np.broadcast(t_a, C4).shape + (4,))
+    J[..., 0] = 1.0
+    J[..., 1] = np.where(left, t_a - C4, 0.0)
+    J[..., 2] = np.where(left, 0.0, C4 - t_a)
+    J[..., 3] = np.where(left, -C2, C3)
+    return J
+
+###############################################################################
+
+# Variable projection (separable least squares).
+# For fixed breakpoints C4, C5 the models are linear in C1, C2, C3:
+#   f(t) = C1 + C2 * g2(t) + C3 * g3(t)
+# so C1..C3 are found in closed form and only C4, C5 are searched on a grid.
+
+VARPRO_GRID = 25
+# Upper limit of (grid nodes) x (points) kept in memory at once
+VARPRO_CHUNK = 2000000
+
+def linear_basis(method, t_a, C4, C5):
+    # t_a: (N,); C4, C5: (P,) breakpoints. Returns g2, g3 of shape (P, N).
+    t_a = np.asarray(t_a, dtype=np.float64)[np.newaxis, :]
+    C4 = np.asarray(C4, dtype=np.float64)[:, np.newaxis]
+    C5 = np.asarray(C5, dtype=np.float64)[:, np.newaxis]
+    left = t_a < C4
+    right = t_a > C5
+    if method == "AP" or method == "WSAP":
+        D = (C5 - C4) / 2; v = t_a - (C5 + C4) / 2
+        g2 = np.where(left, (-2 * v - D) * D, np.where(right, (2 * v - D) * D, v * v))
+        if method == "AP":
+            g3 = v
+        else:
+            g3 = np.where(left, np.abs(t_a - C4) ** 1.5, 0.0) + np.where(right, np.abs(t_a - C5) ** 1.5, 0.0)
+    elif method == "WSL":
+        x = np.maximum(C4 - t_a, 0.0) + np.maximum(t_a - C5, 0.0)
+        g2 = x ** 1.5
+        g3 = x ** 3.5
+    elif method == "A":
+        g2 = np.where(left, t_a - C4, 0.0)
+        g3 = np.where(left, 0.0, C4 - t_a)
+    else:
+        raise Exception(f"Unsupported method: {method}")
+    return g2, g3
+
+def linear_solve(method, t_a, m_a, C4, C5):
+    # Batched least squares for C1..C3 at every (C4, C5) node.
+    # Returns C (P, 3) and the residual sums of squares (P,).
+    m_mean = np.mean(m_a)
+    y = np.asarray(m_a, dtype=np.float64) - m_mean
+    g2, g3 = linear_basis(method, t_a, C4, C5)
+    # Design matrix columns: 1, g2, g3
+    G = np.stack([np.ones_like(g2), g2, g3], axis=-1)
+    GtG = np.matmul(G.transpose(0, 2, 1), G)
+    Gty = np.matmul(G.transpose(0, 2, 1), y)
+    # An empty wing gives a zero column; its coefficient is then set to 0
+    diag = np.einsum('pii->pi', GtG)
+    diag[diag == 0.0] = 1.0
+    try:
+        C = np.linalg.solve(GtG, Gty[..., np.newaxis])[..., 0]
+    except np.linalg.LinAlgError:
+        C = np.matmul(np.linalg.pinv(GtG), Gty[..., np.newaxis])[..., 0]
+    # Residual sum of squares of the least-squares solution
+    rss = np.dot(y, y) - np.sum(C * Gty, axis=1)
+    C[:, 0] += m_mean
+    return C, rss
+
+def varpro_start(method, t_obs, m_obs, n_grid=VARPRO_GRID):
+    # Initial values from a coarse grid over the breakpoints
+    t_min = np.min(t_obs)
+    t_max = np.max(t_obs)
+    nodes = np.linspace(t_min, t_max, n_grid)
+    if method == "A":
+        C4 = nodes
+        C5 = nodes
+    else:
+        i4, i5 = np.triu_indices(n_grid, k=1)
+        C4 = nodes[i4]
+        C5 = nodes[i5]
+    chunk = max(1, VARPRO_CHUNK // max(1, len(t_obs)))
+    best_rss = np.inf
+    best = None
+    for i in range(0, len(C4), chunk):
+        C, rss = linear_solve(method, t_obs, m_obs, C4[i:i + chunk], C5[i:i + chunk])
+        k = np.nanargmin(rss) if np.any(np.isfinite(rss)) else None
+        if k is not None and rss[k] < best_rss:
+            best_rss = rss[k]
+            best = [C[k, 0], C[k, 1], C[k, 2], C4[i + k], C5[i + k]]
+    if best is None:
+        return None
+    if method == "A":
+        return best[:4]
+    return best
 
 ###############################################################################
 
@@ -73,10 +243,269 @@ def f_A_a(t_a, C1, C2, C3, C4):
 #XTOL=1e-8
 #GTOL=1e-8
 
-def approx(method, t_obs, m_obs, maxfev=12000):
+METHODS = ("AP", "WSAP", "WSL", "A")
+
+SOLVERS = ("lm", "varpro")
+
+# Maximal number of function evaluations for a warm-started fit;
+# a start close to the solution converges much faster than that.
+WARM_MAXFEV = 1000
+# Grid of the varpro start a warm fit is compared with (see _warm_ok)
+WARM_CHECK_GRID = 9
+
+# Escalation (escalate=True): a cheap Levenberg-Marquardt attempt with
+# STAGE_MAXFEV * (number of parameters + 1) evaluations, then a bounded
+# trust-region fit keeping C4 and C5 in [t_min, t_max], then bounded fits
+# from the varpro start and from MULTI_STARTS (C4, C5 as fractions of the window).
+# The bounded fits get STAGE_GROWTH times more evaluations than the first
+# stage (and no more than what is left of maxfev).
+STAGES = ("lm", "trf", "multistart")
+STAGE_MAXFEV = 200
+STAGE_GROWTH = 10
+MULTI_STARTS = [(0.1, 0.4), (0.6, 0.9), (0.25, 0.75), (0.4, 0.6), (0.05, 0.95)]
+MULTI_STARTS_A = [0.25, 0.75, 0.1, 0.9]
+
+class FitTimeout(RuntimeError):
+    # The time budget of the fit is exhausted (not kept in the fit cache:
+    # it depends on the load of the machine)
+    pass
+
+class _Limits:
+    # Counts the evaluations of a model and stops the fit at the deadline;
+    # reports every curve_fit attempt to the callback (see approx)
+    def __init__(self, deadline=None, callback=None):
+        self.deadline = deadline
+        self.callback = callback
+        self.nfev = 0
+
+    def wrap(self, func):
+        def limited(*args):
+            if self.deadline is not None and time.perf_counter() > self.deadline:
+                raise FitTimeout("The time budget of the fit is exhausted.")
+            self.nfev += 1
+            return func(*args)
+        return limited
+
+    def expired(self):
+        return self.deadline is not None and time.perf_counter() > self.deadline
+
+def approx(method, t_obs, m_obs, maxfev=12000, solver="lm", p0=None, fit_info=None, escalate=False,
+           time_budget=None, callback=None):
+    # solver: "lm" - Levenberg-Marquardt over all parameters from a fixed start;
+    #         "varpro" - grid search over C4/C5 with C1..C3 solved linearly,
+    #                    refined by Levenberg-Marquardt
+    # p0: initial values (warm start), e.g. the solution of a neighbouring window.
+    #     If the fit from p0 fails or is degenerate (see _warm_ok), the fit is
+    #     repeated from the solver's start.
+    # fit_info: optional dict receiving 'start' (the start that was used:
+    #     "cold", "varpro", "warm", "warm->cold" or "warm->varpro"), 'nfev'
+    #     and, with escalate, 'stage' (one of STAGES).
+    # escalate: fit in stages (see STAGES) until C4 < C5 lie in the window;
+    #     maxfev is then the total number of evaluations.
+    # time_budget: wall time limit of the fit, seconds (FitTimeout is raised
+    #     if no solution is found in time).
+    # callback: optional function called after every curve_fit attempt with
+    #     a dict: 'bounded', 'warm' (started from given values), 'status'
+    #     ("ok", "rejected": C4/C5 out of the window, "failed", "timeout"),
+    #     'nfev' and 'time' (seconds); e.g. to count the retries.
     if method != "AP" and method != "WSAP" and method != "WSL" and method != "A":
         raise Exception("Only AP, WSAP, WSL, and A methods are supported.")
+    if solver not in SOLVERS:
+        raise Exception(f"Unknown solver: {solver}")
+    if fit_info is None:
+        fit_info = {}
+    fit_info['nfev'] = 0
+    # scipy is imported with the first fit (the slowest import); before the
+    # deadline, so that the import does not count against the time budget
+    import scipy.optimize
+    limits = None
+    if time_budget is not None or escalate or callback is not None:
+        limits = _Limits(time.perf_counter() + time_budget if time_budget is not None else None, callback)
+
+    cold_start = "varpro" if solver == "varpro" else "cold"
+
+    if p0 is not None:
+        try:
+            params_opt, params_cov, param_warning, nfev = _approx(method, t_obs, m_obs,
+                                                                  min(maxfev, WARM_MAXFEV), solver, p0,
+                                                                  limits=limits)
+            fit_info['nfev'] += nfev
+            if _warm_ok(method, t_obs, m_obs, solver, (params_opt, params_cov, param_warning)):
+                fit_info['start'] = "warm"
+                if escalate:
+                    fit_info['stage'] = "lm"
+                return params_opt, params_cov, param_warning
+        except FitTimeout:
+            raise
+        except RuntimeError:
+            # Optimal parameters not found
+            fit_info['nfev'] += min(maxfev, WARM_MAXFEV)
+        cold_start = "warm->" + cold_start
+
+    fit_info['start'] = cold_start
+    if escalate:
+        return _approx_staged(method, t_obs, m_obs, maxfev, solver, limits, fit_info)
+    params_opt, params_cov, param_warning, nfev = _approx(method, t_obs, m_obs, maxfev, solver, None,
+                                                          limits=limits)
+    fit_info['nfev'] += nfev
+    return params_opt, params_cov, param_warning
+
+def _fit_ok(method, result):
+    params_opt, params_cov, param_warning = result
+    return param_warning is None and (method == "A" or params_opt[3] < params_opt[4])
+
+def _start_rss(method, t_obs, m_obs, solver):
+    # Residual sum of squares at the start of a cold fit: the varpro start
+    # (on a coarser grid: it is computed for every warm fit) or, as in
+    # _curve_fit, C2 = C3 = 0 (the mean magnitude)
+    if solver == "varpro":
+        t_c = t_obs - np.mean(t_obs)
+        p0 = varpro_start(method, t_c, m_obs, WARM_CHECK_GRID)
+        if p0 is not None:
+            return np.sum((m_obs - _model(method)(t_c, *p0)) ** 2)
+    return np.sum((m_obs - np.mean(m_obs)) ** 2)
+
+def _warm_ok(method, t_obs, m_obs, solver, result):
+    # A warm fit is kept only if it is not degenerate: no warning of the fit
+    # or of method_result, C5 - C4 larger than its uncertainty, and a
+    # residual sum of squares not larger than at the start of a cold fit.
+    # A neighbouring window's solution may lead curve_fit to C4 = C5.
+    if not _fit_ok(method, result):
+        return False
+    params_opt, params_cov, param_warning = result
+    with np.errstate(invalid="ignore", divide="ignore"):
+        if method_result(method, params_opt, params_cov, np.min(t_obs), np.max(t_obs))[6] is not None:
+            return False
+        if method != "A":
+            J = np.array([0.0, 0.0, 0.0, -1.0, 1.0])
+            if not params_opt[4] - params_opt[3] > np.sqrt(J @ params_cov @ J):
+                return False
+    t_obs = np.asarray(t_obs, dtype=np.float64)
+    m_obs = np.asarray(m_obs, dtype=np.float64)
+    mean_t = np.mean(t_obs)
+    params = np.array(params_opt, dtype=np.float64)
+    params[3:] -= mean_t
+    rss = np.sum((m_obs - _model(method)(t_obs - mean_t, *params)) ** 2)
+    return rss <= _start_rss(method, t_obs, m_obs, solver)
+
+def _approx_staged(method, t_obs, m_obs, maxfev, solver, limits, fit_info):
+    n_par = 4 if method == "A" else 5
+    nfev0 = limits.nfev
+    stage_maxfev = STAGE_MAXFEV * (n_par + 1)
+    def remaining():
+        return maxfev - fit_info['nfev'] - (limits.nfev - nfev0)
+
+    # Stage 1: cheap unbounded fit
+    start = None
+    try:
+        params_opt, params_cov, param_warning, nfev = _approx(method, t_obs, m_obs,
+                                                              min(remaining(), stage_maxfev),
+                                                              solver, None, limits=limits)
+        if _fit_ok(method, (params_opt, params_cov, param_warning)):
+            fit_info['stage'] = "lm"
+            fit_info['nfev'] += limits.nfev - nfev0
+            return params_opt, params_cov, param_warning
+        start = params_opt
+    except FitTimeout:
+        fit_info['nfev'] += limits.nfev - nfev0
+        raise
+    except (RuntimeError, ValueError):
+        pass
+
+    # Stage 2: bounded fit from the result of the first stage
+    best = None
+    best_cost = np.inf
+    stage = "trf"
+    starts = [start]
+    try:
+        for p0 in starts:
+            if remaining() <= 0:
+                break
+            try:
+                result = _approx(method, t_obs, m_obs, min(remaining(), STAGE_GROWTH * stage_maxfev), solver, p0,
+                                 limits=limits, bounded=True)
+            except FitTimeout:
+                raise
+            except (RuntimeError, ValueError):
+                continue
+            if _fit_ok(method, result[:3]):
+                best = result[:3]
+                break
+        # Stage 3: bounded fits from several starts; the best one is taken
+        if best is None:
+            stage = "multistart"
+            starts = _multi_starts(method, t_obs, m_obs)
+            for p0 in starts:
+                if remaining() <= 0:
+                    break
+                try:
+                    result = _approx(method, t_obs, m_obs, min(remaining(), STAGE_GROWTH * stage_maxfev), solver, p0,
+                                     limits=limits, bounded=True)
+                except FitTimeout:
+                    raise
+                except (RuntimeError, ValueError):
+                    continue
+                if not _fit_ok(method, result[:3]):
+                    continue
+                cost = np.sum((m_obs - _model(method)(t_obs, *result[0])) ** 2)
+                if cost < best_cost:
+                    best = result[:3]
+                    best_cost = cost
+    except FitTimeout:
+        if best is None:
+            fit_info['nfev'] += limits.nfev - nfev0
+            raise
+    fit_info['nfev'] += limits.nfev - nfev0
+    if best is None:
+        raise RuntimeError("Optimal parameters not found in the lm, trf and multistart stages.")
+    fit_info['stage'] = stage
+    return best
 
+def _model(method):
+    return {"AP": f_AP_a, "WSAP": f_WSAP_a, "WSL": f_WSL_a, "A": f_A_a}[method]
+
+def _multi_starts(method, t_obs, m_obs):
+    # Initial values (absolute time) of the multistart stage
+    t_min = min(t_obs)
+    t_max = max(t_obs)
+    C1 = np.mean(m_obs)
+    starts = []
+    if method == "A":
+        for f in MULTI_STARTS_A:
+            starts.append([C1, 0.0, 0.0, t_min + f * (t_max - t_min)])
+        return starts
+    mean_t = np.mean(t_obs)
+    p0 = varpro_start(method, t_obs - mean_t, m_obs)
+    if p0 is not None:
+        p0[3] += mean_t
+        p0[4] += mean_t
+        starts.append(p0)
+    for f4, f5 in MULTI_STARTS:
+        starts.append([C1, 0.0, 0.0, t_min + f4 * (t_max - t_min), t_min + f5 * (t_max - t_min)])
+    return starts
+
+def _approx(method, t_obs, m_obs, maxfev, solver, p0, limits=None, bounded=False):
+    # limits: _Limits of the fit (evaluation counter, deadline, callback)
+    # bounded: trust-region fit with C4 and C5 kept in [t_min, t_max]
+    if limits is None or limits.callback is None:
+        return _curve_fit(method, t_obs, m_obs, maxfev, solver, p0, limits, bounded)
+    start = time.perf_counter()
+    nfev0 = limits.nfev
+    status = "failed"
+    try:
+        result = _curve_fit(method, t_obs, m_obs, maxfev, solver, p0, limits, bounded)
+        status = "ok" if _fit_ok(method, result[:3]) else "rejected"
+        return result
+    except FitTimeout:
+        status = "timeout"
+        raise
+    finally:
+        limits.callback({'bounded': bounded, 'warm': p0 is not None, 'status': status,
+                         'nfev': limits.nfev - nfev0, 'time': time.perf_counter() - start})
+
+def _curve_fit(method, t_obs, m_obs, maxfev, solver, p0, limits=None, bounded=False):
+    # (scipy is imported with the first fit: it is the slowest import)
+    from scipy.optimize import curve_fit
     param_warning = None
     
     mean_t = np.mean(t_obs)
@@ -91,18 +520,46 @@ def approx(method, t_obs, m_obs, maxfev=12000):
     C3 = 0.0
     C4 = t_min + (t_max - t_min) / 3.0
     C5 = t_max - (t_max - t_min) / 3.0
+    if method == "A":
+        C4  = (t_max + t_min) / 2.0
+
+    if p0 is not None:
+        p0 = list(p0)
+        p0[3] = p0[3] - mean_t #C4
+        if len(p0) > 4:
+            p0[4] = p0[4] - mean_t #C5
+    elif solver == "varpro":
+        p0 = varpro_start(method, t_obs, m_obs)
+
+    fit_options = {'maxfev': maxfev}
+    if bounded:
+        n_par = 4 if method == "A" else 5
+        lower = np.full(n_par, -np.inf)
+        upper = np.full(n_par, np.inf)
+        lower[3:] = t_min
+        upper[3:] = t_max
+        if p0 is not None:
+            p0 = np.clip(np.asarray(p0, dtype=np.float64), lower, upper)
+        fit_options = {'max_nfev': maxfev, 'method': "trf", 'bounds': (lower, upper)}
     
     if method == "AP" or method == "WSAP" or method == "WSL":
+        if p0 is None:
+            p0 = [C1, C2, C3, C4, C5]
         if method == "AP":
             func = f_AP_a
+            jac = jac_AP_a
         elif method == "WSAP":
             func = f_WSAP_a
+            jac = jac_WSAP_a
         else:            
             func = f_WSL_a
-        params_opt, params_cov = curve_fit(func, t_obs, m_obs, p0=[C1, C2, C3, C4, C5],
-                                           maxfev=maxfev, 
-                                           #ftol=FTOL, xtol=XTOL, gtol=GTOL
-                                           )
+            jac = jac_WSL_a
+        if limits is not None:
+            func = limits.wrap(func)
+        params_opt, params_cov, infodict, mesg, ier = curve_fit(func, t_obs, m_obs, p0=p0,
+                                                                jac=jac, full_output=True,
+                                                                #ftol=FTOL, xtol=XTOL, gtol=GTOL
+                                                                **fit_options)
         #print(params_cov)
         #print(params_opt)
         C1, C2, C3, C4, C5 = params_opt
@@ -120,15 +577,19 @@ def approx(method, t_obs, m_obs, maxfev=12000):
         params_opt[3] = params_opt[3] + mean_t #C4
         params_opt[4] = params_opt[4] + mean_t #C5
     elif method == "A":
-        C4  = (t_max + t_min) / 2.0
-        params_opt, params_cov = curve_fit(f_A_a, t_obs, m_obs, p0=[C1, C2, C3, C4],
-                                           maxfev=maxfev, 
-                                           #ftol=FTOL, xtol=XTOL, gtol=GTOL
-                                           )
+        if p0 is None:
+            p0 = [C1, C2, C3, C4]
+        func = f_A_a
+        if limits is not None:
+            func = limits.wrap(func)
+        params_opt, params_cov, infodict, mesg, ier = curve_fit(func, t_obs, m_obs, p0=p0,
+                                                                jac=jac_A_a, full_output=True,
+                                                                #ftol=FTOL, xtol=XTOL, gtol=GTOL
+                                                                **fit_options)
         params_opt[3] = params_opt[3] + mean_t #C4
     else:
         raise Exception(f"Unknown mapproximation ethod: {method}")
-    return params_opt, params_cov, param_warning
+    return params_opt, params_cov, param_warning, infodict['nfev']
 
 def method_result(method, params_opt, params_cov, t_min, t_max):
     warning = None
@@ -0,0 +1,140 @@
+import os
+import json
+import numpy as np
+
+# Light curve loading with a binary sidecar cache.
+# The cache keeps the sorted time, magnitude and error columns as one
+# (3, N) float64 .npy array next to the data file; it is opened memory-mapped
+# (zero-copy). A small JSON file holds the key: modification time and size
+# of the source file. Files without the error column get NaN errors.
+
+# 2: parsed with numpy (correctly rounded) instead of pandas
+CACHE_VERSION = 2
+CACHE_SUFFIX = ".lccache"
+
+###############################################################################
+
+def read_light_curve(file_name):
+    # Parses the whitespace-separated text file: time, magnitude, [error, ...]
+    # (numpy's parser with the columns of the first data line; files with
+    # a missing or non-numeric error column in some of the lines are read
+    # line by line)
+    fields = _first_fields(file_name)
+    try:
+        if len(fields) > 2 and _is_number(fields[2]):
+            data = np.loadtxt(file_name, comments='#', usecols=(0, 1, 2), ndmin=2, dtype=np.float64)
+            return data[:, 0].copy(), data[:, 1].copy(), data[:, 2].copy()
+        # Two columns in every line (or a non-numeric third column): no errors
+        usecols = (0, 1) if len(fields) > 2 else None
+        data = np.loadtxt(file_name, comments='#', usecols=usecols, ndmin=2, dtype=np.float64)
+        if data.shape[1] != 2:
+            raise ValueError("time and magnitude expected")
+        return data[:, 0].copy(), data[:, 1].copy(), np.full(len(data), np.nan)
+    except ValueError:
+        return _read_light_curve_lines(file_name)
+
+def _first_fields(file_name):
+    # The fields of the first data line
+    with open(file_name, "r") as f:
+        for line in f:
+            fields = line.split("#", 1)[0].split()
+            if len(fields) > 0:
+                return fields
+    return []
+
+def _is_number(text):
+    try:
+        float(text)
+        return True
+    except ValueError:
+        return False
+
+def _read_light_curve_lines(file_name):
+    times = []
+    mags = []
+    errs = []
+    with open(file_name, "r") as f:
+        for n, line in enumerate(f, 1):
+            fields = line.split("#", 1)[0].split()
+            if len(fields) == 0:
+                continue
+            try:
+                times.append(float(fields[0]))
+                mags.append(float(fields[1]))
+            except (ValueError, IndexError):
+                raise Exception(f"{file_name}, line {n}: time and magnitude expected")
+            errs.append(fields[2] if len(fields) > 2 else "nan")
+    try:
+        err = np.array(errs, dtype=np.float64)
+    except ValueError:
+        # No (numeric) error column
+        err = np.full(len(times), np.nan)
+    return np.array(times, dtype=np.float64), np.array(mags, dtype=np.float64), err
+
+def sort_light_curve(t_obs, m_obs, err_obs):
+    # Sort by times (ties by magnitude, like sorting the (time, mag) pairs)
+    order = np.lexsort((m_obs, t_obs))
+    return t_obs[order], m_obs[order], err_obs[order]
+
+###############################################################################
+
+def cache_paths(file_name):
+    return file_name + CACHE_SUFFIX + ".npy", file_name + CACHE_SUFFIX + ".json"
+
+def _cache_key(file_name):
+    st = os.stat(file_name)
+    return {'version': CACHE_VERSION, 'mtime_ns': st.st_mtime_ns, 'size': st.st_size}
+
+def load_cache(file_name):
+    # Returns memory-mapped (t, m, err) or None if the cache is missing or stale
+    npy_name, key_name = cache_paths(file_name)
+    try:
+        with open(key_name, "r") as f:
+            key = json.load(f)
+        if key != _cache_key(file_name):
+            return None
+        data = np.asarray(np.load(npy_name, mmap_mode='r'))
+    except (OSError, ValueError):
+        return None
+    if data.ndim != 2 or data.shape[0] != 3:
+        return None
+    return data[0], data[1], data[2]
+
+def _replace_file(file_name, write):
+    tmp_name = file_name + ".tmp"
+    with open(tmp_name, "wb") as f:
+        write(f)
+    os.replace(tmp_name, file_name)
+
+def build_cache(file_name):
+    # Parses the file and writes the cache. Returns sorted (t, m, err).
+    key = _cache_key(file_name)
+    t_obs, m_obs, err_obs = sort_light_curve(*read_light_curve(file_name))
+    npy_name, key_name = cache_paths(file_name)
+    data = np.stack([t_obs, m_obs, err_obs])
+    _replace_file(npy_name, lambda f: np.save(f, data))
+    _replace_file(key_name, lambda f: f.write(json.dumps(key).encode("utf-8")))
+    return t_obs, m_obs, err_obs
+
+def clear_cache(file_name):
+    removed = False
+    for name in cache_paths(file_name):
+        if os.path.exists(name):
+            os.remove(name)
+            removed = True
+    return removed
+
+###############################################################################
+
+def load_light_curve(file_name, use_cache=True):
+    # Returns the time, magnitude and error arrays sorted by time
+    if use_cache:
+        data = load_cache(file_name)
+        if data is not None:
+            return data
+        try:
+            return build_cache(file_name)
+        except OSError:
+            # E.g. read-only data directory: work without the cache
+            pass
+    return sort_light_curve(*read_light_curve(file_name))
@@ -0,0 +1,120 @@
+import io
+import base64
+
+# Preview rendering for the batch mode.
+# One Agg figure is kept per process (and per mode); for every window its
+# artists are updated and the figure is saved to PNG, instead of creating
+# and configuring a new figure each time. Only the Agg canvas is used, so
+# it works in worker processes without a display.
+
+PREVIEW_MODES = ("full", "thumbnail", "none")
+
+# Figure size (inches), dpi and font size of the modes
+_MODE_SETTINGS = {
+    "full": ((8, 5), 100, 12),
+    "thumbnail": ((4, 2.5), 60, 8),
+}
+
+_renderers = {}
+
+###############################################################################
+
+class PreviewRenderer:
+    def __init__(self, mode="full", inverseY=True):
+        from matplotlib import rc_context
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.patches import Rectangle
+        if mode not in _MODE_SETTINGS:
+            raise Exception(f"Unsupported preview mode: {mode}")
+        figsize, self.dpi, font_size = _MODE_SETTINGS[mode]
+        self.rc = {"font.family": "serif", "font.size": font_size}
+        with rc_context(self.rc):
+            self.fig = Figure(figsize=figsize, dpi=self.dpi)
+            FigureCanvasAgg(self.fig)
+            ax = self.fig.add_subplot()
+            self.ax = ax
+            if inverseY:
+                ax.invert_yaxis()
+            marker_size = 6 if mode == "full" else 3
+            self.points, = ax.plot([], [], 'o', color="blue", markersize=marker_size, linestyle='none')
+            self.curve, = ax.plot([], [], color='green', linewidth=2)
+            self.c4_line = ax.axvline(x=0, color='maroon', linewidth=1)
+            self.c5_line = ax.axvline(x=0, color='maroon', linewidth=1)
+            self.rect = Rectangle((0, 0), 0, 0, linewidth=2, edgecolor='r', facecolor='none')
+            ax.add_patch(self.rect)
+            self.t_bar, = ax.plot([], [], 'r-', linewidth=2)
+            self.m_bar, = ax.plot([], [], 'r-', linewidth=2)
+            self.extremum, = ax.plot([], [], 'o', markersize=4, color='red')
+            self.title = ax.set_title("", fontsize=10 if mode == "full" else 7, color="red")
+
+    def render(self, t_obs, m_obs,
+               t_array, y_array_fit,
+               C4, C5,
+               time_of_extremum, time_extr_sig,
+               mag_of_extremum, mag_extr_sig,
+               info_message):
+        # Returns the PNG image (bytes)
+        self.points.set_data(t_obs, m_obs)
+        if t_array is not None:
+            self.curve.set_data(t_array, y_array_fit)
+        else:
+            self.curve.set_data([], [])
+        for line, x in ((self.c4_line, C4), (self.c5_line, C5)):
+            line.set_visible(x is not None)
+            if x is not None:
+                line.set_xdata([x, x])
+
+        has_box = (time_of_extremum is not None and time_extr_sig is not None and
+                   mag_of_extremum is not None and mag_extr_sig is not None)
+        self.rect.set_visible(has_box)
+        self.t_bar.set_visible(has_box)
+        self.m_bar.set_visible(has_box)
+        if has_box:
+            self.rect.set_bounds(time_of_extremum - time_extr_sig, mag_of_extremum - mag_extr_sig,
+                                 2 * time_extr_sig, 2 * mag_extr_sig)
+            self.t_bar.set_data([time_of_extremum - time_extr_sig, time_of_extremum + time_extr_sig],
+                                [mag_of_extremum, mag_of_extremum])
+            self.m_bar.set_data([time_of_extremum, time_of_extremum],
+                                [mag_of_extremum - mag_extr_sig, mag_of_extremum + mag_extr_sig])
+        if time_of_extremum is not None and mag_of_extremum is not None:
+            self.extremum.set_data([time_of_extremum], [mag_of_extremum])
+        else:
+            self.extremum.set_data([], [])
+        self.title.set_text(info_message if info_message is not None else "")
+
+        self.ax.relim(visible_only=True)
+        self.ax.autoscale_view()
+
+        from matplotlib import rc_context
+        buf = io.BytesIO()
+        with rc_context(self.rc):
+            self.fig.savefig(buf, format='png', dpi=self.dpi, bbox_inches='tight')
+        image = buf.getvalue()
+        buf.close()
+        return image
+
+def get_renderer(mode="full", inverseY=True):
+    # The renderer of the current process for the given mode
+    key = (mode, bool(inverseY))
+    if key not in _renderers:
+        _renderers[key] = PreviewRenderer(mode, inverseY)
+    return _renderers[key]
+
+def render(mode, inverseY, *args):
+    # Renders a window with the arguments of PreviewRenderer.render;
+    # returns None in the "none" mode
+    if mode == "none":
+        return None
+    return get_renderer(mode, inverseY).render(*args)
+
+def encode(image):
+    # PNG bytes -> base64 string for inline <img> tags
+    return base64.b64encode(image).decode('utf-8')
+
+###############################################################################
+
+def parse_result_method(method_field):
+    # "AP WARNING! message" -> ("AP", "message")
+    method, sep, warning = method_field.partition(" WARNING! ")
+    return method.strip(), (warning if sep else None)
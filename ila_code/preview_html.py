@@ -0,0 +1,172 @@
+import os
+import html
+from . import preview
+
+# HTML preview output of the batch mode.
+# "inline": one HTML file with the images embedded as base64 (as before).
+# "pages": the images are written as PNG files into the FILE_files directory
+# next to the preview file, together with numbered HTML pages of page_size
+# windows each (<img loading="lazy">). The preview file itself becomes an
+# index with one summary line per window linking to its page.
+# Every file is opened once and written through its buffer.
+# state() gives the position after the written windows; a writer created
+# with resume=state continues the files from there (--resume).
+
+PREVIEW_FORMATS = ("inline", "pages")
+PAGE_SIZE = 100
+
+# Columns of the index page
+SUMMARY_KEYS = [
+    'Method',
+    'Points',
+    'Start Time',
+    'End Time',
+    'Sigma',
+    'Time of Extremum (TOM)',
+    'TOM Uncertainty',
+    'Magnitude',
+    'Magnitude Uncertainty'
+    ]
+
+###############################################################################
+
+def sidecar_dir(file_name):
+    root, ext = os.path.splitext(file_name)
+    return root + "_files"
+
+def _page_name(page_no):
+    return f"page{page_no:04d}.html"
+
+def _image_name(n):
+    return f"{n:06d}.png"
+
+def _open_at(file_name, offset):
+    # Opens the file for writing at offset, dropping the rest of it
+    f = open(file_name, "r+")
+    f.truncate(offset)
+    f.seek(offset)
+    return f
+
+class PreviewWriter:
+    def __init__(self, file_name, preview_format="inline", page_size=PAGE_SIZE, resume=None):
+        if preview_format not in PREVIEW_FORMATS:
+            raise Exception(f"Unsupported preview format: {preview_format}")
+        if page_size < 1:
+            raise Exception("The page size must be positive")
+        self.preview_format = preview_format
+        self.page_size = page_size
+        self.n = 0
+        self.page = None
+        self.page_no = 0
+        if preview_format == "pages":
+            self.dir_name = sidecar_dir(file_name)
+        if resume is not None:
+            self._resume(file_name, resume)
+            return
+        self.f = open(file_name, "w")
+        self.f.write("<html><body>\n")
+        self.f.write("<h2>Preview</h2>\n")
+        if preview_format == "inline":
+            self.f.write("<hr>\n")
+        else:
+            os.makedirs(self.dir_name, exist_ok=True)
+            self.f.write("<table border='1' cellspacing='0' cellpadding='2'>\n")
+            self.f.write("<tr><th>#</th>" + "".join(f"<th>{html.escape(k)}</th>" for k in SUMMARY_KEYS) +
+                         "<th>Status</th></tr>\n")
+
+    def _resume(self, file_name, state):
+        if state['format'] != self.preview_format:
+            raise Exception("The preview format differs from the interrupted run")
+        self.n = state['n']
+        self.f = _open_at(file_name, state['offset'])
+        if self.preview_format == "pages":
+            self.page_no = state['page_no']
+            if self.page_no > 0:
+                self.page = _open_at(os.path.join(self.dir_name, _page_name(self.page_no)), state['page_offset'])
+
+    def flush(self):
+        self.f.flush()
+        os.fsync(self.f.fileno())
+        if self.page is not None:
+            self.page.flush()
+            os.fsync(self.page.fileno())
+
+    def state(self):
+        # Position after the windows written so far (call flush() first)
+        state = {'format': self.preview_format, 'n': self.n, 'offset': self.f.tell()}
+        if self.preview_format == "pages":
+            state['page_no'] = self.page_no
+            state['page_offset'] = self.page.tell() if self.page is not None else 0
+        return state
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def add(self, text, image=None, info=None, status=None):
+        # text: description of the window; image: PNG bytes or None;
+        # info: the info dict of the window (index summary);
+        # status: None if OK, otherwise the warning or the failure message
+        self.n += 1
+        if self.preview_format == "inline":
+            self.f.write(f"<p>{html.escape(text)}</p>\n")
+            if image is not None:
+                self.f.write(f"<img src='data:image/png;base64,{preview.encode(image)}'><br><br>\n")
+            self.f.write("<hr>\n")
+            return
+
+        if (self.n - 1) % self.page_size == 0:
+            self._next_page()
+        anchor = f"w{self.n}"
+        self.page.write(f"<p id='{anchor}'>[{self.n}] {html.escape(text)}</p>\n")
+        if image is not None:
+            image_name = _image_name(self.n)
+            with open(os.path.join(self.dir_name, image_name), "wb") as f_image:
+                f_image.write(image)
+            self.page.write(f"<img src='{image_name}' loading='lazy'><br><br>\n")
+        self.page.write("<hr>\n")
+
+        link = f"{os.path.basename(self.dir_name)}/{_page_name(self.page_no)}#{anchor}"
+        cells = [f"<a href='{html.escape(link)}'>{self.n}</a>"]
+        for k in SUMMARY_KEYS:
+            value = info.get(k) if info is not None else None
+            cells.append(html.escape("" if value is None else str(value)))
+        cells.append(html.escape("OK" if status is None else status))
+        self.f.write("<tr>" + "".join(f"<td>{c}</td>" for c in cells) + "</tr>\n")
+
+    def _page_links(self, has_next):
+        links = ["<a href='../" + html.escape(os.path.basename(self.f.name)) + "'>Index</a>"]
+        if self.page_no > 1:
+            links.append(f"<a href='{_page_name(self.page_no - 1)}'>Previous</a>")
+        if has_next:
+            links.append(f"<a href='{_page_name(self.page_no + 1)}'>Next</a>")
+        return "<p>" + " | ".join(links) + "</p>\n"
+
+    def _close_page(self, has_next):
+        if self.page is not None:
+            self.page.write(self._page_links(has_next))
+            self.page.write("</body></html>")
+            self.page.close()
+            self.page = None
+
+    def _next_page(self):
+        self._close_page(True)
+        self.page_no += 1
+        self.page = open(os.path.join(self.dir_name, _page_name(self.page_no)), "w")
+        self.page.write("<html><body>\n")
+        self.page.write(f"<h2>Preview, page {self.page_no}</h2>\n")
+        self.page.write(self._page_links(False))
+        self.page.write("<hr>\n")
+
+    def close(self):
+        if self.f is None:
+            return
+        if self.preview_format == "pages":
+            self._close_page(False)
+            self.f.write("</table>\n")
+        self.f.write("<p>End of file</p>\n")
+        self.f.write("\n</body></html>")
+        self.f.close()
+        self.f = None
@@ -0,0 +1,113 @@
+import json
+import time
+from contextlib import contextmanager
+
+# Instrumentation of the batch mode (--profile, --profile-trace).
+# The stages of a window are timed where the window is fitted (possibly in a
+# worker process) and kept in record['profile'] (batch.fit_range with
+# profile=True):
+#   fit        ila.approx (or the share of the stacked solver block)
+#   covariance ila.method_result and the parameter errors
+#   curve      the model at the points and the plotted curve (utils)
+#   resample   the resampled refits (--resample)
+#   render     the preview image (PNG encoding)
+# with the curve_fit attempts of the fit (the callback of ila.approx:
+# the retries are the attempts after the first one). The stages of the main
+# process (load, ranges, result, preview, checkpoint) are timed with
+# Profiler.stage(). Profiler.window() adds a record to the totals and writes
+# its trace line (JSON lines, trace_file) and passes it to the callback.
+# With --jobs the window stages are summed over the workers (their share
+# of the wall time may exceed 100 %). Without a profiler none of this is done.
+
+###############################################################################
+
+def window_profile():
+    # The record['profile'] of a window being fitted
+    return {'times': {}, 'attempts': []}
+
+def lap(profile, stage, start):
+    # Adds the time since start to the stage of a window profile;
+    # returns the current time
+    now = time.perf_counter()
+    times = profile['times']
+    times[stage] = times.get(stage, 0.0) + now - start
+    return now
+
+class Profiler:
+    def __init__(self, trace_file=None, callback=None):
+        # callback: called with every trace record (a dict)
+        self.start = time.perf_counter()
+        self.times = {}
+        self.calls = {}
+        self.counters = {}
+        self.callback = callback
+        self.trace = open(trace_file, "w") if trace_file is not None else None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def add(self, stage, seconds, calls=1):
+        self.times[stage] = self.times.get(stage, 0.0) + seconds
+        self.calls[stage] = self.calls.get(stage, 0) + calls
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def window(self, record, range_no, status):
+        # Adds the profile of a fitted record; status: result_sink.record_status
+        profile = record.get('profile') or window_profile()
+        fit_info = record['fit_info']
+        for stage, seconds in profile['times'].items():
+            self.add(stage, seconds)
+        attempts = profile['attempts']
+        self.count("windows")
+        self.count("status " + status)
+        self.count("nfev", fit_info.get('nfev') or 0)
+        self.count("attempts", len(attempts))
+        self.count("retries", max(0, len(attempts) - 1))
+        if fit_info.get('cache') is not None:
+            self.count("fit cache " + fit_info['cache'])
+        if record['image'] is not None:
+            self.count("image bytes", len(record['image']))
+        if self.trace is None and self.callback is None:
+            return
+        trace = {'range': range_no, 'method': record['method'], 'points': record['info']['Points'],
+                 'status': status, 'start': fit_info.get('start'), 'stage': fit_info.get('stage'),
+                 'nfev': fit_info.get('nfev'), 'cache': fit_info.get('cache'),
+                 'attempts': [[a['status'], a['nfev'], a['time']] for a in attempts],
+                 'times': profile['times'],
+                 'image_bytes': len(record['image']) if record['image'] is not None else 0}
+        if self.trace is not None:
+            self.trace.write(json.dumps(trace) + "\n")
+        if self.callback is not None:
+            self.callback(trace)
+
+    def summary(self):
+        # Lines of the summary table
+        total = time.perf_counter() - self.start
+        lines = ["Stage\tCalls\tTime, s\tPer call, ms\tShare"]
+        for stage in sorted(self.times, key=lambda k: -self.times[k]):
+            seconds = self.times[stage]
+            calls = self.calls[stage]
+            lines.append(f"{stage}\t{calls}\t{seconds:.3f}\t{seconds / calls * 1000:.3f}\t{seconds / total:.1%}")
+        lines.append(f"total (wall)\t\t{total:.3f}")
+        lines.append("Counter\tValue")
+        for name in sorted(self.counters):
+            lines.append(f"{name}\t{self.counters[name]}")
+        return lines
+
+    def close(self):
+        if self.trace is not None:
+            self.trace.close()
+            self.trace = None
@@ -0,0 +1,102 @@
+import zlib
+import numpy as np
+from . import ila
+from . import stacked
+
+# Resampling uncertainties of the extremum (--resample).
+# The linear propagation of the covariance (ila.method_result) is unreliable
+# when C2 is close to 0 (AP divides by C2) or the fit is close to the
+# breakpoints; the resampled fits give percentile intervals instead.
+# "bootstrap": the fitted curve plus the residuals drawn with replacement
+# (scaled by sqrt(N / (N - number of parameters)));
+# "montecarlo": the fitted curve plus Gaussian noise of the error column.
+# The replicates of a window are fitted together by the stacked
+# Levenberg-Marquardt solver (RESAMPLE_BLOCK at a time), starting from the
+# fit of the data; the windows themselves are distributed over the worker
+# processes as usual (--jobs).
+# The random numbers of a window depend on the seed and the window only,
+# so the intervals do not depend on the number of jobs.
+
+RESAMPLE_MODES = ("bootstrap", "montecarlo")
+N_RESAMPLES = 200
+SEED = 1
+RESAMPLE_BLOCK = 256
+# The central 68.27 % (1 sigma) of the resampled values
+PERCENTILES = (15.865, 84.135)
+
+###############################################################################
+
+def _rng(seed, t_obs, m_obs):
+    return np.random.default_rng([seed, zlib.crc32(np.ascontiguousarray(t_obs).tobytes()),
+                                  zlib.crc32(np.ascontiguousarray(m_obs).tobytes())])
+
+def resampled_magnitudes(mode, m_obs, m_fit, err_obs, n_par, n, rng):
+    # Returns (n, len(m_obs)) resampled magnitudes
+    n_points = len(m_obs)
+    if mode == "bootstrap":
+        residuals = m_obs - m_fit
+        if n_points > n_par:
+            residuals = residuals * np.sqrt(n_points / (n_points - n_par))
+        return m_fit + residuals[rng.integers(0, n_points, size=(n, n_points))]
+    if mode == "montecarlo":
+        if err_obs is None or not np.all(np.isfinite(err_obs) & (err_obs > 0)):
+            raise Exception("Monte Carlo resampling requires positive errors (the third column of the data file)")
+        return m_fit + err_obs * rng.standard_normal((n, n_points))
+    raise Exception(f"Unsupported resampling mode: {mode}")
+
+def extremum_samples(method, P):
+    # Vectorized extremum of ila.method_result: P (n, n_par) parameters.
+    # Returns the times and magnitudes of the extremum (NaN where the
+    # extremum is not determined, e.g. out of the parabolic part).
+    C1 = P[:, 0]
+    C4 = P[:, 3]
+    if method == "A":
+        return C4.copy(), C1.copy()
+    C5 = P[:, 4]
+    tom = (C4 + C5) / 2.0
+    mag = C1.copy()
+    if method == "AP":
+        C2 = P[:, 1]
+        C3 = P[:, 2]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            tom = tom - C3 / C2 / 2.0
+            mag = C1 - (C3 * C3) / (4 * C2)
+    if method == "AP" or method == "WSAP":
+        outside = ~((C4 <= tom) & (tom <= C5))
+        tom[outside] = np.nan
+        mag[outside] = np.nan
+    return tom, mag
+
+def resample_fit(method, t_obs, m_obs, params_opt, mode, n=N_RESAMPLES, seed=SEED, err_obs=None,
+                 maxfev=ila.WARM_MAXFEV):
+    # Refits n resampled copies of the window, starting from params_opt.
+    # Returns the times and magnitudes of the extremum of the replicates
+    # that were fitted without warnings (NaN for the others).
+    t_obs = np.asarray(t_obs, dtype=np.float64)
+    m_obs = np.asarray(m_obs, dtype=np.float64)
+    rng = _rng(seed, t_obs, m_obs)
+    m_fit = ila._model(method)(t_obs, *params_opt)
+    params_opt = np.asarray(params_opt, dtype=np.float64)
+    n_par = len(params_opt)
+    P = np.full((n, n_par), np.nan)
+    for start in range(0, n, RESAMPLE_BLOCK):
+        count = min(RESAMPLE_BLOCK, n - start)
+        Y = resampled_magnitudes(mode, m_obs, m_fit, err_obs, n_par, count, rng)
+        results = stacked.approx_stacked(method, [(t_obs, y) for y in Y], maxfev=maxfev,
+                                         p0=[params_opt] * count)
+        for k, result in enumerate(results):
+            if isinstance(result, Exception) or result[2] is not None:
+                continue
+            P[start + k] = result[0]
+    if method != "A":
+        P[~(P[:, 3] < P[:, 4])] = np.nan
+    return extremum_samples(method, P)
+
+def percentile_interval(values):
+    # (low, high) of PERCENTILES of the finite values; NaN if there are
+    # fewer than two of them
+    values = values[np.isfinite(values)]
+    if len(values) < 2:
+        return np.nan, np.nan
+    low, high = np.percentile(values, PERCENTILES)
+    return low, high
@@ -0,0 +1,276 @@
+import os
+import csv
+import json
+import math
+from . import batch
+
+# Result output of the batch mode.
+# A sink keeps its file open for the whole run and writes the rows in
+# batches of batch_size.
+# "text": the original tab-separated format (warnings and failures are
+# written in the Method column).
+# "tsv", "csv", "jsonl", "parquet": typed columns (COLUMNS) with a separate
+# status and warning, one row per range and method (null: not determined).
+# "auto": chosen by the file extension (.csv, .jsonl, .parquet), otherwise text.
+# Parquet output requires pyarrow.
+# offset() is the file position after the flushed rows; a sink created with
+# resume=offset drops anything after it and appends (--resume; not
+# available for parquet).
+# The structured sinks take the list of columns (e.g. SURVEY_COLUMNS:
+# the results of many data files in one table).
+
+RESULT_FORMATS = ("auto", "text", "tsv", "csv", "jsonl", "parquet")
+BATCH_SIZE = 256
+
+# Status values
+STATUS_OK = "OK"
+STATUS_WARNING = "WARNING"
+STATUS_FAILED = "FAILED"
+
+# Columns of the structured formats: (name, type)
+COLUMNS = [
+    ('Range', int),
+    ('Method', str),
+    ('Status', str),
+    ('Warning', str),
+    ('Points', int),
+    ('Start Time', float),
+    ('End Time', float),
+    ('Sigma', float),
+    ('Time of Extremum (TOM)', float),
+    ('TOM Uncertainty', float),
+    ('Magnitude', float),
+    ('Magnitude Uncertainty', float),
+    ('TOM Low', float),
+    ('TOM High', float),
+    ('Magnitude Low', float),
+    ('Magnitude High', float),
+    ('Resamples', int),
+    ('C1', float),
+    ('C2', float),
+    ('C3', float),
+    ('C4', float),
+    ('C4 Uncertainty', float),
+    ('C5', float),
+    ('C5 Uncertainty', float),
+    ('Eclipse Duration', float),
+    ('Eclipse Duration Uncertainty', float),
+    ('AIC', float),
+    ('BIC', float),
+    ('Selected', int),
+    ('Start', str),
+    ('NFEV', int),
+    ('Stage', str),
+    ('Fit Time', float)
+    ]
+
+# Columns of the aggregated table of the survey mode
+SURVEY_COLUMNS = [('File', str)] + COLUMNS
+
+_EXTENSIONS = {
+    ".tsv": "tsv",
+    ".csv": "csv",
+    ".jsonl": "jsonl",
+    ".parquet": "parquet"
+    }
+
+###############################################################################
+
+def result_format(file_name, fmt="auto"):
+    if fmt != "auto":
+        return fmt
+    return _EXTENSIONS.get(os.path.splitext(file_name)[1].lower(), "text")
+
+def _typed(value, t):
+    if value is None:
+        return None
+    if t is float:
+        return float(value)
+    if t is int:
+        return int(value)
+    return str(value)
+
+def record_status(record):
+    # (status, warning message) of a record
+    if record['failed'] is not None:
+        message = record['failed']
+        if message.startswith("Failed: "):
+            message = message[len("Failed: "):]
+        return STATUS_FAILED, message
+    if record['param_warning'] is not None:
+        return STATUS_WARNING, record['param_warning']
+    return STATUS_OK, None
+
+def _open_result(file_name, resume, newline=None):
+    # New file, or the file truncated at the resume offset
+    if resume is None:
+        return open(file_name, "w", newline=newline)
+    f = open(file_name, "r+", newline=newline)
+    f.truncate(resume)
+    f.seek(resume)
+    return f
+
+def structured_row(record, range_no, columns=COLUMNS, values=None):
+    # values: the columns not taken from the record (e.g. File)
+    info = record['info']
+    status, warning = record_status(record)
+    row = {}
+    for name, t in columns:
+        if values is not None and name in values:
+            value = values[name]
+        elif name == 'Range':
+            value = range_no
+        elif name == 'Method':
+            value = record['method']
+        elif name == 'Status':
+            value = status
+        elif name == 'Warning':
+            value = warning
+        else:
+            value = info.get(name)
+        row[name] = _typed(value, t)
+    return row
+
+def json_row(row):
+    # NaN and infinity are not valid JSON: written as null
+    return {k: (None if isinstance(v, float) and not math.isfinite(v) else v) for k, v in row.items()}
+
+###############################################################################
+
+class ResultSink:
+    def __init__(self, file_name, batch_size=BATCH_SIZE, columns=COLUMNS):
+        self.file_name = file_name
+        self.batch_size = batch_size
+        self.columns = columns
+        self.rows = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write(self, record, range_no):
+        self.write_row(self.make_row(record, range_no))
+
+    def write_row(self, row):
+        # A row made with make_row() (e.g. in a worker process)
+        self.rows.append(row)
+        if len(self.rows) >= self.batch_size:
+            self.flush()
+
+    def make_row(self, record, range_no):
+        return structured_row(record, range_no, self.columns)
+
+    def flush(self):
+        if len(self.rows) > 0:
+            self.write_rows(self.rows)
+            self.rows = []
+
+    def close(self):
+        self.flush()
+        self.close_file()
+
+    def offset(self):
+        # Flushes the rows to the disk and returns the file position
+        self.flush()
+        self.f.flush()
+        os.fsync(self.f.fileno())
+        return self.f.tell()
+
+class TextSink(ResultSink):
+    # The original format; the columns depend on the run options
+    def __init__(self, file_name, method, fit_info=False, params=False, selection=False, batch_size=BATCH_SIZE,
+                 resume=None, resample=False):
+        super().__init__(file_name, batch_size)
+        self.method = method
+        self.options = (fit_info, params, selection, resample)
+        self.f = _open_result(file_name, resume)
+        if resume is None:
+            self.f.write("\t".join(batch.result_keys(method, *self.options)) + "\n")
+
+    def make_row(self, record, range_no):
+        if record['failed'] is not None:
+            return record['header'] + "\t" + record['failed']
+        info_str, info_str2 = batch.format_result(record['method'], record['info'], *self.options)
+        return info_str
+
+    def write_rows(self, rows):
+        self.f.write("".join(row + "\n" for row in rows))
+        self.f.flush()
+
+    def close_file(self):
+        self.f.close()
+
+class DelimitedSink(ResultSink):
+    def __init__(self, file_name, delimiter, batch_size=BATCH_SIZE, resume=None, columns=COLUMNS):
+        super().__init__(file_name, batch_size, columns)
+        self.f = _open_result(file_name, resume, newline="")
+        self.writer = csv.writer(self.f, delimiter=delimiter, lineterminator="\n")
+        if resume is None:
+            self.writer.writerow([name for name, t in columns])
+
+    def write_rows(self, rows):
+        self.writer.writerows([["" if row[name] is None else row[name] for name, t in self.columns] for row in rows])
+        self.f.flush()
+
+    def close_file(self):
+        self.f.close()
+
+class JsonLinesSink(ResultSink):
+    def __init__(self, file_name, batch_size=BATCH_SIZE, resume=None, columns=COLUMNS):
+        super().__init__(file_name, batch_size, columns)
+        self.f = _open_result(file_name, resume)
+
+    def write_rows(self, rows):
+        self.f.write("".join(json.dumps(json_row(row)) + "\n" for row in rows))
+        self.f.flush()
+
+    def close_file(self):
+        self.f.close()
+
+class ParquetSink(ResultSink):
+    # Every batch is written as a row group
+    def __init__(self, file_name, batch_size=BATCH_SIZE, resume=None, columns=COLUMNS):
+        if resume is not None:
+            raise Exception("Parquet files cannot be appended: --resume is not available for the parquet format")
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise Exception("Parquet output requires pyarrow (pip install pyarrow)")
+        super().__init__(file_name, batch_size, columns)
+        types = {int: pa.int64(), float: pa.float64(), str: pa.string()}
+        self.pa = pa
+        self.schema = pa.schema([(name, types[t]) for name, t in columns])
+        self.writer = pq.ParquetWriter(file_name, self.schema)
+
+    def write_rows(self, rows):
+        self.writer.write_table(self.pa.Table.from_pylist(rows, schema=self.schema))
+
+    def offset(self):
+        # No resume position
+        self.flush()
+        return None
+
+    def close_file(self):
+        self.writer.close()
+
+###############################################################################
+
+def open_sink(file_name, fmt="auto", method=None, fit_info=False, params=False, selection=False,
+              batch_size=BATCH_SIZE, resume=None, columns=COLUMNS, resample=False):
+    # method, fit_info, params, selection, resample: columns of the text
+    # format (see batch.result_keys); columns: of the other formats
+    fmt = result_format(file_name, fmt)
+    if fmt == "text":
+        return TextSink(file_name, method, fit_info, params, selection, batch_size, resume, resample)
+    if fmt == "tsv":
+        return DelimitedSink(file_name, "\t", batch_size, resume, columns)
+    if fmt == "csv":
+        return DelimitedSink(file_name, ",", batch_size, resume, columns)
+    if fmt == "jsonl":
+        return JsonLinesSink(file_name, batch_size, resume, columns)
+    if fmt == "parquet":
+        return ParquetSink(file_name, batch_size, resume, columns)
+    raise Exception(f"Unsupported result format: {fmt}")
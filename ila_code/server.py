@@ -0,0 +1,298 @@
+import os
+import sys
+import json
+import signal
+import socket
+import threading
+import socketserver
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from . import utils
+from . import ila
+from . import batch
+from . import lightcurve
+from . import result_sink
+
+# Service mode (ila_ap.py --serve): a long-lived process fitting the windows
+# sent to it, so the interpreter and the imports are started once.
+# The requests are JSON objects, one per line, read from stdin or from the
+# connections of a local socket (a path: Unix socket; HOST:PORT: TCP):
+#   {"id": 1, "t": [...], "m": [...], "method": "AP", "maxfev": 20000}
+# (REQUEST_KEYS; all but t and m are optional, the defaults are the options
+# of the command line). A request is fitted by batch.fit_range (ila.approx
+# and ila.method_result) in a pool of worker processes; the response is
+# written to the same stream when it is ready (not necessarily in the order
+# of the requests):
+#   {"id": 1, "results": [ROW, ...]}  one row per method, with the columns
+#                                     of the structured result file
+#   {"id": 1, "error": "message"}     invalid request
+# At most max_pending requests are fitted or queued at a time; further
+# requests are not read until one of them completes. {"command": "shutdown"},
+# the end of stdin, SIGTERM or Ctrl+C stop the server: no more requests are
+# read, the pending ones are completed and their responses written.
+
+MAX_PENDING = 64
+MAX_CONNECTIONS = 16
+
+REQUEST_KEYS = ['id', 't', 'm', 'method', 'select', 'maxfev', 'solver', 'escalate', 'time_budget', 'p0', 'command']
+COMMANDS = ("shutdown",)
+
+# Columns of the result rows (the range number is not applicable)
+RESPONSE_COLUMNS = [(name, t) for name, t in result_sink.COLUMNS if name != 'Range']
+
+class ServerStop(Exception):
+    pass
+
+###############################################################################
+
+def _request_array(request, key):
+    value = request.get(key)
+    if not isinstance(value, list) or len(value) == 0:
+        raise Exception(f"'{key}' must be a non-empty list of numbers")
+    a = np.asarray(value, dtype=np.float64)
+    if a.ndim != 1 or not np.all(np.isfinite(a)):
+        raise Exception(f"'{key}' must be a list of finite numbers")
+    return a
+
+def fit_request(request, options):
+    # Fits a request in a worker process; returns the response.
+    # options: method, select, maxfev, solver, escalate, time_budget,
+    # fit_cache (see FitServer)
+    response = {'id': request.get('id')}
+    try:
+        unknown = [k for k in request if k not in REQUEST_KEYS]
+        if len(unknown) > 0:
+            raise Exception(f"Unknown request keys: {', '.join(unknown)}")
+        t_obs = _request_array(request, 't')
+        m_obs = _request_array(request, 'm')
+        if len(t_obs) != len(m_obs):
+            raise Exception("'t' and 'm' must have the same length")
+        t_obs, m_obs, err_obs = lightcurve.sort_light_curve(t_obs, m_obs, np.full(len(t_obs), np.nan))
+        method = utils.method_type(str(request.get('method', options['method'])))
+        if method == "0":
+            raise Exception("Method 0 is not applicable in this context")
+        methods = utils.method_list(method)
+        select = request.get('select', options['select'])
+        if select not in batch.SELECTION_CRITERIA:
+            raise Exception(f"Unsupported selection criterion: {select}")
+        solver = request.get('solver', options['solver'])
+        if solver not in ila.SOLVERS:
+            raise Exception(f"Unsupported solver: {solver}")
+        fit_options = {'solver': solver}
+        escalate = bool(request.get('escalate', options['escalate']))
+        time_budget = request.get('time_budget', options['time_budget'])
+        if escalate or time_budget is not None:
+            fit_options['escalate'] = escalate
+            fit_options['time_budget'] = None if time_budget is None else float(time_budget)
+        if request.get('p0') is not None:
+            if len(methods) > 1:
+                raise Exception("'p0' is applicable to one method only")
+            fit_options['p0'] = [float(v) for v in request['p0']]
+        maxfev = int(request.get('maxfev', options['maxfev']))
+    except Exception as e:
+        response['error'] = str(e)
+        return response
+
+    records = [batch.fit_range(m, t_obs, m_obs, t_obs[0], t_obs[-1], maxfev, True, render=False,
+                               fit_options=fit_options, preview_mode="none", fit_cache=options['fit_cache'])
+               for m in methods]
+    if len(records) > 1:
+        batch.select_fit(records, select)
+    response['results'] = [result_sink.json_row(result_sink.structured_row(record, None, RESPONSE_COLUMNS))
+                           for record in records]
+    return response
+
+###############################################################################
+
+class _Channel:
+    # Response stream of stdin/stdout or of a connection; keeps the number
+    # of requests whose responses are not written yet
+    def __init__(self, write):
+        self.write = write
+        self.lock = threading.Lock()
+        self.done = threading.Condition(self.lock)
+        self.pending = 0
+
+    def start(self):
+        with self.lock:
+            self.pending += 1
+
+    def respond(self, response, finished=False):
+        line = json.dumps(response) + "\n"
+        with self.lock:
+            try:
+                self.write(line)
+            except (OSError, ValueError):
+                # The client is gone
+                pass
+            if finished:
+                self.pending -= 1
+                self.done.notify_all()
+
+    def wait(self):
+        with self.lock:
+            while self.pending > 0:
+                self.done.wait()
+
+class FitServer:
+    def __init__(self, options, jobs=1, max_pending=MAX_PENDING):
+        if jobs is None or jobs <= 0:
+            jobs = os.cpu_count() or 1
+        if max_pending < 1:
+            raise Exception("The number of pending requests must be positive")
+        self.options = options
+        self.executor = ProcessPoolExecutor(max_workers=jobs, initializer=batch._init_worker)
+        self.slots = threading.BoundedSemaphore(max_pending)
+        self.stopping = threading.Event()
+
+    def handle(self, line, channel):
+        # Parses a request line and submits it; the response is written to
+        # the channel when it is ready. Returns False after the shutdown command.
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("a request must be a JSON object")
+        except ValueError as e:
+            channel.respond({'id': None, 'error': f"Invalid request: {e}"})
+            return True
+        command = request.get('command')
+        if command is not None:
+            if command not in COMMANDS:
+                channel.respond({'id': request.get('id'), 'error': f"Unsupported command: {command}"})
+                return True
+            self.stopping.set()
+            channel.respond({'id': request.get('id'), 'status': "stopping"})
+            return False
+        # Waits for a free slot (no more requests are read meanwhile)
+        self.slots.acquire()
+        channel.start()
+        try:
+            future = self.executor.submit(fit_request, request, self.options)
+        except Exception as e:
+            self.slots.release()
+            channel.respond({'id': request.get('id'), 'error': str(e)}, True)
+            return True
+
+        def done(future):
+            self.slots.release()
+            try:
+                response = future.result()
+            except Exception as e:
+                response = {'id': request.get('id'), 'error': str(e)}
+            channel.respond(response, True)
+        future.add_done_callback(done)
+        return True
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+###############################################################################
+
+def _stop(signum, frame):
+    raise ServerStop()
+
+def serve_stdio(server, f_in=None, f_out=None):
+    f_in = f_in if f_in is not None else sys.stdin
+    f_out = f_out if f_out is not None else sys.stdout
+
+    def write(line):
+        f_out.write(line)
+        f_out.flush()
+
+    channel = _Channel(write)
+    try:
+        for line in iter(f_in.readline, ""):
+            if line.strip() == "":
+                continue
+            if not server.handle(line, channel):
+                break
+    except (ServerStop, KeyboardInterrupt):
+        pass
+    channel.wait()
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        listener = self.server
+        with listener.lock:
+            accepted = len(listener.connections) < listener.max_connections and not listener.fit_server.stopping.is_set()
+            if accepted:
+                listener.connections.add(self.connection)
+        channel = _Channel(lambda line: self.wfile.write(line.encode("utf-8")))
+        if not accepted:
+            channel.respond({'id': None, 'error': "Too many connections"})
+            return
+        try:
+            for line in iter(self.rfile.readline, b""):
+                if line.strip() == b"":
+                    continue
+                if not listener.fit_server.handle(line.decode("utf-8"), channel):
+                    # Stops the listener from another thread
+                    threading.Thread(target=listener.shutdown).start()
+                    break
+        except OSError:
+            pass
+        channel.wait()
+        with listener.lock:
+            listener.connections.discard(self.connection)
+
+    def finish(self):
+        try:
+            super().finish()
+        except OSError:
+            pass
+
+def _listener(address):
+    # "HOST:PORT": TCP; otherwise the path of a Unix socket
+    host, sep, port = address.rpartition(":")
+    if sep and port.isdigit():
+        listener = socketserver.ThreadingTCPServer((host or "127.0.0.1", int(port)), _RequestHandler,
+                                                   bind_and_activate=False)
+        listener.allow_reuse_address = True
+    else:
+        if not hasattr(socketserver, "ThreadingUnixStreamServer"):
+            raise Exception("Unix sockets are not available: use HOST:PORT")
+        if os.path.exists(address):
+            os.remove(address)
+        listener = socketserver.ThreadingUnixStreamServer(address, _RequestHandler, bind_and_activate=False)
+    listener.server_bind()
+    listener.server_activate()
+    return listener
+
+def serve_socket(server, address, max_connections=MAX_CONNECTIONS):
+    listener = _listener(address)
+    listener.fit_server = server
+    listener.max_connections = max_connections
+    listener.lock = threading.Lock()
+    listener.connections = set()
+    print(f"Serving on {address}", file=sys.stderr)
+    try:
+        listener.serve_forever()
+    except (ServerStop, KeyboardInterrupt):
+        pass
+    server.stopping.set()
+    # No more requests are read; the handlers write the pending responses
+    with listener.lock:
+        for connection in listener.connections:
+            try:
+                connection.shutdown(socket.SHUT_RD)
+            except OSError:
+                pass
+    listener.server_close()
+    if listener.address_family == getattr(socket, "AF_UNIX", None):
+        try:
+            os.remove(address)
+        except OSError:
+            pass
+
+def serve(options, jobs=1, max_pending=MAX_PENDING, address=None, max_connections=MAX_CONNECTIONS):
+    # Serves the requests from stdin (address None) or a socket until stopped
+    server = FitServer(options, jobs, max_pending)
+    previous = signal.signal(signal.SIGTERM, _stop)
+    try:
+        if address is None:
+            serve_stdio(server)
+        else:
+            serve_socket(server, address, max_connections)
+    finally:
+        signal.signal(signal.SIGTERM, previous)
+        server.close()
@@ -0,0 +1,198 @@
+import numpy as np
+from . import ila
+
+# Stacked Levenberg-Marquardt solver: all windows of a batch are packed into
+# padded arrays (one row per window) and iterated together, so the Python-level
+# work per iteration does not depend on the number of windows. A window leaves
+# the active set as soon as it has converged.
+
+FTOL = 1.49012e-8
+XTOL = 1.49012e-8
+LAMBDA0 = 1e-3
+LAMBDA_MAX = 1e16
+
+MODELS = {
+    "AP": (ila.f_AP_a, ila.jac_AP_a, 5),
+    "WSAP": (ila.f_WSAP_a, ila.jac_WSAP_a, 5),
+    "WSL": (ila.f_WSL_a, ila.jac_WSL_a, 5),
+    "A": (ila.f_A_a, ila.jac_A_a, 4),
+}
+
+###############################################################################
+
+def pack_windows(windows):
+    # windows: list of (t_obs, m_obs). Returns padded T, Y, a mask of valid
+    # points, and the mean time of every window (T is centered on it).
+    sizes = np.array([len(t) for t, m in windows], dtype=np.int64)
+    n_max = max(1, int(sizes.max())) if len(sizes) > 0 else 1
+    T = np.zeros((len(windows), n_max))
+    Y = np.zeros((len(windows), n_max))
+    mask = np.arange(n_max)[np.newaxis, :] < sizes[:, np.newaxis]
+    mean_t = np.zeros(len(windows))
+    for i, (t, m) in enumerate(windows):
+        n = len(t)
+        if n == 0:
+            continue
+        mean_t[i] = np.mean(t)
+        T[i, :n] = t - mean_t[i]
+        Y[i, :n] = m
+        # Padding repeats the last point; it has zero weight
+        T[i, n:] = T[i, n - 1]
+        Y[i, n:] = m[n - 1]
+    return T, Y, mask, mean_t
+
+def _residuals(func, T, Y, mask, P):
+    r = Y - func(T, *(P[:, k, np.newaxis] for k in range(P.shape[1])))
+    r = np.where(mask, r, 0.0)
+    cost = np.sum(r * r, axis=1)
+    cost[~np.isfinite(cost)] = np.inf
+    return r, cost
+
+def _normal_equations(jac, T, mask, P, r):
+    J = jac(T, *(P[:, k, np.newaxis] for k in range(P.shape[1])))
+    J = np.where(mask[..., np.newaxis], J, 0.0)
+    Jt = J.transpose(0, 2, 1)
+    return np.matmul(Jt, J), np.matmul(Jt, r[..., np.newaxis])[..., 0]
+
+def _solve(H, g):
+    try:
+        return np.linalg.solve(H, g[..., np.newaxis])[..., 0]
+    except np.linalg.LinAlgError:
+        return np.matmul(np.linalg.pinv(H), g[..., np.newaxis])[..., 0]
+
+def _covariance(JtJ, cost, n_points, n_par):
+    # Same scaling as curve_fit (absolute_sigma=False); a singular
+    # matrix gives an infinite covariance, as in curve_fit.
+    U, sv, Vt = np.linalg.svd(JtJ)
+    tol = sv[:, :1] * n_par * np.finfo(float).eps
+    singular = np.any(sv <= tol, axis=1)
+    dof = n_points - n_par
+    sv_inv = np.where(sv > tol, 1.0 / np.where(sv > tol, sv, 1.0), 0.0)
+    cov = np.matmul(Vt.transpose(0, 2, 1) * sv_inv[:, np.newaxis, :], U.transpose(0, 2, 1))
+    cov *= (cost / np.where(dof > 0, dof, 1))[:, np.newaxis, np.newaxis]
+    cov[singular | (dof <= 0)] = np.inf
+    return cov
+
+###############################################################################
+
+def approx_stacked(method, windows, maxfev=12000, p0=None, fit_infos=None):
+    # Fits all windows at once.
+    # windows: list of (t_obs, m_obs) arrays.
+    # p0: optional list of initial values per window (None: the default start).
+    # fit_infos: optional list of dicts receiving 'start' and 'nfev' per window.
+    # Returns a list with one (params_opt, params_cov, param_warning) tuple per
+    # window, as ila.approx does; windows that cannot be fitted get the
+    # exception ila.approx would raise instead of the tuple.
+    if method not in MODELS:
+        raise Exception("Only AP, WSAP, WSL, and A methods are supported.")
+    func, jac, n_par = MODELS[method]
+
+    results = [None] * len(windows)
+    fit_ok = []
+    for i, (t, m) in enumerate(windows):
+        if len(t) < n_par:
+            results[i] = TypeError(f"The number of func parameters={n_par} must not exceed "
+                                   f"the number of data points={len(t)}")
+        else:
+            fit_ok.append(i)
+    if len(fit_ok) == 0:
+        return results
+
+    T, Y, mask, mean_t = pack_windows([windows[i] for i in fit_ok])
+    n_points = mask.sum(axis=1)
+    t_min = np.where(mask, T, np.inf).min(axis=1)
+    t_max = np.where(mask, T, -np.inf).max(axis=1)
+
+    # Initial values, as in ila.approx
+    P = np.zeros((len(fit_ok), n_par))
+    P[:, 0] = np.sum(np.where(mask, Y, 0.0), axis=1) / n_points
+    if method == "A":
+        P[:, 3] = (t_max + t_min) / 2.0
+    else:
+        P[:, 3] = t_min + (t_max - t_min) / 3.0
+        P[:, 4] = t_max - (t_max - t_min) / 3.0
+    start = ["cold"] * len(fit_ok)
+    if p0 is not None:
+        for k, i in enumerate(fit_ok):
+            if p0[i] is not None:
+                P[k] = p0[i]
+                P[k, 3:] -= mean_t[k]
+                start[k] = "warm"
+
+    r, cost = _residuals(func, T, Y, mask, P)
+    JtJ, g = _normal_equations(jac, T, mask, P, r)
+    nfev = np.ones(len(fit_ok), dtype=np.int64)
+    # Damping with Nielsen's update of lambda
+    lam = np.full(len(fit_ok), LAMBDA0)
+    nu = np.full(len(fit_ok), 2.0)
+    scale = np.maximum(np.einsum('wii->wi', JtJ), np.finfo(float).tiny)
+    active = np.isfinite(cost)
+    converged = np.zeros(len(fit_ok), dtype=bool)
+    stall = np.zeros(len(fit_ok), dtype=bool)
+
+    while np.any(active):
+        a = np.flatnonzero(active)
+        D = scale[a] * lam[a, np.newaxis]
+        H = JtJ[a] + D[:, :, np.newaxis] * np.eye(n_par)
+        delta = _solve(H, g[a])
+        P_new = P[a] + delta
+        r_new, cost_new = _residuals(func, T[a], Y[a], mask[a], P_new)
+        nfev[a] += 1
+
+        # Actual and predicted (by the linearized model) reductions of the cost
+        actred = cost[a] - cost_new
+        prered = np.sum(delta * (g[a] + D * delta), axis=1)
+        rho = np.where(prered > 0.0, actred / np.where(prered > 0.0, prered, 1.0), -1.0)
+        better = (cost_new < cost[a]) & (rho > 0.0)
+
+        small_step = np.all(np.abs(delta) <= XTOL * (np.abs(P[a]) + XTOL), axis=1)
+        small_gain = (np.abs(actred) <= FTOL * cost[a]) & (prered <= FTOL * cost[a])
+
+        acc = a[better]
+        if len(acc) > 0:
+            P[acc] = P_new[better]
+            r[acc] = r_new[better]
+            cost[acc] = cost_new[better]
+            JtJ[acc], g[acc] = _normal_equations(jac, T[acc], mask[acc], P[acc], r[acc])
+            scale[acc] = np.maximum(scale[acc], np.einsum('wii->wi', JtJ[acc]))
+            lam[acc] *= np.maximum(1.0 / 3.0, 1.0 - (2.0 * rho[better] - 1.0) ** 3)
+            nu[acc] = 2.0
+        rej = a[~better]
+        lam[rej] *= nu[rej]
+        nu[rej] *= 2.0
+
+        done = small_step | small_gain | (cost[a] == 0.0)
+        converged[a[done]] = True
+        active[a[done]] = False
+        # No step reduces the cost any more, but the tolerances are not met:
+        # the fit stalled (not converged, as MINPACK's info 6/7 in curve_fit)
+        stalled = a[~done & (lam[a] > LAMBDA_MAX)]
+        stall[stalled] = True
+        active[stalled] = False
+        active[a[nfev[a] >= maxfev]] = False
+
+    cov = _covariance(JtJ, cost, n_points, n_par)
+    for k, i in enumerate(fit_ok):
+        if fit_infos is not None:
+            fit_infos[i]['start'] = start[k]
+            fit_infos[i]['nfev'] = int(nfev[k])
+        if not converged[k]:
+            if not np.isfinite(cost[k]):
+                results[i] = ValueError("Residuals are not finite in the initial point.")
+            elif stall[k]:
+                results[i] = RuntimeError(f"Optimal parameters not found: ftol={FTOL:g} and xtol={XTOL:g} are "
+                                          "too small, no further reduction in the sum of squares is possible.")
+            else:
+                results[i] = RuntimeError("Optimal parameters not found: Number of calls to function "
+                                          f"has reached maxfev = {maxfev}.")
+            continue
+        params_opt = P[k].copy()
+        param_warning = None
+        if method != "A":
+            C4 = params_opt[3]
+            C5 = params_opt[4]
+            if C4 < t_min[k] or C4 > t_max[k] or C5 < t_min[k] or C5 > t_max[k]:
+                param_warning = "Bad C4 or C5 or both. Try another method."
+        params_opt[3:] += mean_t[k]
+        results[i] = (params_opt, cov[k], param_warning)
+    return results
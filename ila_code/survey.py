@@ -0,0 +1,243 @@
+import os
+import csv
+import glob
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from . import utils
+from . import batch
+from . import lightcurve
+from . import windows
+from . import result_sink
+
+# Survey mode: many light curves in one process.
+# The stars are listed in a manifest (CSV with a header line, see
+# MANIFEST_KEYS; relative paths are relative to the manifest) or given as
+# data files, directories and glob patterns with common options.
+# Every star is fitted like a batch run of ila_ap.py (range file, ranges
+# split by epoch/period/phases as split_lc.py does, or one range over the
+# whole light curve), without previews. The stars are distributed over a
+# pool of worker processes that live for the whole survey, so the imports
+# are paid once per worker, not once per star. The results go to one table
+# (result_sink.SURVEY_COLUMNS: the File column and the columns of a batch
+# run); failed fits and stars that could not be processed go to the
+# failure report.
+
+MANIFEST_KEYS = ['file', 'method', 'ranges', 'epoch', 'period', 'start_phase', 'stop_phase']
+SPLIT_KEYS = ['epoch', 'period', 'start_phase', 'stop_phase']
+
+# Columns of the failure report
+FAILURE_KEYS = ['File', 'Range', 'Method', 'Start Time', 'End Time', 'Message']
+
+###############################################################################
+
+def failure_report_name(result_file_name):
+    root, ext = os.path.splitext(result_file_name)
+    return root + "_failures.tsv"
+
+def star_entry(row, defaults, base_dir=None, where=""):
+    # row: manifest fields (file and the optional keys);
+    # defaults: method and SPLIT_KEYS values used for missing fields
+    values = dict(defaults)
+    for k, value in row.items():
+        if value is not None and value.strip() != "":
+            values[k] = value.strip()
+    file_name = values.get('file')
+    if file_name is None:
+        raise Exception(f"{where}No data file")
+    ranges = values.get('ranges')
+    if base_dir is not None:
+        file_name = os.path.join(base_dir, file_name)
+        if ranges is not None:
+            ranges = os.path.join(base_dir, ranges)
+    try:
+        method = utils.method_type(str(values.get('method', "AP")))
+    except Exception as e:
+        raise Exception(f"{where}{e}")
+    if method == "0":
+        raise Exception(f"{where}Method 0 is not applicable in this context")
+    split = [values.get(k) for k in SPLIT_KEYS]
+    if all(v is None for v in split) or ranges is not None:
+        split = None
+    elif any(v is None for v in split):
+        raise Exception(f"{where}epoch, period, start_phase and stop_phase must be given together")
+    else:
+        try:
+            split = tuple(np.float64(v) for v in split)
+        except ValueError as e:
+            raise Exception(f"{where}{e}")
+    return {'file': file_name, 'method': method, 'ranges': ranges, 'split': split}
+
+def read_manifest(file_name, defaults):
+    base_dir = os.path.dirname(file_name)
+    with open(file_name, "r", newline="") as f:
+        lines = [(n, line) for n, line in enumerate(f, 1) if line.strip() != "" and not line.lstrip().startswith("#")]
+    if len(lines) == 0:
+        return []
+    reader = csv.DictReader([line for n, line in lines])
+    unknown = [k for k in reader.fieldnames if k not in MANIFEST_KEYS]
+    if len(unknown) > 0 or 'file' not in reader.fieldnames:
+        raise Exception(f"{file_name}: the header must have the file column and the optional columns "
+                        f"{', '.join(MANIFEST_KEYS[1:])}; unknown: {', '.join(unknown)}")
+    stars = []
+    for (n, line), row in zip(lines[1:], reader):
+        stars.append(star_entry(row, defaults, base_dir, f"{file_name}, line {n}: "))
+    return stars
+
+def survey_stars(inputs, defaults, pattern="*.dat"):
+    # inputs: manifests (.csv), directories (the files matching pattern),
+    # data files and glob patterns
+    stars = []
+    for name in inputs:
+        if os.path.isdir(name):
+            files = sorted(glob.glob(os.path.join(name, pattern)))
+        elif os.path.splitext(name)[1].lower() == ".csv":
+            stars.extend(read_manifest(name, defaults))
+            continue
+        else:
+            files = sorted(glob.glob(name))
+            if len(files) == 0:
+                raise Exception(f"No such file: {name}")
+        stars.extend(star_entry({'file': file_name}, defaults, where=f"{file_name}: ") for file_name in files)
+    return stars
+
+###############################################################################
+
+def star_windows(star, t_obs):
+    # Slice bounds, start and stop times of the ranges of a star, and the
+    # number of ranges whose point numbers do not match the data file
+    if star['ranges'] is not None:
+        ranges = windows.read_ranges(star['ranges'])
+        t_starts = ranges['time1']
+        t_stops = ranges['time2']
+        lo, hi = windows.range_bounds(t_obs, t_starts, t_stops)
+        lo, hi = windows.snap_to_points(t_obs, lo, hi, t_starts, t_stops, ranges['point1'], ranges['point2'])
+        n_mismatch = np.count_nonzero(windows.point_index_mismatch(lo, hi, ranges['point1'], ranges['point2']))
+        return lo, hi, t_starts, t_stops, n_mismatch
+    if star['split'] is not None:
+        lo, hi = windows.phase_windows(t_obs, *star['split'])
+        # The times written by split_lc.py
+        return lo, hi, t_obs[lo], t_obs[hi - 1], 0
+    # One-extremum mode
+    return np.array([0]), np.array([len(t_obs)]), np.array([np.min(t_obs)]), np.array([np.max(t_obs)]), 0
+
+def fit_star(star, options):
+    # Fits all the ranges of a star. options: maxfev, solver, fit_options,
+    # select, use_cache, fit_cache, resample (see run_survey).
+    # Returns the table rows and the failures; any error of the star
+    # (e.g. a missing file) is returned in 'error'.
+    result = {'file': star['file'], 'ranges': 0, 'rows': [], 'failures': [], 'cache_hits': 0,
+              'warning': None, 'error': None}
+    start = time.perf_counter()
+    try:
+        _fit_star(result, star, options)
+    except Exception as e:
+        result['error'] = str(e)
+        result['failures'].append([star['file'], None, star['method'], None, None, str(e)])
+    result['time'] = time.perf_counter() - start
+    return result
+
+def _fit_star(result, star, options):
+    t_obs, m_obs, err_obs = lightcurve.load_light_curve(star['file'], options['use_cache'])
+    lo, hi, t_starts, t_stops, n_mismatch = star_windows(star, t_obs)
+    if n_mismatch > 0:
+        result['warning'] = f"{n_mismatch} range(s): the point numbers do not match the data file"
+    methods = utils.method_list(star['method'])
+    multi = len(methods) > 1
+    use_stacked = options['solver'] == "stacked"
+
+    def tasks():
+        for i, (time_subset, mag_subset, err_subset) in enumerate(windows.iter_windows(lo, hi, t_obs, m_obs,
+                                                                                        err_obs)):
+            for m in methods:
+                yield dict(method=m, t_obs=time_subset, m_obs=mag_subset,
+                           t_start=t_starts[i], t_stop=t_stops[i], maxfev=options['maxfev'], inverseY=True,
+                           render=False, fit_options=options['fit_options'], preview_mode="none",
+                           fit_cache=options['fit_cache'], resample=options['resample'], err_obs=err_subset)
+
+    group = []
+    for record in batch.fit_ranges(tasks(), 1, use_stacked=use_stacked):
+        if record['fit_info'].get('cache') == "hit":
+            result['cache_hits'] += 1
+        group.append(record)
+        if len(group) < len(methods):
+            continue
+        result['ranges'] += 1
+        range_no = result['ranges']
+        if multi:
+            batch.select_fit(group, options['select'])
+        for record in group:
+            result['rows'].append(result_sink.structured_row(record, range_no, result_sink.SURVEY_COLUMNS,
+                                                             {'File': star['file']}))
+            status, message = result_sink.record_status(record)
+            if status == result_sink.STATUS_FAILED:
+                info = record['info']
+                result['failures'].append([star['file'], range_no, record['method'],
+                                           info['Start Time'], info['End Time'], message])
+        group = []
+
+def _fit_star_task(args):
+    return fit_star(*args)
+
+def fit_stars(stars, options, jobs=1):
+    # Yields the results of fit_star() in the order of the stars
+    if jobs is None or jobs <= 0:
+        jobs = os.cpu_count() or 1
+    if jobs == 1:
+        for star in stars:
+            yield fit_star(star, options)
+        return
+    with ProcessPoolExecutor(max_workers=jobs, initializer=batch._init_worker) as executor:
+        yield from executor.map(_fit_star_task, [(star, options) for star in stars])
+
+###############################################################################
+
+def run_survey(stars, result_file_name, failure_file_name=None, result_format="auto", jobs=1, maxfev=100000,
+               solver="lm", escalate=False, time_budget=None, select="aic", use_cache=True, fit_cache=None,
+               resample=None):
+    # fit_cache: None or (directory, max_bytes) of the fit cache;
+    # resample: None or (mode, number of replicates, seed) (see resample.py)
+    if result_sink.result_format(result_file_name, result_format) == "text":
+        raise Exception("The survey table is written in the tsv, csv, jsonl or parquet format "
+                        "(use the extension of the result file or --result-format)")
+    if failure_file_name is None:
+        failure_file_name = failure_report_name(result_file_name)
+    fit_options = {} if solver == "stacked" else {'solver': solver}
+    if escalate or time_budget is not None:
+        if solver == "stacked":
+            raise Exception("--escalate and --time-budget are not available with the stacked solver")
+        fit_options['escalate'] = escalate
+        fit_options['time_budget'] = time_budget
+    options = {'maxfev': maxfev, 'solver': solver, 'fit_options': fit_options, 'select': select,
+               'use_cache': use_cache, 'fit_cache': fit_cache, 'resample': resample}
+
+    n_ranges = 0
+    n_failed = 0
+    n_errors = 0
+    cache_hits = 0
+    with result_sink.open_sink(result_file_name, result_format, columns=result_sink.SURVEY_COLUMNS) as sink, \
+         open(failure_file_name, "w", newline="") as f_failures:
+        failures = csv.writer(f_failures, delimiter="\t", lineterminator="\n")
+        failures.writerow(FAILURE_KEYS)
+        for k, result in enumerate(fit_stars(stars, options, jobs), 1):
+            for row in result['rows']:
+                sink.write_row(row)
+            failures.writerows([["" if v is None else v for v in failure] for failure in result['failures']])
+            f_failures.flush()
+            n_ranges += result['ranges']
+            cache_hits += result['cache_hits']
+            if result['error'] is not None:
+                n_errors += 1
+                utils.printWarning(f"[{k}/{len(stars)}] {result['file']}: Failed: {result['error']}")
+                continue
+            n_failed += len(result['failures'])
+            print(f"[{k}/{len(stars)}] {result['file']}: {result['ranges']} range(s), "
+                  f"{len(result['failures'])} failed fit(s), {result['time']:.2f} s")
+            if result['warning'] is not None:
+                utils.printWarning(f"{result['file']}: {result['warning']}")
+
+    print(f"Survey: {len(stars)} file(s), {n_ranges} range(s); {n_failed} failed fit(s), "
+          f"{n_errors} file(s) not processed")
+    if fit_cache is not None:
+        print(f"Fit cache: {cache_hits} fit(s) reused")
+    print(f"Failure report: {failure_file_name}")
@@ -1,26 +1,54 @@
-from colorama import Fore, Back
 import argparse
 import io
 import base64
 import numpy as np
 from . import ila
+from . import preview
+from . import preview_html
+from . import result_sink
+from . import fit_cache
+from . import server
+from . import extrema
+from . import resample
+
+def init_console():
+    # Colored warnings on Windows consoles
+    from colorama import init as colorama_init
+    colorama_init()
 
 def printWarning(msg):
+    from colorama import Fore, Back
     print(Fore.LIGHTRED_EX + Back.LIGHTYELLOW_EX + msg + Fore.RESET + Back.RESET)
 
 def method_type(value):
     value_upper = value.upper()
-    if value_upper not in {"AP", "WSAP", "WSL", "A", "0"}:
-        raise argparse.ArgumentTypeError("Method must be AP, WSAP, WSL, A, or 0 (case-insensitive). Use 0 to plot the data without approximation.")
+    if value_upper == "AUTO" or value_upper == "0":
+        return value_upper
+    methods = value_upper.split(",")
+    if any(m not in ila.METHODS for m in methods) or len(set(methods)) != len(methods):
+        raise argparse.ArgumentTypeError("Method must be AP, WSAP, WSL, A, a comma-separated list of them, auto (all of them), "
+                                         "or 0 (case-insensitive). Use 0 to plot the data without approximation.")
     return value_upper
 
+def method_list(method):
+    # "AP,WSL" -> ["AP", "WSL"]; "AUTO" -> all the methods
+    if method == "AUTO":
+        return list(ila.METHODS)
+    return method.split(",")
+
 def parse_args(description):
     parser = argparse.ArgumentParser(description=description)
     # Required positional argument: input file
-    parser.add_argument("filename", type=str, help="Path to the input data file")
+    parser.add_argument("filename", type=str, nargs="?", default=None,
+                        help="Path to the input data file (not used with --serve)")
     # Optional string argument: method
     parser.add_argument('--method', type=method_type, default="AP",
-                        help="METHOD to use: AP, WSAP, WSL, A or 0 (case-insensitive). Default: AP")
+                        help="METHOD to use: AP, WSAP, WSL, A or 0 (case-insensitive). Default: AP. "
+                             "Several methods (e.g. AP,WSAP,WSL or auto for all) are fitted to the same ranges "
+                             "in one pass and the best one is selected for every range (see --select)")
+    # Optional string argument: criterion of the best method
+    parser.add_argument('--select', type=str.lower, choices=("sigma", "aic", "bic"), default="aic",
+                        help="Criterion used to select the best of several methods: sigma, aic or bic. Default: aic")
     # Optional boolean argument: non-inverted Y axis
     parser.add_argument('--non-inverseY', action='store_true', default=False,
                         help='Use non-inverted Y axis')
@@ -33,41 +61,176 @@ def parse_args(description):
     # Optional string argument: result file name
     parser.add_argument('--result', type=str, default="result.txt",
                         help='File with the resulting parameters of the approximation')
+    # Optional string argument: result file format
+    parser.add_argument('--result-format', type=str.lower, choices=result_sink.RESULT_FORMATS, default="auto",
+                        help="Format of the result file: text (the original tab-separated format), or typed columns "
+                             "with a separate status and warning: tsv, csv, jsonl or parquet (requires pyarrow). "
+                             "auto: by the file extension (.tsv, .csv, .jsonl, .parquet), otherwise text. Default: auto")
     # Optional string argument: preview file name
     parser.add_argument('--preview', type=str, default="result.html",
                         help='HTML file with the plot')
+    # Optional boolean argument: do not use the binary cache of the input file
+    parser.add_argument('--no-cache', action='store_true', default=False,
+                        help='Do not use (or create) the binary cache of the input file')
+    # Optional boolean argument: use the fit cache
+    parser.add_argument('--fit-cache', action='store_true', default=False,
+                        help='Use (and update) the cache of fit results')
+    # Optional boolean argument: do not use the fit cache
+    parser.add_argument('--no-fit-cache', action='store_true', default=False,
+                        help='Do not use the cache of fit results (the default; overrides --fit-cache)')
+    # Optional boolean argument: clear the fit cache
+    parser.add_argument('--clear-fit-cache', action='store_true', default=False,
+                        help='Remove all the entries of the fit cache before processing')
+    # Optional string argument: fit cache directory
+    parser.add_argument('--fit-cache-dir', type=str, default=None,
+                        help='Directory of the fit cache. Default: $ILA_FIT_CACHE or ~/.cache/lc_approx/fits')
+    # Optional float argument: fit cache size
+    parser.add_argument('--fit-cache-size', type=float, default=fit_cache.MAX_BYTES / (1024 * 1024),
+                        help=f"Maximal size of the fit cache, MB; the least recently used entries are removed. "
+                             f"Default: {fit_cache.MAX_BYTES // (1024 * 1024)}")
+    # Optional boolean argument: continue an interrupted batch run
+    parser.add_argument('--resume', action='store_true', default=False,
+                        help='Batch mode: continue an interrupted run from its last checkpoint '
+                             '(RESULT.journal); the outputs are appended to')
+    # Optional integer argument: number of worker processes in batch mode
+    parser.add_argument('--jobs', type=int, default=1,
+                        help='Number of worker processes used to fit the ranges (0: one per CPU). Default: 1')
+    # Optional string argument: solver
+    parser.add_argument('--solver', type=str.lower, choices=ila.SOLVERS + ("stacked",), default="lm",
+                        help="Solver: lm (Levenberg-Marquardt over all parameters), varpro "
+                             "(grid search over C4/C5 with linear C1..C3, then Levenberg-Marquardt) or "
+                             "stacked (Levenberg-Marquardt iterated over all ranges at once). Default: lm")
+    # Optional integer argument: maximal number of function evaluations
+    parser.add_argument('--maxfev', type=int, default=None,
+                        help='Maximal number of function evaluations per fit (with --escalate, in all the stages). '
+                             'Default: MAXFEV of ila_ap.py')
+    # Optional boolean argument: fit in stages
+    parser.add_argument('--escalate', action='store_true', default=False,
+                        help='Fit in stages until C4 < C5 lie in the range: a cheap Levenberg-Marquardt fit, '
+                             'then a bounded trust-region fit, then bounded fits from several starts. '
+                             'The stage is reported in the Stage column')
+    # Optional float argument: time budget of a fit
+    parser.add_argument('--time-budget', type=np.float64, default=None,
+                        help='Wall time limit of a fit, seconds (the range fails if no solution is found in time)')
+    # Optional boolean argument: warm start in batch mode
+    parser.add_argument('--warm-start', action='store_true', default=False,
+                        help='Batch mode: start each fit from the solution of the previous range '
+                             '(falls back to the default start if the fit fails)')
+    # Optional float arguments: ranges made from the light curve
+    parser.add_argument('--epoch', type=np.float64, default=None,
+                        help='Batch mode without a range file: the light curve is split into the ranges '
+                             '[--start-phase, --stop-phase] of the cycles of --epoch and --period '
+                             '(as split_lc.py does) and they are fitted as they are found')
+    parser.add_argument('--period', type=np.float64, default=None,
+                        help='Period of the cycles (with --epoch); also used to shift the warm start between ranges '
+                             '(default: the distance between the range start times)')
+    parser.add_argument('--start-phase', type=np.float64, default=None,
+                        help='Start phase of the ranges (with --epoch)')
+    parser.add_argument('--stop-phase', type=np.float64, default=None,
+                        help='Stop phase of the ranges (with --epoch)')
+    # Optional arguments: ranges around the extrema found automatically
+    parser.add_argument('--detect', action='store_true', default=False,
+                        help='Batch mode without a range file or ephemeris: find the extrema of the light curve '
+                             '(smoothed, cut at gaps) and fit the ranges around them')
+    parser.add_argument('--detect-width', type=int, default=extrema.HALF_WIDTH,
+                        help=f"With --detect: points on each side of an extremum, both to find it and to fit it. "
+                             f"Default: {extrema.HALF_WIDTH}")
+    parser.add_argument('--detect-smooth', type=int, default=None,
+                        help='With --detect: half width (points) of the running mean. Default: --detect-width / 4')
+    parser.add_argument('--detect-kind', type=str.lower, choices=extrema.EXTREMUM_KINDS, default="both",
+                        help='With --detect: min (minima of brightness), max or both. Default: both')
+    # Optional arguments: instrumentation
+    parser.add_argument('--profile', action='store_true', default=False,
+                        help='Batch mode: time the stages (parsing, fitting, covariance, curves, images, output) '
+                             'and count the evaluations, retries and bytes written; prints a summary table')
+    parser.add_argument('--profile-trace', type=str, default=None,
+                        help='Batch mode: write a trace record (JSON lines) per window to this file (implies --profile)')
+    # Optional arguments: resampling uncertainties
+    parser.add_argument('--resample', type=str.lower, choices=resample.RESAMPLE_MODES, default=None,
+                        help='Percentile intervals of the time and magnitude of the extremum from refits of '
+                             'resampled data: bootstrap (of the residuals) or montecarlo (Gaussian noise of the '
+                             'error column). Adds the TOM Low/High, Magnitude Low/High and Resamples columns')
+    parser.add_argument('--resamples', type=int, default=resample.N_RESAMPLES,
+                        help=f"With --resample: number of refits of every window. Default: {resample.N_RESAMPLES}")
+    parser.add_argument('--resample-seed', type=int, default=resample.SEED,
+                        help=f"With --resample: seed of the random numbers. Default: {resample.SEED}")
+    # Optional string argument: preview mode
+    parser.add_argument('--preview-mode', type=str.lower, choices=preview.PREVIEW_MODES, default="full",
+                        help="Batch mode: full (8x5 inch images), thumbnail (small images) or none "
+                             "(no images; C1..C3 are added to the result file so that the preview "
+                             "can be made later with --render-result). Default: full")
+    # Optional string argument: preview format
+    parser.add_argument('--preview-format', type=str.lower, choices=preview_html.PREVIEW_FORMATS, default="inline",
+                        help="inline (one HTML file with embedded images) or pages (PNG files and HTML pages "
+                             "in the PREVIEW_files directory; the preview file is an index of the ranges). Default: inline")
+    # Optional integer argument: ranges per preview page
+    parser.add_argument('--preview-page-size', type=int, default=preview_html.PAGE_SIZE,
+                        help=f"Number of ranges per page with --preview-format pages. Default: {preview_html.PAGE_SIZE}")
+    # Optional boolean argument: make the preview from an existing result file
+    parser.add_argument('--render-result', action='store_true', default=False,
+                        help='Do not fit: make the preview (--preview) from the result file (--result) '
+                             'written with --preview-mode none or in the tsv format')
+    # Optional boolean argument: service mode
+    parser.add_argument('--serve', action='store_true', default=False,
+                        help='Service mode: fit the windows of JSON-lines requests read from stdin '
+                             '(or from the connections of --socket) in a pool of --jobs worker processes '
+                             'and write the results as JSON lines. See ila_code/server.py')
+    # Optional string argument: socket of the service mode
+    parser.add_argument('--socket', type=str, default=None,
+                        help='Service mode: listen on a Unix socket (path) or on HOST:PORT (TCP) instead of stdin')
+    # Optional integer argument: pending requests of the service mode
+    parser.add_argument('--max-pending', type=int, default=server.MAX_PENDING,
+                        help=f"Service mode: maximal number of requests being fitted or queued; "
+                             f"further requests wait. Default: {server.MAX_PENDING}")
+    # Optional integer argument: connections of the service mode
+    parser.add_argument('--max-connections', type=int, default=server.MAX_CONNECTIONS,
+                        help=f"Service mode: maximal number of socket connections. Default: {server.MAX_CONNECTIONS}")
     return parser.parse_args()
 
-def generate_curve(method, params_opt, t_obs):
-    t_min = min(t_obs)
-    t_max = max(t_obs)
-    t_array = np.linspace(t_min, t_max, 10000)
+# The plotted model curve is sampled adaptively: CURVE_POINTS evenly spaced
+# points over the parabolic (flat) part [C4, C5] and the extremum itself,
+# WING_POINTS points on a curved wing (WSAP, WSL), denser near the
+# breakpoint, and only the ends of the straight lines (the AP wings, A).
+CURVE_POINTS = 201
+WING_POINTS = 100
+
+def model_at_points(method, params_opt, t_obs):
+    # The model at the observed times (the residuals, sigma, AIC/BIC)
+    if method not in ila.METHODS:
+        raise Exception(f"Unsupported method: {method}")
+    return ila._model(method)(t_obs, *params_opt)
+
+def curve_times(method, params_opt, t_min, t_max):
+    # Times of the plotted curve over [t_min, t_max] (see CURVE_POINTS)
+    if method not in ila.METHODS:
+        raise Exception(f"Unsupported method: {method}")
+    C4 = min(max(params_opt[3], t_min), t_max)
+    if method == "A":
+        return np.unique([t_min, C4, t_max])
+    C5 = min(max(params_opt[4], C4), t_max)
+    parts = [np.linspace(C4, C5, CURVE_POINTS)]
     if method == "AP":
-        C1, C2, C3, C4, C5 = params_opt
-        y_array_fit = ila.f_AP_a(t_array, C1, C2, C3, C4, C5)
-        y_array_fit_at_points = ila.f_AP_a(t_obs, C1, C2, C3, C4, C5)
-    elif method == "WSAPA":
-        C1, C2, C3, C4, C5, C6, C7 = params_opt
-        y_array_fit = ila.f_WSAPA_a(t_array, C1, C2, C3, C4, C5, C6, C7)
-        y_array_fit_at_points = ila.f_WSAPA_a(t_obs, C1, C2, C3, C4, C5, C6, C7)
-    elif method == "WSAP":
-        C1, C2, C3, C4, C5 = params_opt
-        y_array_fit = ila.f_WSAP_a(t_array, C1, C2, C3, C4, C5)
-        y_array_fit_at_points = ila.f_WSAP_a(t_obs, C1, C2, C3, C4, C5)
-    elif method == "WSL":
-        C1, C2, C3, C4, C5 = params_opt
-        y_array_fit = ila.f_WSL_a(t_array, C1, C2, C3, C4, C5)
-        y_array_fit_at_points = ila.f_WSL_a(t_obs, C1, C2, C3, C4, C5)
-    elif method == "A":
-       C1, C2, C3, C4 = params_opt
-       C5 = None
-       y_array_fit = ila.f_A_a(t_array, C1, C2, C3, C4)
-       y_array_fit_at_points = ila.f_A_a(t_obs, C1, C2, C3, C4)
+        parts.append([t_min, t_max])
+        C1, C2, C3 = params_opt[:3]
+        if C2 != 0.0:
+            time_of_extremum = (params_opt[3] + params_opt[4]) / 2.0 - C3 / C2 / 2.0
+            if C4 <= time_of_extremum <= C5:
+                parts.append([time_of_extremum])
     else:
-        raise Exception(f"Unsupported method: {method}")
-       
-    return t_array, y_array_fit, y_array_fit_at_points
+        u = np.linspace(0.0, 1.0, WING_POINTS) ** 2
+        parts.append(C4 - (C4 - t_min) * u)
+        parts.append(C5 + (t_max - C5) * u)
+    return np.unique(np.concatenate(parts))
 
+def model_curve(method, params_opt, t_obs):
+    # The plotted curve (times, values) over the range of t_obs
+    t_array = curve_times(method, params_opt, np.min(t_obs), np.max(t_obs))
+    return t_array, model_at_points(method, params_opt, t_array)
+
+def generate_curve(method, params_opt, t_obs):
+    # The plotted curve and the model at the observed times
+    t_array, y_array_fit = model_curve(method, params_opt, t_obs)
+    return t_array, y_array_fit, model_at_points(method, params_opt, t_obs)
 
 def plot_result(t_obs, m_obs, 
                 t_array, y_array_fit, 
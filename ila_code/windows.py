@@ -0,0 +1,102 @@
+import numpy as np
+
+# Windowing of a light curve sorted by time.
+# The points of a range [t_start, t_stop] form a contiguous slice
+# t_obs[lo:hi]; the bounds of all ranges are found at once with
+# np.searchsorted and the windows are handed out as views (no copies,
+# no per-range boolean masks).
+
+###############################################################################
+
+def window_bounds(t_obs, t_start, t_stop):
+    # Slice bounds of the points with t_start <= t <= t_stop
+    lo = np.searchsorted(t_obs, t_start, side='left')
+    hi = np.searchsorted(t_obs, t_stop, side='right')
+    return lo, np.maximum(hi, lo)
+
+def range_bounds(t_obs, t_start, t_stop):
+    t_start = np.asarray(t_start, dtype=np.float64)
+    t_stop = np.asarray(t_stop, dtype=np.float64)
+    return window_bounds(t_obs, t_start, t_stop)
+
+def snap_to_points(t_obs, lo, hi, t_start, t_stop, point1, point2):
+    # The times of range files written while the data files were parsed with
+    # pandas (not correctly rounded) may differ from the data as parsed now
+    # by one unit in the last place, so a point at the boundary of a range
+    # may fall on the other side of it. Such a bound is moved to the 1-based
+    # point index of the range file (as written by split_lc.py): only where
+    # it differs by one point whose time is within one unit in the last
+    # place of the range time. Returns the new bounds.
+    n = len(t_obs)
+    if n == 0:
+        return lo, hi
+    lo = lo.copy()
+    hi = hi.copy()
+    for bound, index, t_range in ((lo, np.asarray(point1, dtype=np.int64) - 1, t_start),
+                                  (hi, np.asarray(point2, dtype=np.int64), t_stop)):
+        # The point between the bound and the index of the file
+        point = np.minimum(bound, index)
+        candidate = (np.abs(bound - index) == 1) & (point >= 0) & (point < n)
+        t_range = np.asarray(t_range, dtype=np.float64)
+        t_point = t_obs[np.clip(point, 0, n - 1)]
+        snap = candidate & (np.abs(t_point - t_range) <= np.spacing(np.abs(t_range)))
+        bound[snap] = index[snap]
+    return lo, np.maximum(hi, lo)
+
+def point_index_mismatch(lo, hi, point1, point2):
+    # Ranges whose 1-based point indices (as written by split_lc.py) differ
+    # from the located slices, e.g. a range file made for another data file.
+    # Empty ranges are not written by split_lc.py and are not checked.
+    point1 = np.asarray(point1, dtype=np.int64)
+    point2 = np.asarray(point2, dtype=np.int64)
+    return (hi > lo) & ((point1 != lo + 1) | (point2 != hi))
+
+def iter_windows(lo, hi, *arrays):
+    # Yields tuples of views arrays[k][lo:hi] for every range
+    for i in range(len(lo)):
+        yield tuple(a[lo[i]:hi[i]] for a in arrays)
+
+###############################################################################
+
+def read_ranges(file_name):
+    # Range file (as written by split_lc.py): point1 time1 point2 time2 per line.
+    # Returns a dict of arrays.
+    data = np.loadtxt(file_name, comments='#', usecols=(0, 1, 2, 3), ndmin=2, dtype=np.float64)
+    return {'point1': data[:, 0].astype(np.int32), 'time1': data[:, 1].copy(),
+            'point2': data[:, 2].astype(np.int32), 'time2': data[:, 3].copy()}
+
+def phase_windows(t_obs, epoch, period, start_phase, stop_phase, min_points=1, min_coverage=0.0):
+    # Slice bounds of the windows [start_phase, stop_phase] of the cycles
+    # epoch + i * period covering the light curve (the ranges of split_lc.py).
+    # Only the cycles near the points are looked at, so gaps without data
+    # cost nothing: every point belongs to the windows of the cycles
+    # floor(phase - stop_phase) .. that + width (+-1 for rounding), and the
+    # exact bounds of these cycles are found at once with searchsorted.
+    # min_points: windows with fewer points are dropped;
+    # min_coverage: windows whose points span less than this fraction of
+    # the window length are dropped.
+    if period <= 0:
+        raise Exception("The period must be positive")
+    if len(t_obs) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    min_cycle = int(round((t_obs[0] - epoch) / period, 0))
+    max_cycle = int(round((t_obs[-1] - epoch) / period, 0))
+    base = np.floor((t_obs - epoch) / period - stop_phase).astype(np.int64)
+    # t_obs is sorted: so is base
+    base = base[np.concatenate(([True], base[1:] != base[:-1]))]
+    width = max(0, int(np.ceil(stop_phase - start_phase)))
+    cycles = np.unique((base[:, None] + np.arange(-1, width + 2)).ravel())
+    cycles = cycles[(cycles >= min_cycle) & (cycles <= max_cycle)]
+    t_start = epoch + cycles * period + start_phase * period
+    t_stop = epoch + cycles * period + stop_phase * period
+    lo, hi = range_bounds(t_obs, t_start, t_stop)
+    keep = hi - lo >= max(1, min_points)
+    lo, hi = lo[keep], hi[keep]
+    if min_coverage > 0:
+        keep = t_obs[hi - 1] - t_obs[lo] >= min_coverage * (stop_phase - start_phase) * period
+        lo, hi = lo[keep], hi[keep]
+    return lo, hi
+
+def range_lines(t_obs, lo, hi):
+    # Lines of a range file (point1 time1 point2 time2; 1-based point numbers)
+    return [f'{lo[i] + 1} {t_obs[lo[i]]} {hi[i]} {t_obs[hi[i] - 1]}' for i in range(len(lo))]
@@ -0,0 +1,125 @@
+###############################################################################
+
+DESCRIPTION = \
+"""
+I.L.A. approximations, survey mode -- Version 0.01 --
+
+Fits the light curves of many stars in one run: a manifest (CSV file with
+the columns file, method, ranges, epoch, period, start_phase, stop_phase;
+only file is required), or data files, directories and glob patterns with
+the common options below. Every star is fitted in its ranges: the range
+file, the ranges of epoch/period/phases (as split_lc.py makes them), or one
+range over the whole light curve. The results of all the stars are written
+to one table, the failed fits and files to the failure report.
+"""
+
+###############################################################################
+
+# Set to True to get better error info
+DEBUG = False
+
+# As in ila_ap.py
+MAXFEV = 100000
+
+###############################################################################
+
+import sys
+import argparse
+import numpy as np
+from ila_code import utils
+from ila_code import ila
+from ila_code import result_sink
+from ila_code import fit_cache
+from ila_code import survey
+from ila_code import resample
+
+###############################################################################
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=DESCRIPTION, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("inputs", type=str, nargs="+",
+                        help="Manifests (.csv), data files, directories or glob patterns")
+    parser.add_argument("--pattern", type=str, default="*.dat",
+                        help="Data files of the directories given as inputs. Default: *.dat")
+    parser.add_argument('--method', type=utils.method_type, default="AP",
+                        help="Method of the stars without the method column: AP, WSAP, WSL, A, "
+                             "a comma-separated list of them or auto (all of them). Default: AP")
+    parser.add_argument('--select', type=str.lower, choices=("sigma", "aic", "bic"), default="aic",
+                        help="Criterion used to select the best of several methods: sigma, aic or bic. Default: aic")
+    parser.add_argument("--epoch", type=np.float64, help="Initial Epoch of the stars without ranges")
+    parser.add_argument("--period", type=np.float64, help="Period of the stars without ranges")
+    parser.add_argument("--start-phase", type=np.float64, help="Start phase of the stars without ranges")
+    parser.add_argument("--stop-phase", type=np.float64, help="Stop phase of the stars without ranges")
+    parser.add_argument('--result', type=str, default="survey.tsv",
+                        help='Table of the results of all the stars. Default: survey.tsv')
+    parser.add_argument('--result-format', type=str.lower, choices=result_sink.RESULT_FORMATS[2:] + ("auto",),
+                        default="auto",
+                        help="Format of the table: tsv, csv, jsonl or parquet (requires pyarrow). "
+                             "auto: by the file extension. Default: auto")
+    parser.add_argument('--failures', type=str, default=None,
+                        help='Failure report (tab-separated). Default: RESULT_failures.tsv')
+    parser.add_argument('--jobs', type=int, default=1,
+                        help='Number of worker processes, each fitting one star at a time (0: one per CPU). Default: 1')
+    parser.add_argument('--solver', type=str.lower, choices=ila.SOLVERS + ("stacked",), default="lm",
+                        help="Solver: lm, varpro or stacked (see ila_ap.py). Default: lm")
+    parser.add_argument('--maxfev', type=int, default=MAXFEV,
+                        help=f"Maximal number of function evaluations per fit. Default: {MAXFEV}")
+    parser.add_argument('--escalate', action='store_true', default=False,
+                        help='Fit in stages (see ila_ap.py)')
+    parser.add_argument('--time-budget', type=np.float64, default=None,
+                        help='Wall time limit of a fit, seconds')
+    parser.add_argument('--resample', type=str.lower, choices=resample.RESAMPLE_MODES, default=None,
+                        help='Percentile intervals of the extremum from resampled refits: bootstrap or montecarlo '
+                             '(see ila_ap.py)')
+    parser.add_argument('--resamples', type=int, default=resample.N_RESAMPLES,
+                        help=f"With --resample: number of refits of every window. Default: {resample.N_RESAMPLES}")
+    parser.add_argument('--resample-seed', type=int, default=resample.SEED,
+                        help=f"With --resample: seed of the random numbers. Default: {resample.SEED}")
+    parser.add_argument('--no-cache', action='store_true', default=False,
+                        help='Do not use (or create) the binary cache of the input files')
+    parser.add_argument('--fit-cache', action='store_true', default=False,
+                        help='Use (and update) the cache of fit results')
+    parser.add_argument('--no-fit-cache', action='store_true', default=False,
+                        help='Do not use the cache of fit results (the default; overrides --fit-cache)')
+    parser.add_argument('--fit-cache-dir', type=str, default=None,
+                        help='Directory of the fit cache. Default: $ILA_FIT_CACHE or ~/.cache/lc_approx/fits')
+    parser.add_argument('--fit-cache-size', type=float, default=fit_cache.MAX_BYTES / (1024 * 1024),
+                        help=f"Maximal size of the fit cache, MB. Default: {fit_cache.MAX_BYTES // (1024 * 1024)}")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    utils.init_console()
+    if args.method == "0":
+        raise Exception("Method 0 is not applicable in this context")
+    defaults = {'method': args.method}
+    split = [args.epoch, args.period, args.start_phase, args.stop_phase]
+    if any(v is not None for v in split):
+        if any(v is None for v in split):
+            raise Exception("--epoch, --period, --start-phase and --stop-phase must be given together")
+        defaults.update(zip(survey.SPLIT_KEYS, (str(v) for v in split)))
+    resample_options = None
+    if args.resample is not None:
+        if args.resamples < 2:
+            raise Exception("The number of resamples must be at least 2")
+        resample_options = (args.resample, args.resamples, args.resample_seed)
+    stars = survey.survey_stars(args.inputs, defaults, args.pattern)
+    print(f"Survey: {len(stars)} file(s)")
+    if not args.fit_cache or args.no_fit_cache:
+        fit_cache_options = None
+    else:
+        fit_cache_options = (args.fit_cache_dir, int(args.fit_cache_size * 1024 * 1024))
+    survey.run_survey(stars, args.result, args.failures, args.result_format, args.jobs, args.maxfev,
+                      args.solver, args.escalate, args.time_budget, args.select, not args.no_cache,
+                      fit_cache_options, resample_options)
+
+if __name__ == "__main__":
+    if DEBUG:
+        main()
+    else:
+        try:
+            main()
+        except Exception as e:
+            print(f"Fatal Error: {e}")
+        finally:
+            sys.exit()
@@ -0,0 +1,25 @@
+import argparse
+from ila_code import lightcurve
+
+# Builds (or removes) the binary cache of light curve files ahead of time,
+# so that ila_ap.py and split_lc.py do not have to parse the text files.
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Light Curve Cache Builder")
+    parser.add_argument("filenames", type=str, nargs="+", help="Paths to the input data files")
+    parser.add_argument("--clear", action="store_true", default=False,
+                        help="Remove the cache files instead of building them")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    for file_name in args.filenames:
+        if args.clear:
+            if lightcurve.clear_cache(file_name):
+                print(f"{file_name}: cache removed")
+            continue
+        t_obs, m_obs, err_obs = lightcurve.build_cache(file_name)
+        print(f"{file_name}: {len(t_obs)} points cached in {lightcurve.cache_paths(file_name)[0]}")
+
+if __name__ == "__main__":
+    main()
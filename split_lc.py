@@ -1,9 +1,9 @@
 import argparse
-import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import io
-import base64
+from ila_code import lightcurve
+from ila_code import windows
+from ila_code import preview
+from ila_code import preview_html
 #import sys
 
 def parse_args():
@@ -15,81 +15,46 @@ def parse_args():
     parser.add_argument("--period", type=np.float64, help="Period")
     parser.add_argument("--start-phase", type=np.float64, help="Start phase")
     parser.add_argument("--stop-phase", type=np.float64, help="Stop phase")
+    parser.add_argument("--no-cache", action="store_true", default=False,
+                        help="Do not use (or create) the binary cache of the input file")
+    parser.add_argument("--preview-mode", type=str.lower, choices=preview.PREVIEW_MODES, default="full",
+                        help="Preview images: full, thumbnail or none. Default: full")
+    parser.add_argument("--no-preview", action="store_true", default=False,
+                        help="Do not write the preview file")
+    parser.add_argument("--min-points", type=int, default=1,
+                        help="Skip the ranges with fewer points. Default: 1")
+    parser.add_argument("--min-coverage", type=np.float64, default=0.0,
+                        help="Skip the ranges whose points span less than this fraction of the range "
+                             "(stop phase - start phase). Default: 0")
     return parser.parse_args()
 
-args = parse_args()
-#print(vars(args))
-#sys.exit()
-
-data_file_name = args.filename
-output_file_name = args.output
-preview_file_name = args.preview
-epoch = args.epoch
-period = args.period
-start_phase = args.start_phase
-stop_phase = args.stop_phase
-
-data = pd.read_csv(data_file_name, 
-                   comment='#', skip_blank_lines=True,
-                   sep="\\s+",
-                   names=['time', 'mag'],
-                   dtype={'time': 'float64', 'mag': 'float64'},
-                   usecols=['time', 'mag'])
-
-times = data['time']
-mags  = data['mag']
-
-# Sort by times (just in case)
-times, mags = zip(*sorted(zip(times, mags)))
-times = np.array(times)
-mags = np.array(mags)
-
-min_time = np.min(times)
-max_time = np.max(times)
-
-min_cycle = int(round((min_time-epoch)/period, 0))
-max_cycle = int(round((max_time-epoch)/period, 0))
-
-with open(preview_file_name, "w") as f_preview:
-    f_preview.write("<html><body>\n")
-    f_preview.write("<h2>Preview</h2>\n")
-    f_preview.write("<hr>\n")
-
-n = 0
-with open(output_file_name, "w") as f:
-    for i in range(min_cycle, max_cycle + 1):
-        t_start = epoch + i * period + start_phase * period
-        t_stop  = epoch + i * period + stop_phase  * period
-        mask = (times >= t_start) & (times <= t_stop)
-        idx = np.where(mask)[0]
-        #f.write(f'{idx}\n')
-        info_str = ''
-        if len(idx) > 0:
-            n += 1
-            info_str = f'{idx[0] + 1} {times[idx[0]]} {idx[-1] + 1} {times[idx[-1]]}'
-            print(info_str)
-            f.write(info_str + "\n")
-            f.flush()
-
-            time_subset = times[mask]
-            mag_subset  = mags[mask]
-            fig, ax = plt.subplots()
-            ax.scatter(time_subset, mag_subset)
-            ax.invert_yaxis()
-            # Save figure to buffer
-            buf = io.BytesIO()
-            fig.savefig(buf, format='png', bbox_inches='tight')
-            buf.seek(0)
-            encoded = base64.b64encode(buf.read()).decode('utf-8')
-            buf.close()
-            plt.close(fig)
-            with open(preview_file_name, "a") as f_preview:
-                f_preview.write(f"<p>[{n}] {info_str}</p>\n")
-                f_preview.write(f"<img src='data:image/png;base64,{encoded}'><br><br>\n")
-                f_preview.write("<hr>\n")
-                f_preview.flush()
-
-with open(preview_file_name, "a") as f_preview:
-    f_preview.write("<p>End of file</p>\n")
-    f_preview.write("\n</body></html>")                
-        
\ No newline at end of file
+def split(data_file_name, output_file_name, preview_file_name, epoch, period, start_phase, stop_phase,
+          use_cache=True, preview_mode="full", min_points=1, min_coverage=0.0):
+    times, mags, errs = lightcurve.load_light_curve(data_file_name, use_cache)
+
+    lo, hi = windows.phase_windows(times, epoch, period, start_phase, stop_phase, min_points, min_coverage)
+    lines = windows.range_lines(times, lo, hi)
+    with open(output_file_name, "w") as f:
+        f.write("".join(line + "\n" for line in lines))
+    print("\n".join(lines))
+    print(f"{len(lines)} range(s)")
+
+    if preview_file_name is None:
+        return
+    with preview_html.PreviewWriter(preview_file_name) as writer:
+        for n, (time_subset, mag_subset) in enumerate(windows.iter_windows(lo, hi, times, mags), 1):
+            image = preview.render(preview_mode, True,
+                                   time_subset, mag_subset,
+                                   None, None, None, None, None, None, None, None, None)
+            writer.add(f"[{n}] {lines[n - 1]}", image)
+
+def main():
+    args = parse_args()
+    #print(vars(args))
+    #sys.exit()
+    split(args.filename, args.output, None if args.no_preview else args.preview,
+          args.epoch, args.period, args.start_phase, args.stop_phase,
+          not args.no_cache, args.preview_mode, args.min_points, args.min_coverage)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,4 @@
+@echo off
+
+ila_survey.py test_data\survey.csv --result approx_output\survey.tsv --jobs 0
+pause
@@ -0,0 +1,6 @@
+#!/bin/bash
+
+python3 ila_survey.py \
+    test_data/survey.csv \
+    --result "approx_output/survey.tsv" \
+    --jobs 0
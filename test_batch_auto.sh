@@ -0,0 +1,9 @@
+#!/bin/bash
+
+python3 ila_ap.py \
+    --method=auto \
+    --select=aic \
+    --ranges="test_data/lc_split.!" \
+    test_data/test_lc.tsv \
+    --result "approx_output/auto-approx.txt" \
+    --preview "approx_output/auto-approx.html"
@@ -0,0 +1,8 @@
+#!/bin/bash
+
+python3 ila_ap.py \
+    --method=WSL \
+    --detect --detect-kind min --detect-width 30 \
+    test_data/test_lc.tsv \
+    --result "approx_output/detect-approx.txt" \
+    --preview "approx_output/detect-approx.html"
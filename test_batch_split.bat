@@ -0,0 +1,9 @@
+@echo off
+
+SET PERIOD=0.40903915
+SET EPOCH=2460030.023
+SET START_PHASE=-0.2
+SET STOP_PHASE=0.2
+
+ila_ap.py --method=WSL --epoch %EPOCH% --period %PERIOD% --start-phase %START_PHASE% --stop-phase %STOP_PHASE% test_data\test_lc.tsv --result approx_output\split-approx.txt --preview approx_output\split-approx.html
+pause
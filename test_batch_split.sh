@@ -0,0 +1,13 @@
+#!/bin/bash
+
+_PERIOD=0.40903915
+_EPOCH=2460030.023
+_START_PHASE=-0.2
+_STOP_PHASE=0.2
+
+python3 ila_ap.py \
+    --method=WSL \
+    --epoch $_EPOCH --period $_PERIOD --start-phase $_START_PHASE --stop-phase $_STOP_PHASE \
+    test_data/test_lc.tsv \
+    --result "approx_output/split-approx.txt" \
+    --preview "approx_output/split-approx.html"